@@ -4,13 +4,14 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import List, Optional
 import json
 import uuid
 from datetime import datetime
 
 from app.database import get_db
 from app.models.chat import Conversation, Message
+from app.models.document import Document as DBDocument
 from app.schemas.chat import (
     ChatRequest,
     ConversationCreate,
@@ -75,6 +76,9 @@ async def stream_chat(
     conversation.message_count += 1
     db.commit()
 
+    # 别名文档没有自己的切片，检索范围替换为其原文档
+    document_ids = _resolve_aliases(db, request.document_ids)
+
     # 3. 流式响应函数
     async def event_stream():
         nonlocal citations_data, full_response
@@ -84,7 +88,7 @@ async def stream_chat(
             async for event in rag_agent.stream_chat(
                 question=request.message,
                 conversation_id=conversation_id,
-                document_ids=request.document_ids,
+                document_ids=document_ids,
                 top_k=request.rag_config.get('top_k', settings.RETRIEVAL_TOP_K)
             ):
                 # 记录引用信息
@@ -132,6 +136,20 @@ async def stream_chat(
     )
 
 
+def _resolve_aliases(db: Session, document_ids: Optional[List[uuid.UUID]]) -> Optional[List[uuid.UUID]]:
+    """将检索范围中的别名文档 ID 替换为原文档 ID"""
+    if not document_ids:
+        return document_ids
+
+    aliases = dict(db.query(DBDocument.id, DBDocument.alias_of).filter(
+        DBDocument.id.in_(document_ids),
+        DBDocument.alias_of.isnot(None)
+    ).all())
+    if not aliases:
+        return document_ids
+    return list(dict.fromkeys(aliases.get(document_id, document_id) for document_id in document_ids))
+
+
 @router.post("/conversations", response_model=ConversationSchema, status_code=201)
 async def create_conversation(
     request: ConversationCreate,
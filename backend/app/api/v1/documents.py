@@ -1,16 +1,20 @@
 """
 文档管理 API
 """
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional, Tuple
 from pathlib import Path
-import shutil
+import json
 import uuid
 from datetime import datetime
 
-from app.database import get_db
+from app.database import SessionLocal, get_db
 from app.models.document import Document as DBDocument
+from app.models.ingestion_job import IngestionBatch
 from app.schemas.document import (
     DocumentUploadResponse,
     DocumentList,
@@ -18,91 +22,363 @@ from app.schemas.document import (
     DocumentStatus,
     DocumentParsePreview,
     ParsedSegment,
-    ManualDocumentCreate
+    ManualDocumentCreate,
+    BatchImportRequest,
+    BatchUploadResponse,
+    BatchStatus
 )
 from app.services.document_processor import document_processor
+from app.services.dedup import alias_values, duplicate_action, owns_content
 from app.services.milvus_store import milvus_store
+from app.services.hybrid_retriever import hybrid_retriever
+from app.services.bm25_index import pack_term_hashes
+from app.services.chunk_writer import chunk_row, write_chunks
+from app.services.ingestion_queue import enqueue_job, ingestion_workers
+from app.services.progress_bus import is_terminal, progress_bus
+from app.services.upload_receiver import ReceivedFile, UploadRejected, copy_file, receive_uploads
 from app.config import settings
 
 router = APIRouter()
 
 
-@router.post("/upload", response_model=DocumentUploadResponse, status_code=201)
+def _multipart_body(field: str, multiple: bool = False) -> Dict:
+    """流式接收的上传接口不声明 File 参数，在 OpenAPI 中补充请求体说明"""
+    schema = {"type": "string", "format": "binary"}
+    if multiple:
+        schema = {"type": "array", "items": schema}
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {"type": "object", "required": [field], "properties": {field: schema}}
+                }
+            }
+        }
+    }
+
+
+async def _receive_file(request: Request, directory: Path, **options) -> ReceivedFile:
+    """流式接收单个上传文件（字段 file），被拒绝时转换为对应的 HTTP 错误"""
+    try:
+        files, _ = await receive_uploads(request, directory, "file", max_files=1, **options)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+
+    if not files:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    return files[0]
+
+
+@router.post(
+    "/upload", response_model=DocumentUploadResponse, status_code=201,
+    openapi_extra=_multipart_body("file")
+)
 async def upload_document(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
+    request: Request,
+    response: Response,
+    on_duplicate: Literal["return", "alias", "reingest"] = "return",
     db: Session = Depends(get_db)
 ):
     """
     上传文档
 
     流程：
-    1. 验证文件类型和大小
-    2. 保存文件到本地
-    3. 创建数据库记录
-    4. 后台异步处理文档（解析、切片、向量化）
+    1. 流式接收并保存文件：同一遍内校验类型与大小（超限立即中止）、计算 sha256
+    2. 内容已存在时按 on_duplicate 处理，不再入库：
+       - return：直接返回已有文档（200）
+       - alias：以新文件名创建别名文档，共用已有文档的切片与向量
+       - reingest：忽略重复，照常入库
+    3. 创建数据库记录与入库任务（同一事务）
+    4. 由 worker 池认领任务处理文档（解析、切片、向量化）
     """
 
-    # 1. 验证文件类型
-    file_ext = Path(file.filename).suffix.lower()
-    if file_ext not in settings.ALLOWED_EXTENSIONS:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unsupported file type. Allowed: {settings.ALLOWED_EXTENSIONS}"
+    # 1. 流式接收并保存文件
+    upload = await _receive_file(request, Path(settings.UPLOAD_DIR))
+    file_id, file_path, content_hash = upload.id, upload.path, upload.content_hash
+
+    # 2. 重复内容检测
+    existing = _find_duplicate(db, content_hash) if on_duplicate != "reingest" else None
+    action = duplicate_action(on_duplicate, existing)
+    if action != "ingest":
+        _remove_files([file_path])
+        if action == "return":
+            print(f"♻️  Duplicate upload of {existing.id} returned as is")
+            response.status_code = 200
+            return existing
+
+        alias = DBDocument(
+            id=file_id,
+            filename=upload.filename,
+            file_type=upload.file_type,
+            file_size=upload.size,
+            content_hash=content_hash,
+            metadata={},
+            **alias_values(existing)
         )
+        db.add(alias)
+        db.commit()
+        db.refresh(alias)
+        print(f"♻️  Duplicate upload aliased to {existing.id}")
+        return alias
 
-    # 2. 验证文件大小
-    file.file.seek(0, 2)  # 移动到文件末尾
-    file_size = file.file.tell()
-    file.file.seek(0)  # 重置到开头
-
-    if file_size > settings.MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large. Max size: {settings.MAX_FILE_SIZE / 1024 / 1024}MB"
-        )
-
-    # 3. 保存文件
-    upload_dir = Path(settings.UPLOAD_DIR)
-    upload_dir.mkdir(parents=True, exist_ok=True)
-
-    # 生成唯一文件名
-    file_id = uuid.uuid4()
-    file_path = upload_dir / f"{file_id}{file_ext}"
-
-    try:
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
-
-    # 4. 创建数据库记录
+    # 3. 创建数据库记录与入库任务
     db_document = DBDocument(
         id=file_id,
-        filename=file.filename,
-        file_type=file_ext.lstrip('.'),
-        file_size=file_size,
+        filename=upload.filename,
+        file_type=upload.file_type,
+        file_size=upload.size,
         file_path=str(file_path),
         status='pending',
         processing_progress=0,
+        content_hash=content_hash,
         metadata={}
     )
 
     db.add(db_document)
+    db.flush()
+    enqueue_job(db, file_id, file_path, priority="interactive")
     db.commit()
     db.refresh(db_document)
 
-    # 5. 后台处理文档
-    background_tasks.add_task(
-        document_processor.process_document,
-        file_path,
-        file_id,
-        db
-    )
+    # 4. 唤醒本进程内的 worker（独立 worker 进程通过轮询认领）
+    ingestion_workers.notify()
 
     return db_document
 
 
+@router.post(
+    "/batch", response_model=BatchUploadResponse, status_code=201,
+    openapi_extra=_multipart_body("files", multiple=True)
+)
+async def upload_documents_batch(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    批量上传文档
+
+    文件流式接收（与单文件上传相同）；所有文档记录与入库任务在同一事务中创建（bulk 优先级，不抢占交互式上传）；
+    worker 按批次认领，多个文档共用 embedding 批次，每组只发布一次 BM25 增量。
+    类型、大小或内容不符的文件记入 rejected（跳过其剩余数据），不影响其余文件。
+    """
+    try:
+        files, rejections = await receive_uploads(
+            request, Path(settings.UPLOAD_DIR), "files", abort_on_reject=False
+        )
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+
+    accepted = [(f.id, f.filename, f.size, f.path, f.content_hash) for f in files]
+    rejected = [{"filename": e.filename, "reason": e.detail} for e in rejections]
+
+    return _create_batch(db, "upload", accepted, rejected)
+
+
+@router.post("/batch/import", response_model=BatchUploadResponse, status_code=201)
+def import_documents_batch(
+    request: BatchImportRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    从服务器本地目录或文件清单批量导入
+
+    仅允许 INGEST_IMPORT_ROOT 之下的路径；文件复制到 UPLOAD_DIR 后入队（删除文档时不影响源文件）。
+    目录遍历与复制是阻塞操作，接口为同步函数，由 FastAPI 在线程池中执行，不阻塞事件循环。
+    """
+    if not settings.INGEST_IMPORT_ROOT:
+        raise HTTPException(status_code=403, detail="Server-side import is disabled")
+    if not request.directory and not request.paths:
+        raise HTTPException(status_code=400, detail="Either directory or paths is required")
+
+    import_root = Path(settings.INGEST_IMPORT_ROOT).resolve()
+
+    def resolve(path: str) -> Path:
+        resolved = (import_root / path).resolve()
+        if resolved != import_root and import_root not in resolved.parents:
+            raise HTTPException(status_code=400, detail=f"Path outside import root: {path}")
+        return resolved
+
+    if request.directory:
+        directory = resolve(request.directory)
+        if not directory.is_dir():
+            raise HTTPException(status_code=404, detail=f"Directory not found: {request.directory}")
+        pattern = "**/*" if request.recursive else "*"
+        candidates = sorted(path for path in directory.glob(pattern) if path.is_file())
+        source = "directory"
+    else:
+        candidates = [resolve(path) for path in request.paths]
+        source = "manifest"
+
+    upload_dir = Path(settings.UPLOAD_DIR)
+
+    accepted: List[Tuple[uuid.UUID, str, int, Path, str]] = []
+    rejected: List[Dict[str, str]] = []
+
+    try:
+        for path in candidates:
+            name = str(path.relative_to(import_root))
+            file_ext = path.suffix.lower()
+            if file_ext not in settings.ALLOWED_EXTENSIONS:
+                # 目录导入时静默跳过其它类型的文件，清单中显式列出的才记为拒绝
+                if source == "manifest":
+                    rejected.append({"filename": name, "reason": "Unsupported file type"})
+                continue
+            if not path.is_file():
+                rejected.append({"filename": name, "reason": "File not found"})
+                continue
+
+            file_size = path.stat().st_size
+            if file_size > settings.MAX_FILE_SIZE:
+                rejected.append({"filename": name, "reason": "File too large"})
+                continue
+
+            try:
+                copied = copy_file(path, upload_dir)
+            except UploadRejected as e:
+                rejected.append({"filename": name, "reason": e.detail})
+                continue
+            accepted.append((copied.id, copied.filename, copied.size, copied.path, copied.content_hash))
+    except Exception as e:
+        _remove_files(path for _, _, _, path, _ in accepted)
+        raise HTTPException(status_code=500, detail=f"Failed to copy file: {str(e)}")
+
+    return _create_batch(db, source, accepted, rejected)
+
+
+@router.get("/batches/{batch_id}", response_model=BatchStatus)
+async def get_batch_status(
+    batch_id: uuid.UUID,
+    db: Session = Depends(get_db)
+):
+    """
+    获取批量入库的聚合状态（用于轮询）
+
+    进度按文档的 processing_progress 平均，失败文档计为已结束。
+    """
+    batch = db.query(IngestionBatch).filter(IngestionBatch.id == batch_id).first()
+
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    rows = db.query(
+        DBDocument.status,
+        func.count(DBDocument.id),
+        func.coalesce(func.sum(DBDocument.processing_progress), 0),
+        func.coalesce(func.sum(DBDocument.chunk_count), 0),
+        func.coalesce(func.sum(DBDocument.total_characters), 0)
+    ).filter(DBDocument.batch_id == batch_id).group_by(DBDocument.status).all()
+
+    status_counts: Dict[str, int] = {}
+    progress_sum = chunk_count = total_characters = 0
+    for status, count, progress, chunks, characters in rows:
+        status_counts[status] = count
+        progress_sum += 100 * count if status in ('completed', 'failed') else progress
+        chunk_count += chunks
+        total_characters += characters
+
+    total = batch.total_documents
+    finished = status_counts.get('completed', 0) + status_counts.get('failed', 0)
+    if finished < total:
+        status = 'pending' if status_counts.get('pending', 0) == total else 'processing'
+    elif status_counts.get('failed', 0):
+        status = 'failed' if status_counts.get('completed', 0) == 0 else 'partial'
+    else:
+        status = 'completed'
+
+    failed = db.query(DBDocument).filter(
+        DBDocument.batch_id == batch_id,
+        DBDocument.status == 'failed'
+    ).order_by(DBDocument.created_at).limit(100).all()
+
+    return {
+        "batch_id": batch.id,
+        "source": batch.source,
+        "status": status,
+        "total_documents": total,
+        "status_counts": status_counts,
+        "processing_progress": int(progress_sum / total) if total else 100,
+        "chunk_count": chunk_count,
+        "total_characters": total_characters,
+        "created_at": batch.created_at,
+        "failed": failed,
+        "rejected": batch.rejected or []
+    }
+
+
+def _create_batch(
+    db: Session,
+    source: str,
+    accepted: List[Tuple[uuid.UUID, str, int, Path, str]],
+    rejected: List[Dict[str, str]]
+) -> dict:
+    """在同一事务中创建批次、文档记录与 bulk 入库任务"""
+    if not accepted:
+        raise HTTPException(status_code=400, detail={"message": "No acceptable files", "rejected": rejected})
+
+    batch = IngestionBatch(id=uuid.uuid4(), source=source, total_documents=len(accepted), rejected=rejected)
+    documents = [
+        DBDocument(
+            id=file_id,
+            filename=filename,
+            file_type=file_path.suffix.lower().lstrip('.'),
+            file_size=file_size,
+            file_path=str(file_path),
+            status='pending',
+            processing_progress=0,
+            content_hash=content_hash,
+            metadata={},
+            batch_id=batch.id
+        )
+        for file_id, filename, file_size, file_path, content_hash in accepted
+    ]
+
+    try:
+        db.add(batch)
+        db.add_all(documents)
+        db.flush()
+        for file_id, _, _, file_path, _ in accepted:
+            enqueue_job(db, file_id, file_path, priority="bulk", batch_id=batch.id)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        _remove_files(path for _, _, _, path, _ in accepted)
+        raise HTTPException(status_code=500, detail=f"Failed to create batch: {str(e)}")
+
+    ingestion_workers.notify()
+    print(f"📦 Batch {batch.id} queued: {len(accepted)} documents ({len(rejected)} rejected)")
+
+    return {
+        "batch_id": batch.id,
+        "source": source,
+        "total_documents": len(accepted),
+        "documents": documents,
+        "rejected": rejected
+    }
+
+
+def _find_duplicate(db: Session, content_hash: str) -> Optional[DBDocument]:
+    """查找内容相同、未失败的原文档（非别名），多个时取最早上传的"""
+    return db.query(DBDocument).filter(
+        DBDocument.content_hash == content_hash,
+        DBDocument.alias_of.is_(None),
+        DBDocument.status != 'failed'
+    ).order_by(DBDocument.created_at).first()
+
+
+def _remove_files(paths):
+    """清理已保存但未能入队的文件"""
+    for path in paths:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
 @router.get("/", response_model=DocumentList)
 async def list_documents(
     skip: int = 0,
@@ -174,6 +450,145 @@ async def get_document_status(
     }
 
 
+@router.get("/{document_id}/events")
+async def stream_document_progress(
+    document_id: uuid.UUID,
+    db: Session = Depends(get_db)
+):
+    """
+    文档处理进度流（SSE，替代轮询 /status）
+
+    先推送数据库中的状态，之后推送 progress_bus 上的细粒度进度（已解析页数、已向量化切片数等），
+    处理完成或最终失败后结束；worker 运行在独立进程时，进度经 progress_relay（LISTEN / NOTIFY）转发到本进程。
+    每 INGEST_PROGRESS_STREAM_TIMEOUT 秒没有推送时回查一次数据库（无变化时发送心跳），
+    转发未启用或连接中断时进度只在阶段切换时更新
+    """
+    document = db.query(DBDocument).filter(DBDocument.id == document_id).first()
+
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    # 别名文档的进度即其原文档的进度
+    target_id = document.alias_of or document.id
+    initial = _progress_snapshot(document)
+    # 之前处理留下的快照（如修订前的 completed）已过时，只订阅之后的推送
+    since_version = progress_bus.version(target_id)
+
+    def event(snapshot):
+        payload = {**snapshot, "document_id": str(document_id)}
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    async def event_stream():
+        last = initial
+        yield event(initial)
+        if is_terminal(initial):
+            return
+
+        async for snapshot in progress_bus.subscribe(
+            target_id, settings.INGEST_PROGRESS_STREAM_TIMEOUT, since_version
+        ):
+            if snapshot is None:
+                snapshot = await run_in_threadpool(_load_progress_snapshot, target_id)
+                if snapshot is None:
+                    # 文档已删除
+                    yield event({"status": "deleted"})
+                    return
+                if all(last.get(key) == value for key, value in snapshot.items()):
+                    yield ": keepalive\n\n"
+                    continue
+
+            last = snapshot
+            yield event(snapshot)
+            if is_terminal(snapshot):
+                return
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+def _progress_snapshot(document: DBDocument) -> Dict:
+    """数据库中的文档状态（failed 只在重试用尽后写入，视为终态）"""
+    return {
+        "status": document.status,
+        "current_stage": document.current_stage,
+        "processing_progress": document.processing_progress,
+        "chunk_count": document.chunk_count,
+        "error_message": document.error_message,
+        "final": document.status == "failed",
+    }
+
+
+def _load_progress_snapshot(document_id: uuid.UUID) -> Optional[Dict]:
+    """进度流回查数据库（请求级会话在流式响应开始前已关闭，这里使用独立会话）"""
+    db = SessionLocal()
+    try:
+        document = db.query(DBDocument).filter(DBDocument.id == document_id).first()
+        return _progress_snapshot(document) if document else None
+    finally:
+        db.close()
+
+
+@router.put(
+    "/{document_id}", response_model=DocumentUploadResponse, status_code=202,
+    openapi_extra=_multipart_body("file")
+)
+async def revise_document(
+    document_id: uuid.UUID,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """
+    修订文档（用新版本文件替换内容）
+
+    新文件重新解析、切片后与现有切片按内容哈希比对，只向量化、写入变化的切片，
+    未变化的切片保留原向量；处理期间检索仍使用旧版本。内容与当前版本相同时直接返回（200）。
+    """
+    document = db.query(DBDocument).filter(DBDocument.id == document_id).first()
+
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if document.alias_of is not None:
+        raise HTTPException(status_code=400, detail="Cannot revise an alias, revise the original document")
+    if document.file_path.startswith("manual://"):
+        raise HTTPException(status_code=400, detail="Documents created from manual chunks cannot be revised")
+    if document.status in ('pending', 'processing'):
+        raise HTTPException(status_code=409, detail="Document is still being processed")
+
+    # 扩展名须与文档一致
+    upload = await _receive_file(request, Path(settings.UPLOAD_DIR), extensions=[f".{document.file_type}"])
+    file_path, content_hash = upload.path, upload.content_hash
+
+    if content_hash == document.content_hash:
+        _remove_files([file_path])
+        response.status_code = 200
+        return document
+
+    # 修订失败时恢复到修订前的状态
+    previous_status = document.status
+    document.status = 'pending'
+    document.processing_progress = 0
+    document.current_stage = None
+    document.error_message = None
+    enqueue_job(
+        db, document_id, file_path, priority="interactive",
+        revise=True, content_hash=content_hash, previous_status=previous_status
+    )
+    db.commit()
+    db.refresh(document)
+
+    ingestion_workers.notify()
+
+    return document
+
+
 @router.delete("/{document_id}", status_code=204)
 async def delete_document(
     document_id: uuid.UUID,
@@ -187,6 +602,12 @@ async def delete_document(
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
 
+    # 别名文档没有自己的文件、切片与向量，只删除记录
+    if not owns_content(document):
+        db.delete(document)
+        db.commit()
+        return None
+
     # 1. 删除 Milvus 中的向量
     milvus_store.delete_by_document_id(document_id)
 
@@ -198,16 +619,20 @@ async def delete_document(
     except Exception as e:
         print(f"Warning: Failed to delete file: {str(e)}")
 
-    # 3. 删除数据库记录（级联删除 chunks）
+    # 3. 删除数据库记录（级联删除 chunks 与别名文档）
     db.delete(document)
     db.commit()
 
+    # 4. 从 BM25 索引中移除并发布给其它 worker（水位按删除后的数据库计算）
+    await run_in_threadpool(hybrid_retriever.remove_document, db, document_id)
+    progress_bus.discard(document_id)
+
     return None
 
 
 @router.post("/preview", response_model=DocumentParsePreview)
 async def preview_document(
-    file: UploadFile = File(...),
+    request: Request,
 ):
     """
     文档解析预览接口
@@ -215,38 +640,14 @@ async def preview_document(
     仅解析文档并返回结构化片段，不创建文档记录或入库。
     适用于前端根据解析结果自定义切片。
     """
-    # 验证文件类型
-    file_ext = Path(file.filename).suffix.lower()
-    if file_ext not in settings.ALLOWED_EXTENSIONS:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unsupported file type. Allowed: {settings.ALLOWED_EXTENSIONS}"
-        )
-
-    # 验证文件大小
-    file.file.seek(0, 2)
-    file_size = file.file.tell()
-    file.file.seek(0)
-
-    if file_size > settings.MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large. Max size: {settings.MAX_FILE_SIZE / 1024 / 1024}MB"
-        )
-
-    # 将文件保存到临时路径进行解析
-    upload_dir = Path(settings.UPLOAD_DIR) / "preview"
-    upload_dir.mkdir(parents=True, exist_ok=True)
-
-    temp_path = upload_dir / f"{uuid.uuid4()}{file_ext}"
+    # 流式接收到临时路径进行解析（同一遍内校验类型与大小）
+    upload = await _receive_file(request, Path(settings.UPLOAD_DIR) / "preview")
+    temp_path = upload.path
 
     try:
-        with temp_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
         from app.services.parsers import parser_factory
 
-        documents = parser_factory.parse(temp_path)
+        documents = await run_in_threadpool(parser_factory.parse, temp_path)
 
         segments: List[ParsedSegment] = []
         for idx, doc in enumerate(documents):
@@ -258,9 +659,9 @@ async def preview_document(
             ))
 
         return DocumentParsePreview(
-            filename=file.filename,
-            file_type=file_ext.lstrip('.'),
-            file_size=file_size,
+            filename=upload.filename,
+            file_type=upload.file_type,
+            file_size=upload.size,
             segments=segments
         )
     except Exception as e:
@@ -275,7 +676,7 @@ async def preview_document(
 
 
 @router.post("/manual", response_model=DocumentUploadResponse, status_code=201)
-async def create_document_with_manual_chunks(
+def create_document_with_manual_chunks(
     request: ManualDocumentCreate,
     db: Session = Depends(get_db)
 ):
@@ -286,8 +687,10 @@ async def create_document_with_manual_chunks(
     1. 创建文档记录（状态为 processing）
     2. 使用传入的 chunks 生成 Embeddings 并存入 Milvus
     3. 将 chunks 写入 PostgreSQL
-    4. 重建 BM25 索引
-    5. 更新文档状态为 completed
+    4. 更新文档状态为 completed
+    5. 增量更新 BM25 索引
+
+    向量化、COPY 写入与 BM25 更新都是阻塞调用，同步路由由 FastAPI 在线程池中执行，不阻塞事件循环
     """
     # 基本校验
     if not request.chunks:
@@ -320,6 +723,7 @@ async def create_document_with_manual_chunks(
     db.commit()
     db.refresh(db_document)
 
+    vector_ids: List[str] = []
     try:
         # 构建用于向量化的文档列表
         milvus_docs: List[dict] = []
@@ -343,16 +747,12 @@ async def create_document_with_manual_chunks(
                 "metadata": metadata
             })
 
-        # 生成 Embeddings 并写入 Milvus
-        from app.services.milvus_store import milvus_store as _milvus_store
+        # 生成 Embeddings 并写入 Milvus（中途失败时 add_documents 自行删除已写入的向量）
+        vector_ids = milvus_store.add_documents(milvus_docs, document_id)
 
-        vector_ids = _milvus_store.add_documents(milvus_docs, document_id)
-
-        # 写入 PostgreSQL 的 DocumentChunk
-        from app.models.document import DocumentChunk as DBDocumentChunk
-
-        for idx, (chunk, vector_id) in enumerate(zip(request.chunks, vector_ids)):
-            db_chunk = DBDocumentChunk(
+        # 写入 PostgreSQL 的 DocumentChunk（按批 COPY，不经 ORM 工作单元）
+        rows = [
+            chunk_row(
                 document_id=document_id,
                 chunk_index=idx,
                 content=chunk.content,
@@ -360,13 +760,16 @@ async def create_document_with_manual_chunks(
                 start_char=chunk.start_char,
                 end_char=chunk.end_char,
                 metadata=milvus_docs[idx]["metadata"],
-                vector_id=vector_id
+                vector_id=vector_id,
+                term_hashes=pack_term_hashes(chunk.content or "")
             )
-            db.add(db_chunk)
-
-        db.commit()
+            for idx, (chunk, vector_id) in enumerate(zip(request.chunks, vector_ids))
+        ]
+        batch_size = max(1, settings.MILVUS_INSERT_BATCH_SIZE)
+        for start in range(0, len(rows), batch_size):
+            write_chunks(db, rows[start:start + batch_size])
 
-        # 更新文档统计信息和状态
+        # 更新文档统计信息和状态（与切片在同一事务中提交）
         db_document.chunk_count = len(request.chunks)
         db_document.total_characters = total_characters
         db_document.status = 'completed'
@@ -375,12 +778,17 @@ async def create_document_with_manual_chunks(
         db.commit()
         db.refresh(db_document)
 
-        # 重建 BM25 索引
-        await document_processor._rebuild_bm25_index(db)
+        # 增量更新 BM25 索引
+        document_processor.update_bm25_index(db, document_id)
 
         return db_document
 
     except Exception as e:
+        # COPY 中途失败时事务处于中止状态：先回滚，再删除已写入的向量并标记失败
+        db.rollback()
+        if vector_ids:
+            milvus_store.delete_ids(vector_ids)
+        hybrid_retriever.invalidate_document(document_id)
         db_document.status = 'failed'
         db_document.processing_progress = 0
         db_document.current_stage = 'failed'
@@ -18,6 +18,8 @@ class Settings(BaseSettings):
     MILVUS_USER: str = ""
     MILVUS_PASSWORD: str = ""
     MILVUS_COLLECTION_NAME: str = "documents"
+    MILVUS_INSERT_BATCH_SIZE: int = 256  # 入库时每批 embed + insert 的切片数
+    MILVUS_FLUSH_INTERVAL: float = 10.0  # 写入后合并 flush 的延迟（秒），0 表示交给 Milvus 自动封存
 
     # LLM Provider (OpenAI-compatible)
     LLM_API_KEY: str = Field(
@@ -42,12 +44,23 @@ class Settings(BaseSettings):
     EMBEDDING_DEVICE: str = "cpu"
     EMBEDDING_API_KEY: str = ""
     EMBEDDING_API_BASE: str = ""
+    EMBEDDING_QUERY_BATCH_SIZE: int = 32  # 查询向量微批的最大批大小，1 表示不合并
+    EMBEDDING_QUERY_BATCH_WAIT_MS: float = 5.0  # 微批等待窗口（毫秒）
+    EMBEDDING_QUERY_CACHE_SIZE: int = 4096  # 进程内查询向量缓存条目数，0 表示禁用
+    EMBEDDING_CACHE_DIR: str = "./embedding_cache"  # 磁盘向量缓存目录（查询 + 入库切片，多 worker / 重启共享），为空表示禁用
+    EMBEDDING_CACHE_MAX_ROWS: int = 100000  # 磁盘查询向量缓存最多保留的行数（超出时按代轮转淘汰），0 表示不限
+    DOC_EMBEDDING_CACHE_MAX_ROWS: int = 500000  # 磁盘入库切片向量缓存最多保留的行数，0 表示不限
 
     # File Upload
     UPLOAD_DIR: str = "./uploads"
     MAX_FILE_SIZE: int = 50_000_000  # 50MB
     ALLOWED_EXTENSIONS: List[str] = [".pdf", ".txt", ".md"]
 
+    # PDF Parsing
+    PDF_PARSE_WORKERS: int = 0  # 大 PDF 并行解析的进程数，0 表示使用全部 CPU 核，1 表示串行
+    PDF_PARSE_MIN_PAGES: int = 200  # 页数达到该值时启用并行解析
+    PDF_PARSE_SLICE_PAGES: int = 32  # 每个解析任务提取的页数
+
     # MinerU
     MINERU_ENDPOINT: str = "http://localhost:8080"
 
@@ -69,6 +82,34 @@ class Settings(BaseSettings):
     RETRIEVAL_TOP_K: int = 5
     SIMILARITY_THRESHOLD: float = 0.7
 
+    # Ingestion
+    INGEST_QUEUE_SIZE: int = 4  # 流水线阶段间队列容量（页面 / 批次数）
+    INGEST_PROGRESS_INTERVAL: float = 0.5  # 处理进度推送间隔（秒），数据库只在阶段切换时写入
+    INGEST_PROGRESS_STREAM_TIMEOUT: float = 15.0  # 进度流无推送时回查数据库并发送心跳的间隔（秒）
+    INGEST_PROGRESS_RELAY: bool = True  # 经 PostgreSQL NOTIFY 在进程间转发处理进度（独立 worker 进程时进度流依赖此项）
+    INGEST_WORKERS_IN_API: bool = True  # 是否在 API 进程内运行入库 worker（否则由 python -m app.worker 独立运行）
+    INGEST_CONCURRENCY: int = 2  # 每个 worker 进程同时处理的任务数
+    INGEST_BULK_CONCURRENCY: int = 1  # 批量任务最多占用的槽位数，其余留给交互式上传
+    INGEST_BATCH_CLAIM_SIZE: int = 64  # 同一批次一次认领的任务数（共用 embedding 批次与一次 BM25 发布）
+    INGEST_IMPORT_ROOT: str = ""  # 允许批量导入的服务器本地目录，为空表示禁用目录 / 清单导入
+    INGEST_MAX_ATTEMPTS: int = 3  # 单个任务最多执行次数
+    INGEST_RETRY_BACKOFF: float = 30.0  # 首次重试延迟（秒），之后指数增长
+    INGEST_POLL_INTERVAL: float = 2.0  # 空闲时轮询任务表的间隔（秒）
+    INGEST_JOB_HEARTBEAT: float = 30.0  # 运行中任务的心跳间隔（秒）
+    INGEST_JOB_STALE_AFTER: float = 300.0  # 心跳超时后任务可被重新认领（秒）
+    INGEST_SHUTDOWN_TIMEOUT: float = 30.0  # 关闭时等待进行中任务的时间（秒）
+
+    # BM25 Index
+    BM25_INDEX_DIR: str = "./bm25_index"
+    BM25_USER_DICT: str = ""  # jieba 自定义词典路径，内容变化会触发重新分词
+    BM25_BUILD_WORKERS: int = 0  # 全量重建时的分词进程数，0 表示使用全部 CPU 核
+    BM25_SYNC_INTERVAL: float = 1.0  # 多 worker 间同步共享索引的轮询间隔（秒）
+    BM25_PRUNE_MIN_POSTINGS: int = 50000  # 查询 postings 达到该值时启用 MaxScore 剪枝，0 表示禁用
+
+    # Retrieval Cache
+    RETRIEVAL_CACHE_SIZE: int = 1024  # 检索结果缓存条目数，0 表示禁用
+    RETRIEVAL_CACHE_TTL: float = 300.0  # 缓存有效期（秒），0 表示不过期
+
     class Config:
         env_file = ".env"
         case_sensitive = True
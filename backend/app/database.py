@@ -1,7 +1,7 @@
 """
 数据库配置和会话管理
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
@@ -29,3 +29,28 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# 已存在的表新增列（create_all 只创建缺失的表，不会修改已有表结构）
+SCHEMA_UPGRADES = [
+    "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS term_hashes BYTEA",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS batch_id UUID",
+    "CREATE INDEX IF NOT EXISTS ix_documents_batch_id ON documents (batch_id)",
+    "ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS batch_id UUID",
+    "CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_batch_id ON ingestion_jobs (batch_id)",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS text_hash VARCHAR(64)",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS alias_of UUID REFERENCES documents (id) ON DELETE CASCADE",
+    "CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents (content_hash)",
+    "CREATE INDEX IF NOT EXISTS ix_documents_text_hash ON documents (text_hash)",
+    "CREATE INDEX IF NOT EXISTS ix_documents_alias_of ON documents (alias_of)",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS revision INTEGER DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS ix_document_chunks_vector_id ON document_chunks (vector_id)",
+]
+
+
+def upgrade_schema():
+    """幂等地补齐新增列"""
+    with engine.begin() as conn:
+        for statement in SCHEMA_UPGRADES:
+            conn.execute(text(statement))
@@ -6,7 +6,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from app.config import settings
-from app.database import engine, Base
+from app.database import engine, Base, get_db, upgrade_schema
 from app.api.v1 import router as api_v1_router
 
 
@@ -18,32 +18,68 @@ async def lifespan(app: FastAPI):
     print("🚀 Starting MimirQ backend...")
     print("📦 Creating database tables...")
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
     print("✅ Database initialized")
 
     # 初始化 BM25 索引
     print("🔍 Initializing BM25 index...")
     try:
         from app.services.hybrid_retriever import hybrid_retriever
-        from app.models.document import DocumentChunk, Document as DBDocument
 
         db = next(get_db())
-        all_chunks = db.query(DocumentChunk).join(DBDocument).filter(
-            DBDocument.status == 'completed'
-        ).all()
-
-        if all_chunks:
-            hybrid_retriever.build_bm25_index(all_chunks)
-            print(f"✅ BM25 index loaded with {len(all_chunks)} chunks")
-        else:
-            print("⚠️  No documents found, BM25 index will be built on first upload")
+        try:
+            # 共享索引水位与数据库一致时直接 mmap 加载并回放操作日志，否则全量重建
+            hybrid_retriever.load_bm25_index(db)
+        finally:
+            db.close()
     except Exception as e:
         print(f"⚠️  Failed to load BM25 index: {str(e)}")
 
+    # 入库 worker（未启用时由独立的 python -m app.worker 进程处理）
+    if settings.INGEST_WORKERS_IN_API:
+        from app.services.ingestion_queue import ingestion_workers
+
+        ingestion_workers.start()
+
+    # 处理进度跨进程转发：接收独立 worker 进程的进度；本进程运行 worker 时也转发给其它 API 进程
+    from app.services.progress_relay import progress_relay
+
+    progress_relay.start_listener()
+    if settings.INGEST_WORKERS_IN_API:
+        progress_relay.start_sender()
+
     yield
 
     # 关闭时的清理操作
     print("👋 Shutting down MimirQ backend...")
 
+    if settings.INGEST_WORKERS_IN_API:
+        from app.services.ingestion_queue import ingestion_workers
+
+        await ingestion_workers.stop()
+
+        from app.services.parsers import parser_factory
+
+        parser_factory.shutdown()
+
+    progress_relay.stop()
+
+    # 将操作日志合并为 BM25 快照，下次启动无需回放
+    try:
+        from app.services.hybrid_retriever import hybrid_retriever
+
+        hybrid_retriever.save_bm25_index()
+    except Exception as e:
+        print(f"⚠️  Failed to save BM25 snapshot: {str(e)}")
+
+    # 执行尚未触发的合并 flush
+    try:
+        from app.services.milvus_store import milvus_store
+
+        milvus_store.flush()
+    except Exception as e:
+        print(f"⚠️  Failed to flush Milvus: {str(e)}")
+
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -80,6 +116,10 @@ async def root():
 async def health_check():
     """健康检查"""
     from app.services.milvus_store import milvus_store
+    from app.services.hybrid_retriever import hybrid_retriever
+    from app.services.ingestion_queue import ingestion_workers
+    from app.services.progress_bus import progress_bus
+    from app.services.progress_relay import progress_relay
 
     return {
         "status": "healthy",
@@ -87,7 +127,11 @@ async def health_check():
         "milvus": {
             "status": "connected",
             "count": milvus_store.get_collection_count()
-        }
+        },
+        "embedding": milvus_store.get_embedding_stats(),
+        "retrieval_cache": hybrid_retriever.cache.stats(),
+        "ingestion": ingestion_workers.stats(),
+        "progress_stream": {**progress_bus.stats(), "relay": progress_relay.stats()}
     }
 
 
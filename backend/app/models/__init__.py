@@ -3,5 +3,6 @@
 """
 from app.models.document import Document, DocumentChunk
 from app.models.chat import Conversation, Message
+from app.models.ingestion_job import IngestionJob, IngestionBatch
 
-__all__ = ["Document", "DocumentChunk", "Conversation", "Message"]
+__all__ = ["Document", "DocumentChunk", "Conversation", "Message", "IngestionJob", "IngestionBatch"]
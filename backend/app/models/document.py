@@ -1,7 +1,7 @@
 """
 文档相关数据库模型
 """
-from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Text, ARRAY, ForeignKey
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Text, ARRAY, ForeignKey, LargeBinary
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -26,7 +26,7 @@ class Document(Base):
     # 处理状态
     status = Column(String(20), nullable=False, default='pending')  # pending | processing | completed | failed
     processing_progress = Column(Integer, default=0)  # 0-100
-    current_stage = Column(String(50), nullable=True)  # parsing | chunking | embedding | completed
+    current_stage = Column(String(50), nullable=True)  # parsing | chunking | embedding | storing | completed
     error_message = Column(Text, nullable=True)
 
     # 统计信息
@@ -36,6 +36,18 @@ class Document(Base):
     # 元数据
     metadata = Column(JSONB, default={})
 
+    # 批量入库批次
+    batch_id = Column(UUID(as_uuid=True), nullable=True, index=True)
+
+    # 去重：原始文件 sha256（上传时计算）与归一化文本 sha256（解析时计算）
+    content_hash = Column(String(64), nullable=True, index=True)
+    text_hash = Column(String(64), nullable=True, index=True)
+    # 修订次数（PUT /documents/{id} 每次成功修订加一）
+    revision = Column(Integer, default=0)
+
+    # 别名：与已有文档内容相同，共用其切片与向量（原文档删除时一并删除）
+    alias_of = Column(UUID(as_uuid=True), ForeignKey('documents.id', ondelete='CASCADE'), nullable=True, index=True)
+
     # 时间戳
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -64,7 +76,10 @@ class DocumentChunk(Base):
     metadata = Column(JSONB, default={})
 
     # ChromaDB 向量 ID
-    vector_id = Column(String(255), nullable=True)
+    vector_id = Column(String(255), nullable=True, index=True)
+
+    # BM25 分词缓存：jieba token 的 64 位哈希序列（小端 uint64 打包），入库时计算一次
+    term_hashes = Column(LargeBinary, nullable=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -0,0 +1,55 @@
+"""
+入库任务队列模型
+"""
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.sql import func
+import uuid
+
+from app.database import Base
+
+
+class IngestionJob(Base):
+    """入库任务表（worker 通过 SELECT ... FOR UPDATE SKIP LOCKED 认领）"""
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    document_id = Column(UUID(as_uuid=True), ForeignKey('documents.id', ondelete='CASCADE'), nullable=False, index=True)
+    # 批量入库：同一批次的任务可被一起认领，共用一条流水线
+    batch_id = Column(UUID(as_uuid=True), nullable=True, index=True)
+
+    # 任务参数（文件路径等）
+    payload = Column(JSONB, default={})
+
+    # 调度
+    status = Column(String(20), nullable=False, default='queued')  # queued | running | completed | failed
+    priority = Column(Integer, nullable=False, default=0)  # 越大越先执行：interactive > bulk
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime(timezone=True), server_default=func.now())  # 重试退避
+    last_error = Column(Text, nullable=True)
+
+    # 认领信息（心跳超时的 running 任务可被重新认领）
+    locked_by = Column(String(100), nullable=True)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_ingestion_jobs_claim", "status", "priority", "run_after"),
+    )
+
+
+class IngestionBatch(Base):
+    """批量入库批次（状态由所属文档聚合得出）"""
+    __tablename__ = "ingestion_batches"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+
+    source = Column(String(20), nullable=False)  # upload | directory | manifest
+    total_documents = Column(Integer, nullable=False, default=0)
+    rejected = Column(JSONB, default=[])  # 未能入队的文件及原因
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
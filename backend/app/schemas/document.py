@@ -16,6 +16,8 @@ class DocumentUploadResponse(BaseModel):
     status: str
     created_at: datetime
     metadata: Dict[str, Any] = {}
+    content_hash: Optional[str] = None
+    alias_of: Optional[UUID] = None
 
     class Config:
         from_attributes = True
@@ -50,6 +52,10 @@ class DocumentDetail(BaseModel):
     processed_at: Optional[datetime] = None
     error_message: Optional[str] = None
     metadata: Dict[str, Any] = {}
+    content_hash: Optional[str] = None
+    text_hash: Optional[str] = None
+    alias_of: Optional[UUID] = None
+    revision: int = 0
     chunks: Optional[List[DocumentChunkSchema]] = None
 
     class Config:
@@ -106,3 +112,40 @@ class DocumentStatus(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class BatchRejectedFile(BaseModel):
+    """批量入库中未能入队的文件"""
+    filename: str
+    reason: str
+
+
+class BatchImportRequest(BaseModel):
+    """从服务器本地目录 / 清单批量导入（路径必须位于 INGEST_IMPORT_ROOT 之下）"""
+    directory: Optional[str] = None
+    paths: Optional[List[str]] = None
+    recursive: bool = True
+
+
+class BatchUploadResponse(BaseModel):
+    """批量入库响应"""
+    batch_id: UUID
+    source: str
+    total_documents: int
+    documents: List[DocumentUploadResponse]
+    rejected: List[BatchRejectedFile] = []
+
+
+class BatchStatus(BaseModel):
+    """批量入库聚合状态（用于轮询）"""
+    batch_id: UUID
+    source: str
+    status: str
+    total_documents: int
+    status_counts: Dict[str, int] = {}
+    processing_progress: int
+    chunk_count: int
+    total_characters: int
+    created_at: datetime
+    failed: List[DocumentStatus] = []
+    rejected: List[BatchRejectedFile] = []
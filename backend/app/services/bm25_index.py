@@ -0,0 +1,1039 @@
+"""
+BM25 倒排索引
+封存段为按词项组织的 CSR 矩阵（预计算 BM25 权重），新增文档先写入增量段，
+支持按文档增量添加 / 删除，并可持久化为 mmap 快照供多进程共享
+"""
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from uuid import UUID
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+
+import jieba
+import numpy as np
+
+from app.config import settings
+
+
+# 快照格式版本，数组布局变化时递增
+SNAPSHOT_VERSION = 3
+
+# 行级列（快照文件名 -> (dtype, 每行形状)），与行号一一对应
+_ROW_COLUMNS = {
+    "row_length": (np.int32, ()),
+    "row_chunk_ids": (np.uint8, (16,)),
+    "row_document": (np.int32, ()),
+    "row_chunk_index": (np.int32, ()),
+    "row_page": (np.int32, ()),  # -1 表示无页码
+    "row_source": (np.int32, ()),
+}
+
+_SNAPSHOT_ARRAYS = [
+    "term_hashes", "df",
+    "indptr", "rows", "tf", "weights",
+    "document_starts", "document_ends",
+    "document_term_indptr", "document_term_ids", "document_term_counts",
+    "term_max",
+] + list(_ROW_COLUMNS)
+
+
+_tokenizer_ready = False
+
+
+def init_tokenizer():
+    """初始化 jieba 并加载自定义词典（每个进程执行一次）"""
+    global _tokenizer_ready
+    if _tokenizer_ready:
+        return
+
+    jieba.initialize()
+    if settings.BM25_USER_DICT:
+        jieba.load_userdict(settings.BM25_USER_DICT)
+    _tokenizer_ready = True
+
+
+def tokenizer_signature() -> str:
+    """分词器签名：jieba 版本与自定义词典内容变化时随之变化，缓存的 token 哈希随即失效"""
+    digest = hashlib.sha256(f"jieba-{jieba.__version__}".encode("utf-8"))
+    if settings.BM25_USER_DICT:
+        digest.update(Path(settings.BM25_USER_DICT).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def tokenize(text: str) -> List[str]:
+    """使用 jieba 搜索引擎模式分词（过滤纯空白 token）"""
+    init_tokenizer()
+    return [token for token in jieba.cut_for_search(text or "") if token.strip()]
+
+
+def hash_tokens(tokens: Iterable[str]) -> np.ndarray:
+    """将 token 映射为稳定的 64 位哈希（跨进程一致，作为词项键）"""
+    return np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            for token in tokens
+        ),
+        dtype=np.uint64
+    )
+
+
+def pack_term_hashes(text: str) -> bytes:
+    """分词并打包为字节串，供 DocumentChunk.term_hashes 缓存"""
+    return hash_tokens(tokenize(text)).astype("<u8").tobytes()
+
+
+def record_term_hashes(record: Dict[str, Any]) -> np.ndarray:
+    """优先使用切片缓存的 token 哈希，缺失时才重新分词"""
+    packed = record.get("term_hashes")
+    if packed is not None:
+        return np.frombuffer(packed, dtype="<u8").astype(np.uint64, copy=False)
+    return hash_tokens(tokenize(record.get("content", "")))
+
+
+def _tokenize_shard(texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """子进程任务：对一个分片分词，返回拼接后的 token 哈希与每行 token 数"""
+    streams = [hash_tokens(tokenize(text)) for text in texts]
+    lengths = np.array([len(stream) for stream in streams], dtype=np.int64)
+    if not streams:
+        return np.zeros(0, dtype=np.uint64), lengths
+    return np.concatenate(streams), lengths
+
+
+class ParallelTokenizer:
+    """
+    多进程分词器（用于全量重建）
+
+    jieba 为 CPU 密集且持有 GIL，将切片分片后交给进程池，每个工作进程独立初始化 jieba；
+    各分片返回紧凑的数组，由主进程按行切分合并。
+    """
+
+    def __init__(self, workers: int = 0, shard_size: int = 1000):
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_size = shard_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> "ParallelTokenizer":
+        if self.workers > 1:
+            # 使用 spawn，避免 fork 继承 gRPC / 数据库连接等线程状态
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_tokenizer
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def tokenize_many(self, texts: List[str]) -> List[np.ndarray]:
+        """批量分词，返回与输入顺序一致的 token 哈希序列"""
+        if self._pool is None or len(texts) <= self.shard_size:
+            return [hash_tokens(tokenize(text)) for text in texts]
+
+        shards = [texts[i:i + self.shard_size] for i in range(0, len(texts), self.shard_size)]
+        streams: List[np.ndarray] = []
+        for hashes, lengths in self._pool.map(_tokenize_shard, shards):
+            streams.extend(np.split(hashes, np.cumsum(lengths)[:-1]))
+        return streams
+
+
+class BM25Index:
+    """
+    可变 BM25 倒排索引
+
+    - 词表：封存段词项按哈希排序存放，二分查找得到 term_id；之后新增的词项暂存于字典
+    - 封存段：term -> rows 的 CSR 矩阵（indptr / rows / weights），weights 为预计算的
+      词频饱和项 tf·(k1+1) / (tf + k1·(1-b+b·len/avgdl))，查询即若干行切片的加权求和
+    - 增量段：新增文档的 postings 与行级列暂存于进程内，超过阈值后合并进封存段；
+      封存段（可为 mmap 只读）在增量写入时不会被复制
+    - 删除：标记行失效并扣减文档频率，合并时物理清除
+    - 每个文档的切片占用一段连续的行 [start, end)
+    - 语料以列存形式保存：chunk_id / 文档序号 / chunk_index / 页码 / 来源（字符串驻留表），
+      不持有正文，正文只在返回 Top-K 时按 chunk_id 读取
+    - MaxScore：记录每个词项在封存段中的最大权重（分数上界）；查询词项 postings 较多时
+      只遍历必要词项的 postings，其余词项仅对候选行二分查找，结果与全量打分一致
+
+    封存段权重使用封存时的平均文档长度，合并阈值保证其偏差有界；IDF 在查询时按实时统计计算。
+    """
+
+    def __init__(
+        self,
+        k1: float = 1.5,
+        b: float = 0.75,
+        max_delta_rows: int = 5000,
+        max_dead_ratio: float = 0.2,
+        prune_min_postings: Optional[int] = None,
+        auto_seal: bool = True
+    ):
+        """
+        Args:
+            auto_seal: 增量段超过阈值时自动合并；多进程共享时由发布方统一合并并发布快照，
+                其余进程关闭自动合并，始终使用共享的 mmap 封存段
+            prune_min_postings: 查询词项在封存段的 postings 总数达到该值时启用剪枝，
+                0 表示始终全量打分；默认取 settings.BM25_PRUNE_MIN_POSTINGS
+        """
+        self.k1 = k1
+        self.b = b
+        self.max_delta_rows = max_delta_rows
+        self.max_dead_ratio = max_dead_ratio
+        self.auto_seal = auto_seal
+        self.prune_min_postings = (
+            settings.BM25_PRUNE_MIN_POSTINGS if prune_min_postings is None else prune_min_postings
+        )
+
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        # 词表与文档频率：term_id < base_term_count 的词项哈希有序存放于 _term_hashes
+        self._term_hashes = np.zeros(0, dtype=np.uint64)
+        self._extra_terms: Dict[int, int] = {}
+        self._extra_hashes: List[int] = []
+        self._df = np.zeros(1024, dtype=np.int64)
+
+        # 行级数据（封存段与增量段共用行号）
+        self._row_count = 0
+        self._alive_count = 0
+        self._total_length = 0
+        self._row_alive = np.zeros(1024, dtype=bool)
+
+        # 行级列：封存段行（可为 mmap 只读）与增量段行（进程内，按 row - base_row_count 存放）分开保存
+        self._base_columns: Dict[str, np.ndarray] = {
+            name: np.zeros((0,) + shape, dtype=dtype) for name, (dtype, shape) in _ROW_COLUMNS.items()
+        }
+        self._delta_columns: Dict[str, np.ndarray] = {
+            name: np.zeros((1024,) + shape, dtype=dtype) for name, (dtype, shape) in _ROW_COLUMNS.items()
+        }
+
+        # 文档序号表与来源驻留表
+        self._documents: List[str] = []
+        self._document_slots: Dict[str, int] = {}
+        self._sources: List[str] = []
+        self._source_ids: Dict[str, int] = {}
+
+        # 文档 -> 行区间，以及文档内每个词项出现的行数（用于删除时扣减 df）
+        self._document_rows: Dict[str, Tuple[int, int]] = {}
+        self._document_terms: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+        # 封存段（CSR，行号在每个词项内递增）
+        self._base_row_count = 0
+        self._base_indptr = np.zeros(1, dtype=np.int64)
+        self._base_rows = np.zeros(0, dtype=np.int32)
+        self._base_tf = np.zeros(0, dtype=np.float32)
+        self._base_weights = np.zeros(0, dtype=np.float32)
+
+        # 封存段每个词项的最大权重（MaxScore 上界）
+        self._base_term_max = np.zeros(0, dtype=np.float32)
+
+        # 增量段：term_id -> ([row], [tf])
+        self._delta_postings: Dict[int, Tuple[List[int], List[int]]] = {}
+
+        # 最近一次保存 / 加载的快照元数据
+        self.manifest: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return self._alive_count
+
+    @property
+    def document_count(self) -> int:
+        """已索引的文档数"""
+        return len(self._document_rows)
+
+    @property
+    def term_count(self) -> int:
+        return len(self._term_hashes) + len(self._extra_hashes)
+
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            self._reset()
+
+    def build(self, documents: Iterable[Tuple[str, List[Dict[str, Any]]]]):
+        """
+        全量构建索引：所有文档直接写入封存段，不经过增量段
+
+        Args:
+            documents: (document_id, records) 序列，逐个文档流式消费
+        """
+        with self._lock:
+            self._reset()
+
+            postings = []
+            for document_id, records in documents:
+                row_tokens = [record_term_hashes(r) for r in records]
+                postings.append(self._append_rows(str(document_id), records, row_tokens))
+
+            self._rebuild_base(postings)
+
+    def add_document(self, document_id: str, records: List[Dict[str, Any]]) -> int:
+        """
+        添加（或替换）一个文档的全部切片
+
+        Args:
+            document_id: 文档 ID
+            records: 切片记录，包含 chunk_id / chunk_index / page / source，
+                以及 term_hashes（分词缓存）或 content
+
+        Returns:
+            新增的行数
+        """
+        document_id = str(document_id)
+
+        # 分词在锁外完成，避免阻塞检索
+        row_tokens = [record_term_hashes(r) for r in records]
+
+        with self._lock:
+            self._remove_rows(document_id)
+
+            terms, rows, tfs = self._append_rows(document_id, records, row_tokens)
+            for term_id, row, tf in zip(terms.tolist(), rows.tolist(), tfs.tolist()):
+                delta_rows, delta_tfs = self._delta_postings.setdefault(term_id, ([], []))
+                delta_rows.append(row)
+                delta_tfs.append(tf)
+
+            self._maybe_seal()
+            return len(records)
+
+    def remove_document(self, document_id: str) -> int:
+        """
+        从索引中删除一个文档的全部切片
+
+        Returns:
+            删除的行数
+        """
+        with self._lock:
+            removed = self._remove_rows(str(document_id))
+            self._maybe_seal()
+            return removed
+
+    def seal(self):
+        """将增量段合并进封存段，并清除已删除的行"""
+        with self._lock:
+            delta = []
+            for term_id, (rows, tfs) in self._delta_postings.items():
+                delta.append((
+                    np.full(len(rows), term_id, dtype=np.int64),
+                    np.asarray(rows, dtype=np.int64),
+                    np.asarray(tfs, dtype=np.float32)
+                ))
+            self._rebuild_base(delta)
+
+    def needs_seal(self) -> bool:
+        """增量段行数或失效行比例超过阈值"""
+        delta_rows = self._row_count - self._base_row_count
+        dead_rows = self._row_count - self._alive_count
+        return delta_rows > self.max_delta_rows or dead_rows > self.max_dead_ratio * self._row_count
+
+    def _maybe_seal(self):
+        if self.auto_seal and self.needs_seal():
+            self.seal()
+
+    def _lookup_terms(self, hashes: np.ndarray, create: bool = False) -> np.ndarray:
+        """词项哈希 -> term_id（不存在时为 -1，create=True 时分配新 id）"""
+        base_count = len(self._term_hashes)
+        term_ids = np.full(len(hashes), -1, dtype=np.int64)
+
+        if base_count:
+            positions = np.searchsorted(self._term_hashes, hashes)
+            clipped = np.minimum(positions, base_count - 1)
+            found = self._term_hashes[clipped] == hashes
+            term_ids[found] = positions[found]
+
+        for i in np.flatnonzero(term_ids < 0).tolist():
+            term_hash = int(hashes[i])
+            term_id = self._extra_terms.get(term_hash)
+            if term_id is None and create:
+                term_id = base_count + len(self._extra_hashes)
+                self._extra_terms[term_hash] = term_id
+                self._extra_hashes.append(term_hash)
+                if term_id >= len(self._df):
+                    grown = np.zeros(max(2 * len(self._df), 1024), dtype=np.int64)
+                    grown[:len(self._df)] = self._df
+                    self._df = grown
+            if term_id is not None:
+                term_ids[i] = term_id
+
+        return term_ids
+
+    @staticmethod
+    def _grow(column: np.ndarray, used: int, required: int) -> np.ndarray:
+        """按倍增扩容，保留前 used 行"""
+        if required <= len(column):
+            return column
+
+        capacity = max(len(column), 1024)
+        while capacity < required:
+            capacity *= 2
+        grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+        grown[:used] = column[:used]
+        return grown
+
+    def _reserve_rows(self, count: int):
+        """为增量段预留行：只扩容进程内的存活标记与增量段列，封存段列保持不变"""
+        required = self._row_count + count
+        self._row_alive = self._grow(self._row_alive, self._row_count, required)
+
+        delta_used = self._row_count - self._base_row_count
+        for name, column in self._delta_columns.items():
+            self._delta_columns[name] = self._grow(column, delta_used, delta_used + count)
+
+    def _row_value(self, name: str, row: int):
+        """读取单行的行级列"""
+        if row < self._base_row_count:
+            return self._base_columns[name][row]
+        return self._delta_columns[name][row - self._base_row_count]
+
+    def _row_values(self, name: str, rows: np.ndarray) -> np.ndarray:
+        """读取多行的行级列（行号可同时包含封存段与增量段）"""
+        base = self._base_row_count
+        in_base = rows < base
+        if in_base.all():
+            return self._base_columns[name][rows]
+        if not in_base.any():
+            return self._delta_columns[name][rows - base]
+
+        values = np.empty((len(rows),) + self._base_columns[name].shape[1:], dtype=self._base_columns[name].dtype)
+        values[in_base] = self._base_columns[name][rows[in_base]]
+        values[~in_base] = self._delta_columns[name][rows[~in_base] - base]
+        return values
+
+    def _intern(self, values: List[str], ids: Dict[str, int], value: str) -> int:
+        index = ids.get(value)
+        if index is None:
+            index = len(values)
+            ids[value] = index
+            values.append(value)
+        return index
+
+    def _append_rows(
+        self,
+        document_id: str,
+        records: List[Dict[str, Any]],
+        row_tokens: List[np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """分配连续行号并更新统计，返回该文档的 (term_id, row, tf) postings"""
+        start = self._row_count
+        self._reserve_rows(len(records))
+        document_slot = self._intern(self._documents, self._document_slots, document_id)
+
+        hash_parts = []
+        row_parts = []
+        tf_parts = []
+        for offset, (record, tokens) in enumerate(zip(records, row_tokens)):
+            row = start + offset
+            term_hashes, tfs = np.unique(tokens, return_counts=True)
+
+            page = record.get("page")
+            delta_row = row - self._base_row_count
+            columns = self._delta_columns
+            self._row_alive[row] = True
+            columns["row_length"][delta_row] = len(tokens)
+            columns["row_chunk_ids"][delta_row] = np.frombuffer(UUID(str(record["chunk_id"])).bytes, dtype=np.uint8)
+            columns["row_document"][delta_row] = document_slot
+            columns["row_chunk_index"][delta_row] = record.get("chunk_index") or 0
+            columns["row_page"][delta_row] = -1 if page is None else page
+            columns["row_source"][delta_row] = self._intern(
+                self._sources, self._source_ids, record.get("source") or "unknown"
+            )
+            self._total_length += len(tokens)
+
+            hash_parts.append(term_hashes)
+            row_parts.append(np.full(len(term_hashes), row, dtype=np.int64))
+            tf_parts.append(tfs.astype(np.float32))
+
+        self._row_count += len(records)
+        self._alive_count += len(records)
+
+        if not records:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float32)
+
+        terms = self._lookup_terms(np.concatenate(hash_parts), create=True)
+
+        # 每个词项在本文档中出现的行数即其 df 增量
+        term_ids, row_counts = np.unique(terms, return_counts=True)
+        self._df[term_ids] += row_counts
+        self._document_rows[document_id] = (start, self._row_count)
+        self._document_terms[document_id] = (term_ids, row_counts)
+
+        return terms, np.concatenate(row_parts), np.concatenate(tf_parts)
+
+    def _remove_rows(self, document_id: str) -> int:
+        span = self._document_rows.pop(document_id, None)
+        if span is None:
+            return 0
+
+        start, end = span
+        term_ids, row_counts = self._document_terms.pop(document_id)
+        self._df[term_ids] -= row_counts
+
+        self._total_length -= int(self._row_values("row_length", np.arange(start, end)).sum())
+        self._row_alive[start:end] = False
+        self._alive_count -= end - start
+
+        return end - start
+
+    def _rebuild_base(self, extra: List[Tuple[np.ndarray, np.ndarray, np.ndarray]]):
+        """合并封存段与新增 postings，剔除失效行与词项并重新编号，重新计算预计算权重"""
+        base_terms = np.repeat(
+            np.arange(len(self._base_indptr) - 1, dtype=np.int64),
+            np.diff(self._base_indptr)
+        )
+        terms = np.concatenate([base_terms] + [e[0] for e in extra])
+        rows = np.concatenate([self._base_rows.astype(np.int64)] + [e[1] for e in extra])
+        tfs = np.concatenate([self._base_tf] + [e[2] for e in extra])
+
+        alive = self._row_alive[:self._row_count]
+        keep = alive[rows]
+        terms, rows, tfs = terms[keep], rows[keep], tfs[keep]
+
+        # 失效行物理清除，存活行保持原有顺序重新编号
+        row_map = np.cumsum(alive) - 1
+        rows = row_map[rows]
+        alive_rows = np.flatnonzero(alive)
+
+        base_rows = self._base_row_count
+        delta_rows = self._row_count - base_rows
+        for name, (dtype, shape) in _ROW_COLUMNS.items():
+            column = np.concatenate([self._base_columns[name][:base_rows], self._delta_columns[name][:delta_rows]])
+            self._base_columns[name] = column[alive_rows]
+            self._delta_columns[name] = np.zeros((1024,) + shape, dtype=dtype)
+        self._row_alive = np.ones(len(alive_rows), dtype=bool)
+        self._document_rows = {
+            document_id: (int(row_map[start]), int(row_map[start]) + end - start)
+            for document_id, (start, end) in self._document_rows.items()
+        }
+        self._row_count = self._alive_count = self._base_row_count = len(alive_rows)
+
+        # 文档序号表只保留仍在索引中的文档；来源表很小，保持不变
+        slot_map = np.full(len(self._documents), -1, dtype=np.int32)
+        self._documents = list(self._document_rows.keys())
+        for slot, document_id in enumerate(self._documents):
+            slot_map[self._document_slots[document_id]] = slot
+        self._document_slots = {document_id: slot for slot, document_id in enumerate(self._documents)}
+        self._base_columns["row_document"] = slot_map[self._base_columns["row_document"]]
+
+        # 词表：剔除 df 为 0 的词项，其余按哈希排序重新编号
+        term_total = self.term_count
+        all_hashes = np.concatenate([self._term_hashes, np.asarray(self._extra_hashes, dtype=np.uint64)])
+        df = self._df[:term_total]
+        live_terms = np.flatnonzero(df > 0)
+        order = np.argsort(all_hashes[live_terms], kind="stable")
+        term_map = np.full(term_total, -1, dtype=np.int64)
+        term_map[live_terms[order]] = np.arange(len(live_terms))
+
+        self._term_hashes = all_hashes[live_terms[order]]
+        self._df = df[live_terms[order]].copy()
+        self._extra_terms = {}
+        self._extra_hashes = []
+        self._document_terms = {
+            document_id: (term_map[term_ids], row_counts)
+            for document_id, (term_ids, row_counts) in self._document_terms.items()
+        }
+        terms = term_map[terms]
+
+        # 按词项稳定排序：封存段行号在前且递增，增量段行号在后，保证每个词项内行号递增
+        order = np.argsort(terms, kind="stable")
+        terms, rows, tfs = terms[order], rows[order], tfs[order]
+
+        self._base_indptr = np.zeros(len(self._term_hashes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self._term_hashes)), out=self._base_indptr[1:])
+        self._base_rows = rows.astype(np.int32)
+        self._base_tf = tfs.astype(np.float32)
+        self._base_weights = self._tf_weights(self._base_tf, rows)
+        self._base_term_max = np.zeros(len(self._term_hashes), dtype=np.float32)
+        if len(self._base_weights):
+            # 封存后每个词项至少有一条 postings，reduceat 的区间均非空
+            self._base_term_max = np.maximum.reduceat(self._base_weights, self._base_indptr[:-1])
+        self._delta_postings = {}
+
+    def save(
+        self,
+        directory: Path,
+        watermark: Optional[Dict[str, Any]] = None,
+        generation: int = 0
+    ) -> Path:
+        """
+        将索引写入带版本的快照目录，并原子地切换 CURRENT 指针
+
+        Args:
+            directory: 快照根目录
+            watermark: 数据库水位（用于启动时判断快照是否过期）
+            generation: 共享索引的代数（见 BM25Store）
+
+        Returns:
+            本次写入的快照目录
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        with self._lock:
+            self.seal()
+
+            # 封存后文档序号表与 _document_rows 顺序一致
+            document_ids = self._documents
+            spans = [self._document_rows[document_id] for document_id in document_ids]
+            term_parts = [self._document_terms[document_id] for document_id in document_ids]
+            term_sizes = [len(term_ids) for term_ids, _ in term_parts]
+
+            arrays = {
+                "term_hashes": self._term_hashes,
+                "df": self._df[:self.term_count],
+                "indptr": self._base_indptr,
+                "rows": self._base_rows,
+                "tf": self._base_tf,
+                "weights": self._base_weights,
+                "document_starts": np.array([span[0] for span in spans], dtype=np.int64),
+                "document_ends": np.array([span[1] for span in spans], dtype=np.int64),
+                "document_term_indptr": np.concatenate([[0], np.cumsum(term_sizes, dtype=np.int64)]),
+                "document_term_ids": np.concatenate([np.zeros(0, dtype=np.int64)] + [p[0] for p in term_parts]),
+                "document_term_counts": np.concatenate([np.zeros(0, dtype=np.int64)] + [p[1] for p in term_parts]),
+                "term_max": self._base_term_max,
+            }
+            arrays.update(self._base_columns)
+            manifest = {
+                "version": SNAPSHOT_VERSION,
+                "k1": self.k1,
+                "b": self.b,
+                "row_count": self._row_count,
+                "total_length": self._total_length,
+                "documents": document_ids,
+                "sources": self._sources,
+                "watermark": watermark or {},
+                "generation": generation,
+                "created_at": time.time(),
+            }
+
+            snapshot_dir = directory / f"snapshot-{time.time_ns()}-{os.getpid()}"
+            snapshot_dir.mkdir()
+            for name, array in arrays.items():
+                np.save(snapshot_dir / f"{name}.npy", np.ascontiguousarray(array))
+            with open(snapshot_dir / "manifest.json", "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+
+            self.manifest = manifest
+
+        # 原子切换 CURRENT，旧快照在 POSIX 上删除后已映射的页仍然有效
+        pointer_tmp = directory / f"CURRENT.{os.getpid()}.tmp"
+        pointer_tmp.write_text(snapshot_dir.name, encoding="utf-8")
+        os.replace(pointer_tmp, directory / "CURRENT")
+
+        for old_dir in directory.glob("snapshot-*"):
+            if old_dir != snapshot_dir:
+                shutil.rmtree(old_dir, ignore_errors=True)
+
+        return snapshot_dir
+
+    @staticmethod
+    def read_manifest(directory: Path) -> Optional[Tuple[Path, Dict[str, Any]]]:
+        """读取 CURRENT 指向的快照目录及其 manifest，不存在或损坏时返回 None"""
+        pointer = Path(directory) / "CURRENT"
+        try:
+            snapshot_dir = Path(directory) / pointer.read_text(encoding="utf-8").strip()
+            with open(snapshot_dir / "manifest.json", "r", encoding="utf-8") as f:
+                return snapshot_dir, json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, directory: Path, watermark: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        以 mmap 方式加载快照（多个进程共享同一份只读页）
+
+        Args:
+            directory: 快照根目录
+            watermark: 期望的数据库水位，不一致时视为过期
+
+        Returns:
+            是否加载成功
+        """
+        current = self.read_manifest(directory)
+        if current is None:
+            return False
+
+        snapshot_dir, manifest = current
+        if manifest.get("version") != SNAPSHOT_VERSION:
+            return False
+        if (manifest.get("k1"), manifest.get("b")) != (self.k1, self.b):
+            return False
+        if watermark is not None and manifest.get("watermark") != watermark:
+            return False
+
+        arrays = {
+            name: np.load(snapshot_dir / f"{name}.npy", mmap_mode="r")
+            for name in _SNAPSHOT_ARRAYS
+        }
+
+        with self._lock:
+            self._reset()
+
+            # 只读大数组保持 mmap；需要原地修改的小数组复制到进程内
+            self._term_hashes = arrays["term_hashes"]
+            self._df = np.array(arrays["df"], dtype=np.int64)
+            self._base_indptr = arrays["indptr"]
+            self._base_rows = arrays["rows"]
+            self._base_tf = arrays["tf"]
+            self._base_weights = arrays["weights"]
+            self._base_term_max = arrays["term_max"]
+            for name in _ROW_COLUMNS:
+                self._base_columns[name] = arrays[name]
+
+            self._row_count = self._alive_count = self._base_row_count = manifest["row_count"]
+            self._row_alive = np.ones(self._row_count, dtype=bool)
+            self._total_length = manifest["total_length"]
+
+            self._documents = list(manifest["documents"])
+            self._document_slots = {document_id: slot for slot, document_id in enumerate(self._documents)}
+            self._sources = list(manifest["sources"])
+            self._source_ids = {source: index for index, source in enumerate(self._sources)}
+
+            term_indptr = arrays["document_term_indptr"]
+            for i, document_id in enumerate(self._documents):
+                self._document_rows[document_id] = (
+                    int(arrays["document_starts"][i]),
+                    int(arrays["document_ends"][i])
+                )
+                lo, hi = term_indptr[i], term_indptr[i + 1]
+                self._document_terms[document_id] = (
+                    arrays["document_term_ids"][lo:hi],
+                    arrays["document_term_counts"][lo:hi]
+                )
+
+            self.manifest = manifest
+
+        return True
+
+    def _avg_length(self) -> float:
+        return self._total_length / self._alive_count if self._alive_count else 1.0
+
+    def _tf_weights(self, tfs: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """BM25 词频饱和项"""
+        lengths = self._row_values("row_length", rows).astype(np.float32)
+        norms = self.k1 * (1 - self.b + self.b * lengths / (self._avg_length() or 1.0))
+        return (tfs * (self.k1 + 1) / (tfs + norms)).astype(np.float32)
+
+    def _idf(self, df: int) -> float:
+        """BM25 IDF（Lucene 变体，恒为正，便于增量维护）"""
+        n = self._alive_count
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def _term_postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """返回词项在封存段与增量段中的 (rows, weights)，rows 递增"""
+        rows_parts = []
+        weight_parts = []
+
+        if term_id < len(self._base_indptr) - 1:
+            lo, hi = self._base_indptr[term_id], self._base_indptr[term_id + 1]
+            rows_parts.append(self._base_rows[lo:hi])
+            weight_parts.append(self._base_weights[lo:hi])
+
+        delta = self._delta_postings.get(term_id)
+        if delta:
+            delta_rows = np.asarray(delta[0], dtype=np.int32)
+            rows_parts.append(delta_rows)
+            weight_parts.append(self._tf_weights(np.asarray(delta[1], dtype=np.float32), delta_rows))
+
+        if len(rows_parts) == 1:
+            return rows_parts[0], weight_parts[0]
+        return np.concatenate(rows_parts), np.concatenate(weight_parts)
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        document_ids: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回 Top-K
+            document_ids: 限定文档范围
+
+        Returns:
+            结果列表（chunk_id / document_id / chunk_index / page / source / score），仅为 Top-K 构造
+        """
+        query_terms = Counter(tokenize(query))
+        query_hashes = hash_tokens(query_terms.keys())
+
+        with self._lock:
+            if not self._alive_count or not query_terms or top_k <= 0:
+                return []
+
+            spans = None
+            if document_ids:
+                spans = self._scope_spans(document_ids)
+                if spans is None:
+                    return []
+
+            # (term_id, idf·查询词频)
+            terms = []
+            term_ids = self._lookup_terms(query_hashes)
+            for term_id, query_tf in zip(term_ids.tolist(), query_terms.values()):
+                if term_id < 0 or self._df[term_id] <= 0:
+                    continue
+                terms.append((term_id, self._idf(int(self._df[term_id])) * query_tf))
+
+            if not terms:
+                return []
+
+            if spans is None and self._should_prune(terms):
+                rows, scores = self._search_max_score(terms, top_k)
+            else:
+                rows, scores = self._search_exhaustive(terms, top_k, spans)
+
+            results = []
+            for row, score in zip(rows.tolist(), scores.tolist()):
+                page = int(self._row_value("row_page", row))
+                results.append({
+                    "chunk_id": str(UUID(bytes=self._row_value("row_chunk_ids", row).tobytes())),
+                    "document_id": self._documents[self._row_value("row_document", row)],
+                    "chunk_index": int(self._row_value("row_chunk_index", row)),
+                    "page": None if page < 0 else page,
+                    "source": self._sources[self._row_value("row_source", row)],
+                    "score": score,
+                })
+            return results
+
+    def _search_exhaustive(
+        self,
+        terms: List[Tuple[int, float]],
+        top_k: int,
+        spans: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, int]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """全量打分：累加查询词项的全部 postings，返回按分数降序的 (行号, 分数)"""
+        row_parts = []
+        weight_parts = []
+        for term_id, factor in terms:
+            rows, weights = self._term_postings(term_id)
+            if spans is not None:
+                rows, weights = self._postings_in_spans(rows, weights, spans)
+
+            row_parts.append(rows)
+            weight_parts.append(np.multiply(weights, factor, dtype=np.float64))
+
+        rows = np.concatenate(row_parts)
+        weights = np.concatenate(weight_parts)
+
+        if spans is None:
+            # 稀疏行求和：按行号累加各词项权重，失效行清零
+            scores = np.bincount(rows, weights=weights, minlength=self._row_count)
+            scores *= self._row_alive[:self._row_count]
+        else:
+            # 限定范围：仅在选中行（局部编号）上累加
+            scores = np.bincount(rows, weights=weights, minlength=spans[3])
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        candidate_scores = scores[candidates]
+        if spans is not None:
+            candidates = np.array([self._scoped_row(spans, position) for position in candidates.tolist()], dtype=np.int64)
+        return candidates, candidate_scores
+
+    def _should_prune(self, terms: List[Tuple[int, float]]) -> bool:
+        """查询词项在封存段的 postings 足够多时才值得剪枝，否则全量打分更快"""
+        if self.prune_min_postings <= 0:
+            return False
+
+        base_terms = len(self._base_indptr) - 1
+        postings = sum(
+            int(self._base_indptr[term_id + 1] - self._base_indptr[term_id])
+            for term_id, _ in terms if term_id < base_terms
+        )
+        return postings >= self.prune_min_postings
+
+    def _search_max_score(
+        self,
+        terms: List[Tuple[int, float]],
+        top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        MaxScore 动态剪枝（不限范围的检索）
+
+        1. 词项按分数上界（最大权重·idf·查询词频）降序排列，上界最高（通常最稀有）的词项
+           postings 最短，取其并集作为种子并精确打分，得到第 k 名分数 θ
+        2. 上界升序累加不超过 θ 的词项为非必要词项：只含这些词项的行得分不可能超过 θ，
+           无需遍历其 postings
+        3. 遍历必要词项的 postings 得到候选行，再对候选行二分查找非必要词项的权重；
+           部分得分加剩余上界已不超过 θ 的候选提前淘汰
+
+        Returns:
+            按分数降序的 (行号, 分数)，与全量打分一致（分数相同的行之间顺序可能不同）
+        """
+        # 上界留出浮点求和误差余量，保证不会误剪可能进入 Top-K 的行
+        margin = 1 + 1e-6
+
+        uppers = np.array([self._term_upper(term_id) * factor for term_id, factor in terms])
+        order = np.argsort(-uppers, kind="stable")
+        terms = [terms[i] for i in order]
+        uppers = uppers[order]
+
+        # 1. 种子候选
+        seed_rows = np.zeros(0, dtype=np.int64)
+        seeded = 0
+        while seeded < len(terms) and len(seed_rows) < top_k:
+            seed_rows = np.union1d(seed_rows, self._alive_postings(*terms[seeded])[0])
+            seeded += 1
+
+        seed_scores = np.zeros(len(seed_rows))
+        for term_id, factor in terms:
+            seed_scores += self._lookup_weights(term_id, seed_rows) * factor
+
+        threshold = 0.0
+        if len(seed_scores) >= top_k:
+            threshold = float(np.partition(seed_scores, len(seed_scores) - top_k)[len(seed_scores) - top_k])
+
+        # 2. 划分必要 / 非必要词项
+        optional_count = int(np.searchsorted(np.cumsum(uppers[::-1]) * margin, threshold, side="right"))
+        essential_count = max(len(terms) - optional_count, 1)
+
+        # 3. 必要词项 postings 并集上累加得分
+        row_parts = []
+        weight_parts = []
+        for term_id, factor in terms[:essential_count]:
+            rows, weights = self._alive_postings(term_id, factor)
+            row_parts.append(rows)
+            weight_parts.append(weights)
+
+        rows, inverse = np.unique(np.concatenate(row_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weight_parts), minlength=len(rows))
+
+        remaining = float(uppers[essential_count:].sum())
+        for (term_id, factor), upper in zip(terms[essential_count:], uppers[essential_count:]):
+            keep = (scores + remaining) * margin > threshold
+            rows, scores = rows[keep], scores[keep]
+            scores += self._lookup_weights(term_id, rows) * factor
+            remaining -= upper
+
+        # 种子行同样是精确得分，合并去重
+        rows, first = np.unique(np.concatenate([rows, seed_rows]), return_index=True)
+        scores = np.concatenate([scores, seed_scores])[first]
+
+        rows, scores = self._top_k(rows, scores, top_k)
+        ranked = np.lexsort((rows, -scores))
+        return rows[ranked], scores[ranked]
+
+    def _term_upper(self, term_id: int) -> float:
+        """词项在封存段与增量段中的最大权重"""
+        upper = 0.0
+        if term_id < len(self._base_term_max):
+            upper = float(self._base_term_max[term_id])
+
+        delta = self._delta_postings.get(term_id)
+        if delta:
+            rows = np.asarray(delta[0], dtype=np.int32)
+            upper = max(upper, float(self._tf_weights(np.asarray(delta[1], dtype=np.float32), rows).max()))
+        return upper
+
+    def _alive_postings(self, term_id: int, factor: float) -> Tuple[np.ndarray, np.ndarray]:
+        """词项的存活 postings：(行号, 权重·factor)"""
+        rows, weights = self._term_postings(term_id)
+        alive = self._row_alive[rows]
+        return rows[alive].astype(np.int64), np.multiply(weights[alive], factor, dtype=np.float64)
+
+    def _lookup_weights(self, term_id: int, rows: np.ndarray) -> np.ndarray:
+        """
+        在词项 postings 中二分查找给定行（递增）的权重，不含该词项的行为 0
+
+        封存段 postings 为 mmap 上的只读切片，不复制整条 postings
+        """
+        weights = np.zeros(len(rows))
+        if not len(rows):
+            return weights
+
+        # 与 postings 同为 int32，避免 searchsorted 将整条 postings 转换类型
+        needles = rows.astype(np.int32)
+        parts = []
+        if term_id < len(self._base_indptr) - 1:
+            lo, hi = self._base_indptr[term_id], self._base_indptr[term_id + 1]
+            parts.append((self._base_rows[lo:hi], lambda: self._base_weights[lo:hi]))
+
+        delta = self._delta_postings.get(term_id)
+        if delta:
+            delta_rows = np.asarray(delta[0], dtype=np.int32)
+            parts.append((
+                delta_rows,
+                lambda: self._tf_weights(np.asarray(delta[1], dtype=np.float32), delta_rows)
+            ))
+
+        for posting_rows, posting_weights in parts:
+            positions = np.searchsorted(posting_rows, needles)
+            found = positions < len(posting_rows)
+            found[found] = posting_rows[positions[found]] == needles[found]
+            if found.any():
+                weights[found] = posting_weights()[positions[found]]
+
+        return weights
+
+    @staticmethod
+    def _top_k(rows: np.ndarray, scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """保留分数最高的 k 行（无序）"""
+        if len(scores) > top_k:
+            keep = np.argpartition(-scores, top_k - 1)[:top_k]
+            return rows[keep], scores[keep]
+        return rows, scores
+
+    def _scope_spans(
+        self,
+        document_ids: List[str]
+    ) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, int]]:
+        """
+        将文档范围转换为行区间
+
+        Returns:
+            (starts, ends, offsets, total)：各文档的行区间 [start, end)、
+            区间在局部编号中的起点及局部行总数；范围内无已索引文档时返回 None
+        """
+        spans = sorted({
+            self._document_rows[document_id]
+            for document_id in map(str, document_ids)
+            if document_id in self._document_rows
+        })
+        if not spans:
+            return None
+
+        starts = np.array([span[0] for span in spans], dtype=np.int64)
+        ends = np.array([span[1] for span in spans], dtype=np.int64)
+        sizes = ends - starts
+        offsets = np.cumsum(sizes) - sizes
+        return starts, ends, offsets, int(sizes.sum())
+
+    @staticmethod
+    def _postings_in_spans(
+        rows: np.ndarray,
+        weights: np.ndarray,
+        spans: Tuple[np.ndarray, np.ndarray, np.ndarray, int]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """二分定位每个行区间内的 postings，返回局部行号与权重"""
+        starts, ends, offsets, _ = spans
+        lo = np.searchsorted(rows, starts)
+        counts = np.searchsorted(rows, ends) - lo
+
+        total = int(counts.sum())
+        if total == 0:
+            return rows[:0].astype(np.int64), weights[:0]
+
+        segment = np.repeat(np.arange(len(starts)), counts)
+        index = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+        local_rows = rows[index] - starts[segment] + offsets[segment]
+        return local_rows, weights[index]
+
+    @staticmethod
+    def _scoped_row(spans: Tuple[np.ndarray, np.ndarray, np.ndarray, int], position: int) -> int:
+        """局部行号 -> 全局行号"""
+        starts, _, offsets, _ = spans
+        segment = int(np.searchsorted(offsets, position, side="right")) - 1
+        return int(starts[segment] + position - offsets[segment])
@@ -0,0 +1,228 @@
+"""
+多进程共享的 BM25 索引存储
+封存段以 mmap 快照发布（所有 worker 共享同一份只读页），快照之后的增删以操作日志发布，
+每次发布递增代数（generation），各 worker 轮询 HEAD 后原子切换到新一代
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from app.services.bm25_index import BM25Index, record_term_hashes
+
+try:
+    import fcntl
+except ImportError:  # Windows：仅支持单进程部署
+    fcntl = None
+
+
+class BM25Store:
+    """
+    共享 BM25 索引的发布目录
+
+    目录结构：
+    - snapshot-*/ + CURRENT：mmap 快照（BM25Index.save），manifest 记录其代数
+    - ops/op-<generation>.npz：快照之后的单文档增删操作（含分词结果，回放无需分词）
+    - HEAD：最新代数与对应的数据库水位，原子替换
+    - .lock：跨进程写锁（fcntl），修改与发布在锁内串行进行
+
+    读取方无需加锁：所有文件先写临时文件再 os.replace，读到的总是完整的一代。
+    """
+
+    def __init__(self, directory: Path, sync_interval: float = 1.0):
+        """
+        Args:
+            directory: 索引目录（即 BM25_INDEX_DIR）
+            sync_interval: 轮询 HEAD 的最小间隔（秒）
+        """
+        self.directory = Path(directory)
+        self.ops_dir = self.directory / "ops"
+        self.sync_interval = sync_interval
+
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._last_poll = 0.0
+        self._last_head_stat = None
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """跨进程写锁（同一线程可重入）"""
+        with self._thread_lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # 每次重新打开锁文件，避免 fork 出的子进程共享同一个打开的文件描述
+            with open(self.directory / ".lock", "a+") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                self._lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth = 0
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def read_head(self) -> Dict[str, Any]:
+        """读取最新代数与水位，不存在时为第 0 代"""
+        try:
+            with open(self.directory / "HEAD", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"generation": 0, "watermark": None}
+
+    def poll(self) -> bool:
+        """
+        HEAD 是否可能已变化（节流：sync_interval 内只 stat 一次）
+
+        HEAD 每次发布都通过 os.replace 替换，inode 与 mtime 随之变化
+        """
+        now = time.monotonic()
+        if now - self._last_poll < self.sync_interval:
+            return False
+        self._last_poll = now
+
+        try:
+            stat = os.stat(self.directory / "HEAD")
+            head_stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            head_stat = None
+
+        changed = head_stat != self._last_head_stat
+        self._last_head_stat = head_stat
+        return changed
+
+    def reset_poll(self):
+        """同步失败后调用，下次轮询重新检查 HEAD"""
+        self._last_poll = 0.0
+        self._last_head_stat = None
+
+    def publish_snapshot(self, index: BM25Index, watermark: Optional[Dict[str, Any]]) -> int:
+        """
+        发布快照作为新一代（调用方持有 lock），并清理已并入快照的操作日志
+
+        Returns:
+            新的代数
+        """
+        generation = self.read_head()["generation"] + 1
+        index.save(self.directory, watermark, generation=generation)
+        self._write_head(generation, watermark)
+
+        if self.ops_dir.exists():
+            for op_file in self.ops_dir.glob("op-*.npz"):
+                if self._op_generation(op_file) <= generation:
+                    op_file.unlink(missing_ok=True)
+
+        return generation
+
+    def publish_op(self, op: Dict[str, Any], watermark: Optional[Dict[str, Any]]) -> int:
+        """
+        发布单文档操作作为新一代（调用方持有 lock）
+
+        Args:
+            op: {"type": "add", "document_id", "records"} 或 {"type": "remove", "document_id"}
+            watermark: 操作完成后的数据库水位
+
+        Returns:
+            新的代数
+        """
+        return self.publish_ops([op], watermark)
+
+    def publish_ops(self, ops: List[Dict[str, Any]], watermark: Optional[Dict[str, Any]]) -> int:
+        """
+        一次发布多个单文档操作（调用方持有 lock）
+
+        每个操作占用一个代数，HEAD 只在全部写入后更新一次，其它 worker 一次同步全部回放
+
+        Returns:
+            最新的代数
+        """
+        generation = self.read_head()["generation"]
+        if not ops:
+            return generation
+
+        self.ops_dir.mkdir(parents=True, exist_ok=True)
+        for op in ops:
+            generation += 1
+            self._write_op(generation, op)
+
+        self._write_head(generation, watermark)
+        return generation
+
+    def _write_op(self, generation: int, op: Dict[str, Any]):
+        """写入单个操作文件（先写临时文件再原子替换）"""
+        records = op.get("records") or []
+        streams = [record_term_hashes(record) for record in records]
+        meta = {
+            "type": op["type"],
+            "document_id": str(op["document_id"]),
+            "rows": [
+                {
+                    "chunk_id": str(record["chunk_id"]),
+                    "chunk_index": record.get("chunk_index"),
+                    "page": record.get("page"),
+                    "source": record.get("source"),
+                }
+                for record in records
+            ],
+        }
+
+        op_file = self.ops_dir / f"op-{generation:012d}.npz"
+        tmp_file = self.ops_dir / f".op-{generation:012d}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            np.savez(
+                f,
+                meta=np.array(json.dumps(meta)),
+                lengths=np.array([len(stream) for stream in streams], dtype=np.int64),
+                term_hashes=np.concatenate([np.zeros(0, dtype=np.uint64)] + streams),
+            )
+        os.replace(tmp_file, op_file)
+
+    def read_ops(self, after: int, upto: int) -> List[Dict[str, Any]]:
+        """
+        读取代数 (after, upto] 的操作，after 须为已加载快照或已回放操作的代数
+
+        Raises:
+            FileNotFoundError: 期间发布了新快照、操作日志已被清理，需重新加载快照
+        """
+        ops = []
+        for generation in range(after + 1, upto + 1):
+            op_file = self.ops_dir / f"op-{generation:012d}.npz"
+            with np.load(op_file) as data:
+                meta = json.loads(str(data["meta"]))
+                streams = np.split(data["term_hashes"], np.cumsum(data["lengths"])[:-1]) if len(data["lengths"]) else []
+
+            records = []
+            for row, stream in zip(meta["rows"], streams):
+                records.append({**row, "term_hashes": stream.astype("<u8").tobytes()})
+            ops.append({"type": meta["type"], "document_id": meta["document_id"], "records": records})
+
+        return ops
+
+    @staticmethod
+    def apply_op(index: BM25Index, op: Dict[str, Any]) -> int:
+        """将操作回放到索引上（幂等：add 为替换，remove 对不存在的文档无影响）"""
+        if op["type"] == "add":
+            return index.add_document(op["document_id"], op["records"])
+        return index.remove_document(op["document_id"])
+
+    def _write_head(self, generation: int, watermark: Optional[Dict[str, Any]]):
+        tmp_file = self.directory / f".HEAD.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "watermark": watermark, "published_at": time.time()}, f)
+        os.replace(tmp_file, self.directory / "HEAD")
+
+    @staticmethod
+    def _op_generation(op_file: Path) -> int:
+        return int(op_file.stem.split("-")[1])
@@ -0,0 +1,47 @@
+"""
+修订切片比对
+按 (内容哈希, 页码) 将新文件的切片与文档现有切片配对，决定保留、新增与删除的切片
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import hashlib
+
+from langchain_core.documents import Document
+
+
+def _chunk_key(content: str, page_number: Optional[int]) -> Tuple[str, Optional[int]]:
+    """修订比对键：切片内容 sha256 + 页码（页码变化的切片视为变化，保证引用页码正确）"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest(), page_number
+
+
+def diff_chunks(
+    existing: Sequence[Any],
+    chunks: List[Document]
+) -> Tuple[List[Tuple[Any, Document]], List[Document], List[Any]]:
+    """
+    按 (内容哈希, 页码) 匹配新旧切片（重复内容按出现顺序一一配对）
+
+    Args:
+        existing: 文档现有的切片行（DocumentChunk，按 chunk_index 排序，使用 content / page_number）
+        chunks: 新文件的切片（metadata 中的 page 为页码）
+
+    Returns:
+        (保留的 (旧切片, 新切片) 对, 新增切片, 删除的旧切片)
+    """
+    pool: Dict[Tuple[str, Optional[int]], List[Any]] = defaultdict(list)
+    for chunk in existing:
+        pool[_chunk_key(chunk.content, chunk.page_number)].append(chunk)
+    for candidates in pool.values():
+        candidates.reverse()
+
+    kept: List[Tuple[Any, Document]] = []
+    added: List[Document] = []
+    for chunk in chunks:
+        candidates = pool.get(_chunk_key(chunk.page_content, chunk.metadata.get('page')))
+        if candidates:
+            kept.append((candidates.pop(), chunk))
+        else:
+            added.append(chunk)
+
+    removed = [chunk for candidates in pool.values() for chunk in candidates]
+    return kept, added, removed
@@ -0,0 +1,116 @@
+"""
+切片批量写入
+绕过 ORM 工作单元（不创建 DocumentChunk 对象、不进入 identity map），
+每批切片经 PostgreSQL COPY 一次往返写入 document_chunks；驱动不支持 COPY 时退化为单条多行 INSERT
+"""
+from io import StringIO
+from typing import Any, Dict, Iterable, List, Optional
+from uuid import UUID
+import json
+import uuid
+
+from sqlalchemy.orm import Session
+
+from app.models.document import DocumentChunk
+
+
+# 写入的列（created_at 使用数据库默认值）
+COLUMNS = (
+    "id", "document_id", "chunk_index", "content", "page_number",
+    "start_char", "end_char", "metadata", "vector_id", "term_hashes",
+)
+
+_COPY_SQL = f"COPY document_chunks ({', '.join(COLUMNS)}) FROM STDIN"
+
+# COPY 文本格式中需要转义的字符
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def chunk_row(
+    document_id: UUID,
+    chunk_index: int,
+    content: str,
+    page_number: Optional[int] = None,
+    start_char: Optional[int] = None,
+    end_char: Optional[int] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+    vector_id: Optional[str] = None,
+    term_hashes: Optional[bytes] = None
+) -> Dict[str, Any]:
+    """构造一行切片数据（列名与 document_chunks 一致，文本与 metadata 中的 NUL 已去除）"""
+    return {
+        "id": uuid.uuid4(),
+        "document_id": document_id,
+        "chunk_index": chunk_index,
+        "content": _strip_nul(content),
+        "page_number": page_number,
+        "start_char": start_char,
+        "end_char": end_char,
+        "metadata": _strip_nul(metadata or {}),
+        "vector_id": vector_id,
+        "term_hashes": term_hashes,
+    }
+
+
+def write_chunks(db: Session, rows: List[Dict[str, Any]]) -> int:
+    """
+    在会话的当前事务中写入一批切片（不提交）
+
+    Args:
+        db: 数据库会话
+        rows: chunk_row 构造的行
+
+    Returns:
+        写入行数
+    """
+    if not rows:
+        return 0
+
+    raw_connection = db.connection().connection
+    cursor = raw_connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            cursor.copy_expert(_COPY_SQL, StringIO(_copy_text(rows)))
+            return len(rows)
+    finally:
+        cursor.close()
+
+    db.execute(DocumentChunk.__table__.insert().values(rows))
+    return len(rows)
+
+
+def _copy_text(rows: Iterable[Dict[str, Any]]) -> str:
+    """编码为 COPY 文本格式（制表符分隔，\\N 表示 NULL）"""
+    lines = []
+    for row in rows:
+        lines.append("\t".join(_copy_field(row[column]) for column in COLUMNS))
+    lines.append("")
+    return "\n".join(lines)
+
+
+def _strip_nul(value: Any) -> Any:
+    """
+    递归去除字符串（含字典键）中的 NUL
+
+    PostgreSQL 的 text 与 JSONB 都不接受 NUL；json.dumps 会把它编码为 \\u0000，
+    序列化之后再替换已经来不及，必须在序列化之前处理
+    """
+    if isinstance(value, str):
+        return value.replace("\x00", "")
+    if isinstance(value, dict):
+        return {_strip_nul(key): _strip_nul(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_strip_nul(item) for item in value]
+    return value
+
+
+def _copy_field(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bytes):
+        # bytea 十六进制格式；反斜杠本身需转义
+        return "\\\\x" + value.hex()
+    if isinstance(value, dict):
+        value = json.dumps(_strip_nul(value), ensure_ascii=False, default=str)
+    # PostgreSQL 文本不能包含 NUL
+    return str(value).replace("\x00", "").translate(_ESCAPES)
@@ -0,0 +1,46 @@
+"""
+上传去重
+按上传时流式计算的 sha256（content_hash）判断重复，on_duplicate 决定处理方式；
+别名文档只有自己的记录，共用原文档的文件、切片与向量，状态随原文档同步（sync_aliases）
+"""
+from typing import Any, Dict, Optional
+
+
+# 重复上传的处理方式
+DUPLICATE_MODES = ("return", "alias", "reingest")
+
+# 别名文档创建时从原文档复制的字段（归一化文本哈希 text_hash 随之复制，content_hash 为别名自己的上传哈希）
+ALIAS_FIELDS = (
+    "file_path", "status", "processing_progress", "current_stage",
+    "chunk_count", "total_characters", "text_hash", "processed_at",
+)
+
+
+def duplicate_action(on_duplicate: str, existing: Optional[Any]) -> str:
+    """
+    重复上传的处理决定
+
+    Args:
+        on_duplicate: return / alias / reingest
+        existing: 内容相同的原文档（没有时为 None）
+
+    Returns:
+        ingest（照常入库）/ return（返回原文档）/ alias（创建别名文档）
+    """
+    if on_duplicate not in DUPLICATE_MODES:
+        raise ValueError(f"Unknown on_duplicate mode: {on_duplicate}")
+    if existing is None or on_duplicate == "reingest":
+        return "ingest"
+    return on_duplicate
+
+
+def alias_values(original: Any) -> Dict[str, Any]:
+    """别名文档从原文档继承的列值（含 alias_of）"""
+    values = {field: getattr(original, field) for field in ALIAS_FIELDS}
+    values["alias_of"] = original.id
+    return values
+
+
+def owns_content(document: Any) -> bool:
+    """原文档持有文件、切片与向量；别名文档删除时只删除自己的记录"""
+    return document.alias_of is None
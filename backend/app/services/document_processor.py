@@ -2,30 +2,34 @@
 文档处理服务 - 核心处理流程
 """
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Sequence, Tuple
 from sqlalchemy.orm import Session
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from uuid import UUID
 import asyncio
+import hashlib
 
 from app.config import settings
 from app.models.document import Document as DBDocument, DocumentChunk
-from app.services.parsers import parser_factory
-from app.services.milvus_store import milvus_store
+from app.services.chunk_diff import diff_chunks
 from app.services.hybrid_retriever import hybrid_retriever
+from app.services.ingestion_pipeline import DocumentProgress, IngestionPipeline
+from app.services.milvus_store import milvus_store
+from app.services.parsers import parser_factory
+from app.services.progress_bus import progress_bus
+from app.services.retrieval_cache import normalize_query
+from app.services.text_splitter import DEFAULT_SEPARATORS, LinearTextSplitter
 
 
 class DocumentProcessorService:
     """文档处理服务"""
 
     def __init__(self):
-        # LangChain 文本切片器
-        self.text_splitter = RecursiveCharacterTextSplitter(
+        # 文本切片器（结果与 RecursiveCharacterTextSplitter 一致，并记录 start_char / end_char）
+        self.text_splitter = LinearTextSplitter(
             chunk_size=settings.CHUNK_SIZE,
             chunk_overlap=settings.CHUNK_OVERLAP,
-            separators=["\n\n", "\n", "。", "！", "？", ".", "!", "?", " ", ""],
-            length_function=len,
+            separators=DEFAULT_SEPARATORS,
         )
 
     async def process_document(
@@ -37,12 +41,13 @@ class DocumentProcessorService:
         """
         完整的文档处理流程
 
-        流程：
+        流程（解析、切片、向量化、写入以流水线方式并行，见 IngestionPipeline）：
         1. 解析文档
         2. 文本切片
         3. 生成 Embeddings
         4. 存入向量库
         5. 保存到数据库
+        6. 增量更新 BM25 索引
 
         Args:
             file_path: 文件路径
@@ -58,74 +63,49 @@ class DocumentProcessorService:
                 db, document_id, "processing", 0, "parsing"
             )
 
-            # Step 2: 解析文档
-            print(f"Parsing document: {file_path}")
-            documents = parser_factory.parse(file_path)
-
-            await self._update_status(
-                db, document_id, "processing", 33, "chunking"
+            # Step 2-5: 流水线解析、切片、向量化并写入 Milvus / PostgreSQL（在线程池中运行）
+            pipeline = IngestionPipeline(
+                [(file_path, document_id)], self.text_splitter.split_documents
             )
-
-            # Step 3: 文本切片
-            print(f"Chunking document into smaller pieces...")
-            chunks = self.text_splitter.split_documents(documents)
-
-            # 为每个 chunk 添加元数据
-            for idx, chunk in enumerate(chunks):
-                chunk.metadata['document_id'] = str(document_id)
-                chunk.metadata['chunk_index'] = idx
-
-            await self._update_status(
-                db, document_id, "processing", 66, "embedding"
-            )
-
-            # Step 4: 生成 Embeddings 并存入 Milvus
-            print(f"Generating embeddings and storing in Milvus...")
-
-            # 转换为 Milvus 需要的格式
-            milvus_docs = []
-            for chunk in chunks:
-                milvus_docs.append({
-                    'content': chunk.page_content,
-                    'metadata': chunk.metadata
-                })
-
-            vector_ids = milvus_store.add_documents(
-                milvus_docs, document_id
+            await self._run_pipeline(
+                pipeline,
+                lambda progress, stage: self._update_status(db, document_id, "processing", progress, stage)
             )
 
-            # Step 5: 保存切片到数据库
-            print(f"Saving chunks to PostgreSQL...")
-            await self._save_chunks_to_db(
-                db, document_id, chunks, vector_ids
-            )
+            result = pipeline.documents[document_id]
+            if result.error is not None:
+                raise result.error
 
             # Step 6: 更新文档状态为完成
-            total_chars = sum(len(c.page_content) for c in chunks)
+            total_chars = result.characters
+            chunk_count = result.chunks
             await self._update_status(
                 db,
                 document_id,
                 "completed",
                 100,
                 "completed",
-                chunk_count=len(chunks),
-                total_characters=total_chars
+                chunk_count=chunk_count,
+                total_characters=total_chars,
+                text_hash=result.text_hash
             )
 
-            print(f"✅ Document processed successfully: {len(chunks)} chunks")
+            print(f"✅ Document processed successfully: {chunk_count} chunks")
 
-            # Step 7: 重新构建 BM25 索引（包含所有文档）
-            await self._rebuild_bm25_index(db)
+            # Step 7: 增量更新 BM25 索引（仅当前文档）
+            await asyncio.get_running_loop().run_in_executor(None, self.update_bm25_index, db, document_id)
 
             return {
                 "status": "success",
-                "chunk_count": len(chunks),
+                "chunk_count": chunk_count,
                 "total_characters": total_chars
             }
 
         except Exception as e:
             # 错误处理
             print(f"❌ Error processing document: {str(e)}")
+            # 失败前可能已写入部分向量，相关检索缓存同样失效
+            hybrid_retriever.invalidate_document(document_id)
             await self._update_status(
                 db,
                 document_id,
@@ -136,6 +116,295 @@ class DocumentProcessorService:
             )
             raise
 
+    async def process_documents(
+        self,
+        sources: Sequence[Tuple[Path, UUID]],
+        db: Session
+    ) -> Dict[UUID, Optional[str]]:
+        """
+        批量处理多个文档（批量入库）
+
+        所有文件共用一条流水线：小文件的切片合并进同一批 embedding，
+        每个文档写完即标记为 completed，BM25 在全部结束后只更新、发布一次。
+
+        Args:
+            sources: (文件路径, 文档 ID) 列表
+            db: 数据库会话
+
+        Returns:
+            document_id -> 错误信息（成功为 None）
+        """
+        document_ids = [document_id for _, document_id in sources]
+        db.query(DBDocument).filter(DBDocument.id.in_(document_ids)).update(
+            {"status": "processing", "processing_progress": 0, "current_stage": "parsing"},
+            synchronize_session=False
+        )
+        db.commit()
+
+        pipeline = IngestionPipeline(
+            sources,
+            self.text_splitter.split_documents,
+            on_document_done=self._mark_completed
+        )
+
+        try:
+            await self._run_pipeline(pipeline)
+        except Exception as e:
+            print(f"❌ Error processing batch: {str(e)}")
+        finally:
+            completed = [
+                document_id for document_id, progress in pipeline.documents.items() if progress.completed
+            ]
+            await asyncio.get_running_loop().run_in_executor(None, self.update_bm25_index, db, *completed)
+
+        errors: Dict[UUID, Optional[str]] = {}
+        for document_id, progress in pipeline.documents.items():
+            if progress.completed:
+                errors[document_id] = None
+                continue
+
+            error = str(progress.error or "Ingestion aborted")
+            errors[document_id] = error
+            hybrid_retriever.invalidate_document(document_id)
+            await self._update_status(
+                db, document_id, "failed", 0, "failed", error_message=error
+            )
+
+        print(f"✅ Batch processed: {len(completed)}/{len(sources)} documents completed")
+        return errors
+
+    async def revise_document(
+        self,
+        file_path: Path,
+        document_id: UUID,
+        db: Session,
+        content_hash: Optional[str] = None,
+        previous_status: str = "completed"
+    ) -> Dict[str, Any]:
+        """
+        文档修订：用新文件替换已有文档的内容
+
+        重新解析、切片新文件，按 (内容哈希, 页码) 与现有切片匹配（diff_chunks）：
+        - 保留的切片沿用原向量与分词缓存，只更新 chunk_index
+        - 新增切片向量化后写入 Milvus / PostgreSQL
+        - 消失的切片从 PostgreSQL / Milvus 删除
+        BM25 中文档的行是连续的，整体替换该文档（保留切片使用已缓存的分词结果，无需重新分词）。
+
+        切片表变更与文档信息在同一事务中提交；提交前失败时只删除新增的向量，
+        文档恢复为修订前的状态（previous_status，现有切片与向量不变，仍可检索），错误记录在 error_message。
+
+        Args:
+            file_path: 新文件路径
+            document_id: 文档 ID
+            db: 数据库会话
+            content_hash: 新文件的 sha256
+            previous_status: 修订前的文档状态
+
+        Returns:
+            处理结果
+        """
+        loop = asyncio.get_running_loop()
+        vector_ids: List[str] = []
+        committed = False
+
+        try:
+            document = db.query(DBDocument).filter(DBDocument.id == document_id).first()
+            if document is None:
+                raise ValueError(f"Document not found: {document_id}")
+            previous_path = Path(document.file_path)
+            revision = (document.revision or 0) + 1
+
+            # Step 1: 解析、切片新文件（在线程池中运行）
+            await self._update_status(db, document_id, "processing", 0, "parsing")
+            chunks, text_hash = await loop.run_in_executor(None, self._split_file, file_path, document_id)
+
+            existing = db.query(DocumentChunk).filter(
+                DocumentChunk.document_id == document_id
+            ).order_by(DocumentChunk.chunk_index).all()
+            kept, added, removed = diff_chunks(existing, chunks)
+            print(f"📝 Revision {revision} of {document_id}: "
+                  f"{len(kept)} kept, {len(added)} added, {len(removed)} removed")
+
+            # 新增切片沿用文档原来的 source，与保留切片的引用名称一致
+            if existing and existing[0].metadata and existing[0].metadata.get('source'):
+                for chunk in added:
+                    chunk.metadata['source'] = existing[0].metadata['source']
+
+            # Step 2: 只向量化并写入新增切片
+            await self._update_status(db, document_id, "processing", 30, "embedding")
+            vector_ids, hits = await loop.run_in_executor(
+                None, self._insert_vectors, added, f"_r{revision}"
+            )
+
+            # Step 3: 切片表变更与文档信息在同一事务中提交
+            await self._update_status(db, document_id, "processing", 80, "storing")
+            if removed:
+                db.query(DocumentChunk).filter(
+                    DocumentChunk.id.in_([chunk.id for chunk in removed])
+                ).delete(synchronize_session=False)
+            # 只重排切片表：向量检索按 vector_id 从切片表读取 chunk_index，Milvus 中的行无需改写
+            for old, new in kept:
+                chunk_index = new.metadata['chunk_index']
+                if old.chunk_index != chunk_index:
+                    old.chunk_index = chunk_index
+                    old.metadata = {**(old.metadata or {}), 'chunk_index': chunk_index}
+            IngestionPipeline._save_chunks(db, added, vector_ids, commit=False)
+
+            chunk_count = len(chunks)
+            total_chars = sum(len(chunk.page_content) for chunk in chunks)
+            values = {
+                "status": "completed",
+                "processing_progress": 100,
+                "current_stage": "completed",
+                "chunk_count": chunk_count,
+                "total_characters": total_chars,
+                "text_hash": text_hash,
+                "content_hash": content_hash,
+                "file_path": str(file_path),
+                "file_size": file_path.stat().st_size,
+                "revision": revision,
+                "error_message": None,
+            }
+            for key, value in values.items():
+                setattr(document, key, value)
+            self.sync_aliases(db, document_id, values)
+            db.commit()
+            committed = True
+            progress_bus.publish(
+                document_id, status="completed", current_stage="completed",
+                processing_progress=100, chunk_count=chunk_count
+            )
+
+            # Step 4: 删除消失切片的向量（Milvus 调用阻塞，在线程池中执行）
+            removed_ids = [chunk.vector_id for chunk in removed if chunk.vector_id]
+            if removed_ids:
+                await loop.run_in_executor(None, milvus_store.delete_ids, removed_ids)
+            if added:
+                await loop.run_in_executor(None, milvus_store.finish_document, document_id, len(added), hits)
+
+            # Step 5: 替换 BM25 中该文档的行
+            await loop.run_in_executor(None, self.update_bm25_index, db, document_id)
+
+            if previous_path != file_path:
+                try:
+                    previous_path.unlink()
+                except OSError:
+                    pass
+
+            return {
+                "status": "success",
+                "chunk_count": chunk_count,
+                "total_characters": total_chars,
+                "added": len(added),
+                "removed": len(removed),
+                "kept": len(kept)
+            }
+
+        except Exception as e:
+            print(f"❌ Error revising document: {str(e)}")
+            hybrid_retriever.invalidate_document(document_id)
+            if not committed:
+                # 现有切片与向量未改动：只回滚新增部分，文档恢复为修订前的状态
+                db.rollback()
+                if vector_ids:
+                    await loop.run_in_executor(None, milvus_store.delete_ids, vector_ids)
+                await self._update_status(
+                    db,
+                    document_id,
+                    previous_status,
+                    100 if previous_status == "completed" else 0,
+                    previous_status,
+                    error_message=f"Revision failed: {str(e)}"
+                )
+            raise
+
+    def _split_file(self, file_path: Path, document_id: UUID) -> Tuple[List[Document], str]:
+        """解析并切片整个文件（与入库流水线相同的逐页切片与编号），同时计算归一化文本哈希"""
+        chunks: List[Document] = []
+        text_hash = hashlib.sha256()
+
+        for page in parser_factory.iter_parse(file_path):
+            text_hash.update(normalize_query(page.page_content).encode("utf-8"))
+            text_hash.update(b"\n")
+            for chunk in self.text_splitter.split_documents([page]):
+                chunk.metadata['document_id'] = str(document_id)
+                chunk.metadata['chunk_index'] = len(chunks)
+                chunks.append(chunk)
+
+        return chunks, text_hash.hexdigest()
+
+    @staticmethod
+    def _insert_vectors(chunks: List[Document], id_suffix: str) -> Tuple[List[str], int]:
+        """分批向量化并写入 Milvus，失败时删除已写入的部分；返回 (向量 ID, 缓存命中数)"""
+        vector_ids: List[str] = []
+        hits = 0
+        batch_size = max(1, settings.MILVUS_INSERT_BATCH_SIZE)
+
+        try:
+            for start in range(0, len(chunks), batch_size):
+                batch = IngestionPipeline._milvus_docs(chunks[start:start + batch_size])
+                embeddings, hit_mask = milvus_store.embed_batch(batch)
+                vector_ids += milvus_store.insert_batch(batch, embeddings, id_suffix=id_suffix)
+                hits += int(hit_mask.sum())
+        except Exception:
+            milvus_store.delete_ids(vector_ids)
+            raise
+
+        return vector_ids, hits
+
+    async def _run_pipeline(self, pipeline: IngestionPipeline, report=None):
+        """
+        在线程池中运行流水线
+
+        每 INGEST_PROGRESS_INTERVAL 秒向 progress_bus 发布细粒度进度（页数、切片数），
+        只在阶段切换时回调 report(progress, stage) 写入数据库；
+        发布或回调失败（含任务被取消）时中止流水线，等待其回滚已写入的数据后再抛出
+        """
+        loop = asyncio.get_running_loop()
+        task = loop.run_in_executor(None, pipeline.run)
+
+        try:
+            reported_stage = None
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=settings.INGEST_PROGRESS_INTERVAL)
+                if done:
+                    break
+                progress_bus.publish_pipeline(pipeline)
+                stage = pipeline.stage
+                if report is not None and stage != reported_stage:
+                    await report(pipeline.progress, stage)
+                    reported_stage = stage
+        except BaseException as e:
+            pipeline.abort(e)
+            await asyncio.gather(task, return_exceptions=True)
+            raise
+        task.result()
+
+    @classmethod
+    def _mark_completed(cls, db: Session, progress: DocumentProgress):
+        """批量入库中单个文档写入完成（在流水线写入线程中调用）"""
+        values = {
+            "status": "completed",
+            "processing_progress": 100,
+            "current_stage": "completed",
+            "chunk_count": progress.chunks,
+            "total_characters": progress.characters,
+            "text_hash": progress.text_hash,
+        }
+        db.query(DBDocument).filter(DBDocument.id == progress.document_id).update(
+            values, synchronize_session=False
+        )
+        cls.sync_aliases(db, progress.document_id, values)
+        db.commit()
+        progress_bus.publish(progress.document_id, chunks_stored=progress.chunks, **values)
+
+    @staticmethod
+    def sync_aliases(db: Session, document_id: UUID, values: Dict[str, Any]):
+        """将原文档的状态变化同步到其别名文档（不提交）"""
+        db.query(DBDocument).filter(DBDocument.alias_of == document_id).update(
+            values, synchronize_session=False
+        )
+
     async def _update_status(
         self,
         db: Session,
@@ -145,7 +414,7 @@ class DocumentProcessorService:
         stage: str,
         **kwargs
     ):
-        """更新文档处理状态"""
+        """更新文档处理状态（数据库只在阶段切换与终态时写入，中间进度见 progress_bus）"""
         db_doc = db.query(DBDocument).filter(
             DBDocument.id == document_id
         ).first()
@@ -158,46 +427,50 @@ class DocumentProcessorService:
             for key, value in kwargs.items():
                 setattr(db_doc, key, value)
 
+            self.sync_aliases(db, document_id, {
+                "status": status,
+                "processing_progress": progress,
+                "current_stage": stage,
+                **kwargs
+            })
             db.commit()
-            db.refresh(db_doc)
 
-    async def _save_chunks_to_db(
-        self,
-        db: Session,
-        document_id: UUID,
-        chunks: List[Document],
-        vector_ids: List[str]
-    ):
-        """保存切片到数据库"""
-        for idx, (chunk, vector_id) in enumerate(zip(chunks, vector_ids)):
-            db_chunk = DocumentChunk(
-                document_id=document_id,
-                chunk_index=idx,
-                content=chunk.page_content,
-                page_number=chunk.metadata.get('page'),
-                metadata=chunk.metadata,
-                vector_id=vector_id
-            )
-            db.add(db_chunk)
+        progress_bus.publish(
+            document_id,
+            status=status,
+            current_stage=stage,
+            processing_progress=progress,
+            **{key: kwargs[key] for key in ("chunk_count", "error_message") if key in kwargs}
+        )
 
-        db.commit()
+    def update_bm25_index(self, db: Session, *document_ids: UUID):
+        """
+        将文档的切片增量写入 BM25 索引（耗时与文档大小成正比，多个文档只发布一次）
+
+        阻塞调用：需要获取跨进程索引锁，可能封存段并写快照，异步调用方应在线程池中执行
+        """
+        if not document_ids:
+            return
 
-    async def _rebuild_bm25_index(self, db: Session):
-        """重新构建 BM25 索引（包含所有已完成的文档片段）"""
         try:
-            # 查询所有已完成文档的片段
-            all_chunks = db.query(DocumentChunk).join(DBDocument).filter(
-                DBDocument.status == 'completed'
-            ).all()
-
-            if all_chunks:
-                print(f"🔄 Rebuilding BM25 index with {len(all_chunks)} chunks...")
-                hybrid_retriever.build_bm25_index(all_chunks)
+            # 切片入库时已缓存分词结果，这里只读取索引所需的列
+            document_chunks = db.query(*hybrid_retriever.BM25_COLUMNS).filter(
+                DocumentChunk.document_id.in_(document_ids)
+            ).order_by(DocumentChunk.document_id, DocumentChunk.chunk_index).all()
+
+            if len(document_ids) == 1:
+                hybrid_retriever.add_document(db, document_chunks)
             else:
-                print("⚠️  No chunks found for BM25 index")
+                hybrid_retriever.add_documents(db, document_chunks)
+
+            # 没有切片的文档（如修订后内容为空）：add_document 不会替换，移除索引中残留的旧行
+            indexed = {str(chunk.document_id) for chunk in document_chunks}
+            for document_id in document_ids:
+                if str(document_id) not in indexed:
+                    hybrid_retriever.remove_document(db, document_id)
 
         except Exception as e:
-            print(f"⚠️  Failed to rebuild BM25 index: {str(e)}")
+            print(f"⚠️  Failed to update BM25 index: {str(e)}")
             # 不抛出异常，避免影响文档处理流程
 
 
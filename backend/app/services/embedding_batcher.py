@@ -0,0 +1,155 @@
+"""
+查询向量微批调度器
+并发请求在几毫秒的窗口内合并为一次 encode，调用方各自等待自己的 Future
+"""
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import os
+import queue
+import threading
+import time
+
+
+class EmbeddingBatcher:
+    """
+    动态微批：后台线程取到第一个请求后，最多再等待 max_wait_ms 或凑满 max_batch_size，
+    然后调用一次 encode_fn 并按顺序回填每个请求的 Future
+
+    CPU 上 N 个并发的 batch=1 前向计算会互相争抢核心，合并为一次批量计算吞吐更高；
+    低并发时单个请求最多多等待 max_wait_ms。
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], List[List[float]]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        name: str = "embedding-batcher"
+    ):
+        """
+        Args:
+            encode_fn: 批量编码函数，输入文本列表，返回等长的向量列表
+            max_batch_size: 单批最大请求数，<= 1 表示不合并，直接在调用线程编码
+            max_wait_ms: 收到第一个请求后等待后续请求的最长时间（毫秒）
+            name: 后台线程名
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+
+        self._queue: "queue.Queue[Tuple[str, Future, float]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+
+        # 指标
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batched = 0
+        self._batches = 0
+        self._largest_batch = 0
+        self._peak_queue_depth = 0
+        self._queue_wait_total = 0.0
+        self._encode_total = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch_size > 1
+
+    def embed(self, text: str) -> List[float]:
+        """编码单条查询（阻塞直到所在批次完成）"""
+        if not self.enabled:
+            return self.encode_fn([text])[0]
+        return self.submit(text).result()
+
+    def submit(self, text: str) -> Future:
+        """提交单条查询，返回 Future（异步调用方可用 asyncio.wrap_future 等待）"""
+        self._ensure_worker()
+
+        future: Future = Future()
+        self._queue.put((text, future, time.monotonic()))
+
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._requests += 1
+            self._peak_queue_depth = max(self._peak_queue_depth, depth)
+        return future
+
+    def stats(self) -> Dict[str, Any]:
+        """队列深度与批次统计，用于调优窗口与批大小"""
+        with self._stats_lock:
+            batched = self._batched
+            return {
+                "enabled": self.enabled,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize(),
+                "peak_queue_depth": self._peak_queue_depth,
+                "requests": self._requests,
+                "batches": self._batches,
+                "largest_batch": self._largest_batch,
+                "avg_batch_size": round(batched / self._batches, 2) if self._batches else 0.0,
+                "avg_queue_wait_ms": round(self._queue_wait_total / batched * 1000, 3) if batched else 0.0,
+                "avg_encode_ms": round(self._encode_total / self._batches * 1000, 3) if self._batches else 0.0,
+            }
+
+    def _ensure_worker(self):
+        """按需启动后台线程（fork 出的子进程中线程不存在，需重新启动）"""
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+
+        with self._start_lock:
+            if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._thread_pid != os.getpid():
+                self._queue = queue.Queue()
+
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _collect(self) -> List[Tuple[str, Future, float]]:
+        """阻塞取第一个请求，再在窗口内凑批"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # 窗口已过，只取已经排队的请求
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+
+            # 跳过已被调用方取消的请求
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            try:
+                vectors = self.encode_fn([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            finished = time.monotonic()
+
+            with self._stats_lock:
+                self._batches += 1
+                self._batched += len(batch)
+                self._largest_batch = max(self._largest_batch, len(batch))
+                self._queue_wait_total += sum(started - submitted for _, _, submitted in batch)
+                self._encode_total += finished - started
@@ -0,0 +1,486 @@
+"""
+Embedding 缓存
+- VectorFile：追加写的 float32 向量文件 + 键索引（mmap 读取，多进程共享，按代轮转限制行数）
+- QueryEmbeddingCache：查询向量缓存，进程内 LRU 向量池 + 可选的磁盘共享层
+- DocumentEmbeddingCache：入库切片向量缓存，按 (模型, sha256(切片文本)) 持久化
+"""
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from app.services.retrieval_cache import normalize_query
+
+try:
+    import fcntl
+except ImportError:  # Windows：磁盘层仅在单进程内安全
+    fcntl = None
+
+
+def cache_namespace(*parts: str) -> str:
+    """由 provider / 模型名等生成可作为目录名的命名空间"""
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", "--".join(parts)).strip("_")
+
+
+class _Segment:
+    """VectorFile 的一代数据（向量文件 + 键记录文件）及本进程已加载的键索引"""
+
+    def __init__(self, directory: Path, generation: int):
+        self.generation = generation
+        # 第 0 代沿用未分代时的文件名，升级后已有缓存继续可用
+        suffix = f".{generation}" if generation else ""
+        self.vectors_path = directory / f"vectors{suffix}.f32"
+        self.keys_path = directory / f"keys{suffix}.bin"
+        self.index: Dict[bytes, int] = {}
+        self.keys_offset = 0
+        self.vectors: Optional[np.ndarray] = None
+
+    def rows(self, dim: int) -> int:
+        """已写入的完整行数（上次写入中断留下的不完整行向上取整）"""
+        try:
+            size = self.vectors_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+        return -(-size // (dim * 4))
+
+    def refresh(self, record: np.dtype):
+        """增量读取其它进程追加的键记录（只读取完整记录）"""
+        try:
+            size = self.keys_path.stat().st_size
+        except FileNotFoundError:
+            return
+
+        end = size - size % record.itemsize
+        if end <= self.keys_offset:
+            return
+
+        with open(self.keys_path, "rb") as f:
+            f.seek(self.keys_offset)
+            records = np.frombuffer(f.read(end - self.keys_offset), dtype=record)
+
+        for key, row in zip(records["key"].tolist(), records["row"].tolist()):
+            self.index[bytes(key)] = row
+        self.keys_offset = end
+
+    def view(self, min_rows: int, dim: int) -> np.ndarray:
+        """mmap 向量文件，文件增长后重新映射"""
+        if self.vectors is None or len(self.vectors) < min_rows:
+            rows = self.vectors_path.stat().st_size // (dim * 4)
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, dim))
+        return self.vectors
+
+    def remove(self):
+        for path in (self.vectors_path, self.keys_path):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+class VectorFile:
+    """
+    追加写的磁盘向量存储（按代轮转，行数有上限）
+
+    - vectors[.N].f32：定长 float32 行，只追加
+    - keys[.N].bin：(定长键, int64 行号) 记录，只追加；写入顺序为先向量后键，
+      读取方看到键时对应向量必已写入
+    - current：当前写入的代号；meta.json：向量维度
+
+    max_rows > 0 时最多保留两代（当前代 + 上一代），每代最多 max_rows / 2 行：
+    当前代写满时新开一代并删除上上代，被删除的代中仍被读取的键在命中上一代时已复制到当前代，
+    效果近似 LRU。每个进程的键索引同样只覆盖这两代，内存随 max_rows 有界。
+
+    写入与轮转在文件锁内进行；读取方按文件大小增量加载新键，向量通过 mmap 读取，
+    多个 worker 与重启后的进程共享同一份数据。相同键重复写入时以最后一次为准。
+    """
+
+    def __init__(self, directory: Path, key_size: int = 16, max_rows: int = 0):
+        """
+        Args:
+            directory: 存储目录（每个模型命名空间一个目录）
+            key_size: 键的字节数
+            max_rows: 最多保留的行数，0 表示不限（不轮转）
+        """
+        self._record = np.dtype([("key", f"V{key_size}"), ("row", "<i8")])
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_rows = max_rows
+        self._meta_path = self.directory / "meta.json"
+        self._current_path = self.directory / "current"
+
+        self._lock = threading.Lock()
+        self._current_stat: Optional[Tuple[int, int]] = None
+        # 本进程可见的代（上一代在前，当前代在后）
+        self._segments: List[_Segment] = [_Segment(self.directory, 0)]
+        self._dim: Optional[int] = None
+        self.rotations = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh_index()
+            return len(set().union(*(segment.index for segment in self._segments)))
+
+    @property
+    def dim(self) -> Optional[int]:
+        if self._dim is None and self._meta_path.exists():
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self._dim = int(json.load(f)["dim"])
+        return self._dim
+
+    @property
+    def segment_rows(self) -> int:
+        return max(1, self.max_rows // 2) if self.max_rows > 0 else 0
+
+    def get_many(self, keys: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        """
+        批量读取，未命中的位置为 None（返回的向量为副本）
+
+        只在上一代命中的键复制到当前代，轮转时不会被淘汰
+        """
+        results: List[Optional[np.ndarray]] = [None] * len(keys)
+        with self._lock:
+            self._refresh_index()
+            current = self._segments[-1]
+            promote: List[int] = []
+            for segment in reversed(self._segments):
+                positions = []
+                for i, key in enumerate(keys):
+                    if results[i] is None and key in segment.index:
+                        positions.append(i)
+                if not positions:
+                    continue
+
+                found = [segment.index[keys[i]] for i in positions]
+                try:
+                    # 花式索引一次性拷贝出命中的行
+                    block = segment.view(max(found) + 1, self.dim)[found]
+                except FileNotFoundError:
+                    # 该代已被其它进程轮转删除
+                    continue
+                for position, vector in zip(positions, block):
+                    results[position] = vector
+                if segment is not current:
+                    promote += positions
+
+        if promote:
+            try:
+                self.put_many([keys[i] for i in promote], np.stack([results[i] for i in promote]))
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Failed to promote cached embeddings: {str(e)}")
+        return results
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray):
+        """批量追加（跨进程加锁），当前代写满时先轮转"""
+        if not len(keys):
+            return
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        dim = vectors.shape[1]
+
+        with self._lock, open(self.directory / ".lock", "a+") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                if self.dim is None:
+                    self._write_atomic(self._meta_path, json.dumps({"dim": dim}))
+                    self._dim = dim
+                elif self.dim != dim:
+                    raise ValueError(f"Vector dimension mismatch: {dim} != {self.dim}")
+
+                generation = self._read_generation()
+                segment = _Segment(self.directory, generation)
+                start = segment.rows(dim)
+                if self.segment_rows and start and start + len(keys) > self.segment_rows:
+                    segment = self._rotate(generation)
+                    start = 0
+
+                with open(segment.vectors_path, "r+b" if start else "wb") as f:
+                    f.seek(start * dim * 4)
+                    f.write(vectors.tobytes())
+                    f.flush()
+
+                records = np.zeros(len(keys), dtype=self._record)
+                records["key"] = [bytes(key) for key in keys]
+                records["row"] = np.arange(start, start + len(keys))
+                with open(segment.keys_path, "ab") as f:
+                    f.write(records.tobytes())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+            self._refresh_index()
+
+    def _rotate(self, generation: int) -> _Segment:
+        """（持有文件锁）新开一代，删除上上代"""
+        segment = _Segment(self.directory, generation + 1)
+        segment.remove()
+        self._write_atomic(self._current_path, str(generation + 1))
+        if generation > 0:
+            _Segment(self.directory, generation - 1).remove()
+        self.rotations += 1
+        return segment
+
+    def _read_generation(self) -> int:
+        try:
+            return int(self._current_path.read_text(encoding="utf-8").strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_atomic(self, path: Path, content: str):
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(content, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def _refresh_index(self):
+        """检查是否轮转（current 文件被替换），并增量加载各代的新键"""
+        try:
+            stat = self._current_path.stat()
+            current_stat = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            current_stat = None
+
+        if current_stat != self._current_stat:
+            self._current_stat = current_stat
+            generation = self._read_generation()
+            if self._segments[-1].generation != generation:
+                # 只保留上一代与当前代，更早的键索引与映射直接释放
+                keep = {segment.generation: segment for segment in self._segments}
+                self._segments = [
+                    keep.get(number) or _Segment(self.directory, number)
+                    for number in (generation - 1, generation) if number >= 0
+                ]
+
+        for segment in self._segments:
+            segment.refresh(self._record)
+
+
+class QueryEmbeddingCache:
+    """
+    查询向量缓存
+
+    - 键：模型命名空间 + 归一化查询文本（NFKC + 合并空白）的 16 字节哈希
+    - 进程内：固定容量的 float32 向量池（capacity × dim），LRU 淘汰，不持有 Python 列表
+    - 磁盘层（可选）：VectorFile，重启后与其它 worker 共享；进程内未命中时查询，
+      磁盘命中后回填进程内
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        capacity: int = 4096,
+        directory: Optional[str] = None,
+        max_rows: int = 0
+    ):
+        """
+        Args:
+            namespace: 模型命名空间（provider + 模型名）
+            capacity: 进程内缓存条目数，0 表示禁用进程内层
+            directory: 磁盘层根目录，为空表示禁用
+            max_rows: 磁盘层最多保留的行数，0 表示不限
+        """
+        self.namespace = namespace
+        self.capacity = capacity
+        self.disk = VectorFile(Path(directory) / "queries" / namespace, max_rows=max_rows) if directory else None
+
+        self._lock = threading.Lock()
+        self._slots: "OrderedDict[bytes, int]" = OrderedDict()
+        self._free: List[int] = []
+        self._pool: Optional[np.ndarray] = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> bytes:
+        return hashlib.blake2b(
+            f"{self.namespace}\0{normalize_query(text)}".encode("utf-8"),
+            digest_size=16
+        ).digest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """读取缓存向量（副本），未命中返回 None"""
+        key = self.key(text)
+
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is not None:
+                self._slots.move_to_end(key)
+                self.hits += 1
+                return self._pool[slot].copy()
+
+        vector = self.disk.get_many([key])[0] if self.disk is not None else None
+
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, vector)
+        return vector
+
+    def put(self, text: str, vector: Sequence[float]):
+        """写入缓存（进程内 + 磁盘层）"""
+        key = self.key(text)
+        vector = np.asarray(vector, dtype=np.float32)
+
+        with self._lock:
+            self._store(key, vector)
+
+        if self.disk is not None:
+            try:
+                self.disk.put_many([key], vector[None, :])
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Failed to persist query embedding: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._slots),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "disk_enabled": self.disk is not None,
+                "disk_rotations": self.disk.rotations if self.disk is not None else 0,
+            }
+
+    def _store(self, key: bytes, vector: np.ndarray):
+        """写入向量池（调用方持有锁），满时复用最久未使用的槽位"""
+        if self.capacity <= 0:
+            return
+
+        if self._pool is None or self._pool.shape[1] != len(vector):
+            self._pool = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+            self._slots.clear()
+            self._free = list(range(self.capacity - 1, -1, -1))
+
+        slot = self._slots.get(key)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                _, slot = self._slots.popitem(last=False)
+            self._slots[key] = slot
+        else:
+            self._slots.move_to_end(key)
+
+        self._pool[slot] = vector
+
+
+class DocumentEmbeddingCache:
+    """
+    入库切片向量缓存
+
+    - 键：sha256(切片文本)，模型由命名空间目录区分
+    - 存储：VectorFile（追加写 float32 文件 + 索引，超过行数上限时轮转淘汰），重复上传、修订版本、失败重试时
+      已向量化过的切片直接复用，只对未命中的切片调用模型
+    - 记录最近若干文档的命中率
+    """
+
+    def __init__(self, namespace: str, directory: Optional[str] = None, recent: int = 20, max_rows: int = 0):
+        """
+        Args:
+            namespace: 模型命名空间（provider + 模型名）
+            directory: 缓存根目录，为空表示禁用（全部重新计算）
+            recent: 保留命中率记录的最近文档数
+            max_rows: 最多保留的行数，0 表示不限
+        """
+        self.namespace = namespace
+        self.disk = (
+            VectorFile(Path(directory) / "documents" / namespace, key_size=32, max_rows=max_rows)
+            if directory else None
+        )
+
+        self._lock = threading.Lock()
+        self._recent: deque = deque(maxlen=recent)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def embed(
+        self,
+        texts: List[str],
+        encode_fn: Callable[[List[str]], List[List[float]]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        生成切片向量，只对未命中（且去重后）的文本调用 encode_fn
+
+        Args:
+            texts: 切片文本
+            encode_fn: 批量编码函数
+
+        Returns:
+            (向量矩阵 float32 [len(texts), dim], 逐条是否命中缓存的 bool 数组)
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=bool)
+
+        keys = [self.key(text) for text in texts]
+        cached = self.disk.get_many(keys) if self.disk is not None else [None] * len(texts)
+
+        # 同一批次内的重复文本只编码一次
+        missing: Dict[bytes, int] = {}
+        missing_texts: List[str] = []
+        for text, key, vector in zip(texts, keys, cached):
+            if vector is None and key not in missing:
+                missing[key] = len(missing_texts)
+                missing_texts.append(text)
+
+        computed = None
+        if missing_texts:
+            computed = np.asarray(encode_fn(missing_texts), dtype=np.float32)
+            if self.disk is not None:
+                try:
+                    self.disk.put_many(list(missing), computed)
+                except (OSError, ValueError) as e:
+                    print(f"⚠️  Failed to persist chunk embeddings: {str(e)}")
+
+        dim = computed.shape[1] if computed is not None else len(cached[0])
+        vectors = np.empty((len(texts), dim), dtype=np.float32)
+        hit_mask = np.zeros(len(texts), dtype=bool)
+        for i, (key, vector) in enumerate(zip(keys, cached)):
+            if vector is None:
+                vectors[i] = computed[missing[key]]
+            else:
+                vectors[i] = vector
+                hit_mask[i] = True
+
+        hits = int(hit_mask.sum())
+        with self._lock:
+            self.hits += hits
+            self.misses += len(texts) - hits
+
+        return vectors, hit_mask
+
+    def record_document(self, document_id: str, chunks: int, hits: int):
+        """记录单个文档的命中率（文档可能分多批 embed）"""
+        with self._lock:
+            self._recent.append({
+                "document_id": document_id,
+                "chunks": chunks,
+                "hits": hits,
+                "hit_ratio": round(hits / chunks, 4) if chunks else 0.0,
+            })
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.disk is not None,
+                "rotations": self.disk.rotations if self.disk is not None else 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "recent_documents": list(self._recent),
+            }
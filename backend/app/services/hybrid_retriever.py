@@ -2,48 +2,416 @@
 混合检索器 (Hybrid Search)
 结合向量检索和 BM25 关键词检索
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable
 from uuid import UUID
-import jieba
-from rank_bm25 import BM25Okapi
-import numpy as np
+import asyncio
+import threading
+from pathlib import Path
+from itertools import groupby
+from sqlalchemy import func
+from sqlalchemy.orm import Session
 
+from app.config import settings
+from app.database import SessionLocal
 from app.services.milvus_store import milvus_store
-from app.models.document import DocumentChunk
-from sqlalchemy.orm import Session
+from app.services.bm25_index import BM25Index, ParallelTokenizer, tokenizer_signature
+from app.services.bm25_store import BM25Store
+from app.services.retrieval_cache import RetrievalCache
+from app.models.document import Document as DBDocument, DocumentChunk
 
 
 class HybridRetriever:
     """混合检索器：向量检索 + BM25"""
 
+    # BM25 索引所需的切片列（不含正文）
+    BM25_COLUMNS = (
+        DocumentChunk.id,
+        DocumentChunk.document_id,
+        DocumentChunk.chunk_index,
+        DocumentChunk.page_number,
+        DocumentChunk.metadata['source'].astext.label('source'),
+        DocumentChunk.term_hashes,
+    )
+
     def __init__(self):
-        self.bm25_index = None
-        self.corpus_chunks = []
-        self.corpus_ids = []
+        self.bm25_index_dir = Path(settings.BM25_INDEX_DIR)
+
+        # 多 worker 共享：封存段为 mmap 快照，增删以操作日志发布，各 worker 按代数同步
+        self.bm25_store = BM25Store(self.bm25_index_dir, sync_interval=settings.BM25_SYNC_INTERVAL)
+        self.bm25_index = BM25Index(auto_seal=False)
+        self._bm25_generation = -1
+        self._sync_lock = threading.Lock()
+
+        # 检索结果缓存（文档变化时按范围失效）
+        self.cache = RetrievalCache(
+            max_entries=settings.RETRIEVAL_CACHE_SIZE,
+            ttl=settings.RETRIEVAL_CACHE_TTL
+        )
+
+    def load_bm25_index(self, db: Session):
+        """
+        启动时加载 BM25 索引
+
+        共享索引（快照 + 操作日志）的水位与数据库一致时直接同步到最新一代，
+        否则从数据库全量重建并发布新快照；多个 worker 同时启动时只有一个执行重建
+        """
+        with self.bm25_store.lock():
+            watermark = self._bm25_watermark(db)
+
+            head = self.bm25_store.read_head()
+            if head.get("watermark") == watermark and self.sync_bm25_index(force=True):
+                print(f"✅ BM25 index loaded from generation {self._bm25_generation} "
+                      f"with {len(self.bm25_index)} chunks")
+                return
+
+            print("🔄 BM25 snapshot missing or stale, rebuilding from database...")
+
+            # 分词器（jieba 版本 / 自定义词典）变化时，已缓存的 token 哈希全部失效
+            previous = BM25Index.read_manifest(self.bm25_index_dir)
+            if previous and previous[1].get("watermark", {}).get("tokenizer") != watermark["tokenizer"]:
+                print("🔤 Tokenizer changed, invalidating cached chunk tokens...")
+                db.query(DocumentChunk).update(
+                    {DocumentChunk.term_hashes: None},
+                    synchronize_session=False
+                )
+                db.commit()
+
+            self._backfill_term_hashes(db)
+
+            # 只读取构建所需的列（分词缓存 + 少量元数据），不加载正文与 ORM 对象
+            all_chunks = db.query(*self.BM25_COLUMNS).join(DBDocument).filter(
+                DBDocument.status == 'completed'
+            ).order_by(DocumentChunk.document_id, DocumentChunk.chunk_index).yield_per(10000)
+
+            self._publish_snapshot(self.build_bm25_index(all_chunks), watermark)
 
-    def build_bm25_index(self, chunks: List[DocumentChunk]):
+    def save_bm25_index(self):
         """
-        构建 BM25 索引
+        将快照之后的操作日志合并为新快照（关闭时调用，下次启动无需回放）
+
+        快照沿用最新一代的水位，保证与操作日志回放后的状态一致
+        """
+        with self.bm25_store.lock():
+            self.sync_bm25_index(force=True)
+
+            head = self.bm25_store.read_head()
+            if head["generation"] == self.bm25_index.manifest.get("generation"):
+                return
+
+            self.bm25_index.seal()
+            self._publish_snapshot(self.bm25_index, head.get("watermark"))
+            print(f"💾 BM25 snapshot saved with {len(self.bm25_index)} chunks")
+
+    def sync_bm25_index(self, force: bool = False) -> bool:
+        """
+        同步到共享索引的最新一代（检索前调用，HEAD 未变化时几乎无开销）
+
+        - 有新快照：mmap 加载后回放其后的操作，再原子替换索引引用
+        - 只有新操作：在当前索引上回放（单文档增删，耗时与文档大小成正比）
 
         Args:
-            chunks: 文档片段列表（从数据库读取）
+            force: 跳过轮询节流，直接读取 HEAD
+
+        Returns:
+            是否已同步到最新一代
+        """
+        if not force and not self.bm25_store.poll():
+            return True
+
+        with self._sync_lock:
+            for _ in range(3):
+                generation = self.bm25_store.read_head()["generation"]
+                if generation == self._bm25_generation:
+                    return True
+
+                try:
+                    self._apply_generation(generation)
+                    return True
+                except (OSError, ValueError) as e:
+                    # 读取期间发布了新快照（旧快照 / 操作日志被清理），重新读取 HEAD
+                    print(f"⚠️  BM25 sync to generation {generation} failed, retrying: {str(e)}")
+
+        self.bm25_store.reset_poll()
+        return False
+
+    def _apply_generation(self, generation: int):
+        """加载 / 回放到指定代数（调用方持有 _sync_lock）"""
+        current = BM25Index.read_manifest(self.bm25_index_dir)
+        if current is None:
+            raise FileNotFoundError(f"no BM25 snapshot in {self.bm25_index_dir}")
+
+        snapshot_generation = current[1].get("generation", 0)
+        if snapshot_generation > self._bm25_generation:
+            bm25_index = BM25Index(auto_seal=False)
+            if not bm25_index.load(self.bm25_index_dir):
+                raise ValueError("BM25 snapshot version mismatch")
+            base_generation = bm25_index.manifest.get("generation", 0)
+        else:
+            bm25_index = self.bm25_index
+            base_generation = self._bm25_generation
+
+        # HEAD 可能早于刚加载的快照
+        generation = max(generation, base_generation)
+        ops = self.bm25_store.read_ops(base_generation, generation)
+        for op in ops:
+            self.bm25_store.apply_op(bm25_index, op)
+
+        replaced = bm25_index is not self.bm25_index
+        self.bm25_index = bm25_index
+        self._bm25_generation = generation
+
+        if replaced:
+            self.cache.clear()
+        else:
+            self.cache.invalidate_documents(op["document_id"] for op in ops)
+
+    def _publish_snapshot(self, bm25_index: BM25Index, watermark: Optional[Dict[str, Any]]):
+        """发布快照（调用方持有存储锁），随后本进程也切换为 mmap 加载，与其它 worker 共享页"""
+        generation = self.bm25_store.publish_snapshot(bm25_index, watermark)
+
+        shared = BM25Index(auto_seal=False)
+        if shared.load(self.bm25_index_dir):
+            bm25_index = shared
+
+        with self._sync_lock:
+            self.bm25_index = bm25_index
+            self._bm25_generation = generation
+        self.cache.clear()
+
+    def _publish_op(self, db: Session, op: Dict[str, Any]):
+        """发布单文档操作（调用方持有存储锁）；增量段超过阈值时合并并发布新快照"""
+        self._publish_ops(db, [op])
+
+    def _publish_ops(self, db: Session, ops: List[Dict[str, Any]]):
+        """发布一组单文档操作（调用方持有存储锁）；增量段超过阈值时合并并发布新快照"""
+        watermark = self._bm25_watermark(db)
+
+        with self._sync_lock:
+            self._bm25_generation = self.bm25_store.publish_ops(ops, watermark)
+
+        if self.bm25_index.needs_seal():
+            print("📦 BM25 delta segment full, publishing a new snapshot...")
+            self.bm25_index.seal()
+            self._publish_snapshot(self.bm25_index, watermark)
+
+    @staticmethod
+    def _backfill_term_hashes(db: Session, batch_size: int = 20000):
+        """
+        为缺少分词缓存的切片补算 term_hashes（首次启动 / 分词器变化）
+
+        按主键分页读取，批内由多进程分词器并行处理
+        """
+        total = 0
+        last_id = None
+
+        with ParallelTokenizer(workers=settings.BM25_BUILD_WORKERS) as tokenizer:
+            while True:
+                query = db.query(DocumentChunk.id, DocumentChunk.content).filter(
+                    DocumentChunk.term_hashes.is_(None)
+                )
+                if last_id is not None:
+                    query = query.filter(DocumentChunk.id > last_id)
+                pending = query.order_by(DocumentChunk.id).limit(batch_size).all()
+                if not pending:
+                    break
+
+                streams = tokenizer.tokenize_many([content for _, content in pending])
+                db.bulk_update_mappings(DocumentChunk, [
+                    {"id": chunk_id, "term_hashes": stream.astype("<u8").tobytes()}
+                    for (chunk_id, _), stream in zip(pending, streams)
+                ])
+                db.commit()
+
+                total += len(pending)
+                last_id = pending[-1][0]
+                print(f"🔤 Tokenized {total} chunks with {tokenizer.workers} workers...")
+
+    @staticmethod
+    def _bm25_watermark(db: Session) -> Dict[str, Any]:
+        """数据库水位：已完成文档的切片数、最新切片创建时间与分词器签名"""
+        chunk_count, max_created_at = db.query(
+            func.count(DocumentChunk.id),
+            func.max(DocumentChunk.created_at)
+        ).join(DBDocument).filter(
+            DBDocument.status == 'completed'
+        ).one()
+
+        return {
+            "chunk_count": chunk_count,
+            "max_created_at": max_created_at.isoformat() if max_created_at else None,
+            "tokenizer": tokenizer_signature()
+        }
+
+    def build_bm25_index(self, chunks: Iterable[Any]) -> BM25Index:
+        """
+        全量构建 BM25 索引（构建期间检索继续使用当前索引，发布后再切换）
+
+        Args:
+            chunks: 切片行（BM25_COLUMNS 查询结果，按 document_id 排序），流式消费
+        """
+        grouped = groupby(chunks, key=lambda chunk: str(chunk.document_id))
+
+        bm25_index = BM25Index(auto_seal=False)
+        bm25_index.build(
+            (document_id, [self._chunk_record(chunk) for chunk in document_chunks])
+            for document_id, document_chunks in grouped
+        )
+
+        print(f"✅ BM25 index built with {len(bm25_index)} chunks")
+        return bm25_index
+
+    def add_document(self, db: Session, chunks: List[Any]):
+        """
+        增量添加单个文档的切片到 BM25 索引（已存在则替换），并发布给其它 worker
+
+        Args:
+            db: 数据库会话（计算发布水位）
+            chunks: 同一文档的全部切片行（BM25_COLUMNS 查询结果）
+        """
+        if not chunks:
+            return
+
+        document_id = str(chunks[0].document_id)
+        records = [self._chunk_record(chunk) for chunk in chunks]
+
+        with self.bm25_store.lock():
+            # 先追上其它 worker 发布的操作，保证操作日志与本地索引顺序一致
+            self.sync_bm25_index(force=True)
+            try:
+                count = self.bm25_index.add_document(document_id, records)
+            finally:
+                self.invalidate_document(document_id)
+            self._publish_op(db, {"type": "add", "document_id": document_id, "records": records})
+
+        print(f"➕ BM25 index: added {count} chunks for document {document_id}")
+
+    def add_documents(self, db: Session, chunks: List[Any]):
+        """
+        批量入库后一次性添加多个文档的切片，只同步、发布一次
+
+        Args:
+            db: 数据库会话（计算发布水位）
+            chunks: 多个文档的切片行（BM25_COLUMNS 查询结果，按 document_id、chunk_index 排序）
         """
         if not chunks:
             return
 
-        # 分词构建语料库
-        self.corpus_chunks = chunks
-        self.corpus_ids = [str(chunk.id) for chunk in chunks]
+        documents = [
+            (str(document_id), [self._chunk_record(chunk) for chunk in group])
+            for document_id, group in groupby(chunks, key=lambda chunk: chunk.document_id)
+        ]
+
+        with self.bm25_store.lock():
+            self.sync_bm25_index(force=True)
+            count = 0
+            try:
+                for document_id, records in documents:
+                    count += self.bm25_index.add_document(document_id, records)
+            finally:
+                self.cache.invalidate_documents(document_id for document_id, _ in documents)
+            self._publish_ops(db, [
+                {"type": "add", "document_id": document_id, "records": records}
+                for document_id, records in documents
+            ])
+
+        print(f"➕ BM25 index: added {count} chunks for {len(documents)} documents")
+
+    def remove_document(self, db: Session, document_id: UUID):
+        """
+        从 BM25 索引中删除指定文档的切片，并发布给其它 worker
+
+        Args:
+            db: 数据库会话（计算发布水位，应在切片删除提交后调用）
+            document_id: 文档 ID
+        """
+        with self.bm25_store.lock():
+            self.sync_bm25_index(force=True)
+            try:
+                count = self.bm25_index.remove_document(str(document_id))
+            finally:
+                self.invalidate_document(document_id)
+            if count:
+                self._publish_op(db, {"type": "remove", "document_id": str(document_id)})
+
+        if count:
+            print(f"➖ BM25 index: removed {count} chunks for document {document_id}")
+
+    def invalidate_document(self, document_id: UUID):
+        """
+        失效范围内包含该文档的检索缓存（以及全库范围的缓存）
+
+        文档的向量、切片或 BM25 行发生变化（包括处理失败的半成品）后调用
+        """
+        count = self.cache.invalidate_documents([document_id])
+        if count:
+            print(f"🧹 Retrieval cache: invalidated {count} entries for document {document_id}")
+
+    @staticmethod
+    def _chunk_record(chunk: Any) -> Dict[str, Any]:
+        """提取 BM25 索引所需的切片字段（有分词缓存时无需正文）"""
+        record = {
+            "chunk_id": str(chunk.id),
+            "chunk_index": chunk.chunk_index,
+            "page": chunk.page_number,
+            "source": chunk.source,
+        }
+        if chunk.term_hashes is not None:
+            record["term_hashes"] = chunk.term_hashes
+        else:
+            record["content"] = chunk.content
+        return record
+
+    def search_vectors(
+        self,
+        query: str,
+        top_k: int = 10,
+        score_threshold: float = 0.7,
+        document_ids: Optional[List[UUID]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        向量检索，命中按 vector_id 关联 PostgreSQL 切片行
 
-        tokenized_corpus = []
-        for chunk in chunks:
-            # 使用 jieba 分词（中文友好）
-            tokens = list(jieba.cut_for_search(chunk.content))
-            tokenized_corpus.append(tokens)
+        Milvus 中的 chunk_index 在修订重排后不再更新，这里以切片表为准补充 chunk_id 与 chunk_index；
+        切片行已删除的向量（如删除失败残留的向量）不返回
 
-        # 构建 BM25 索引
-        self.bm25_index = BM25Okapi(tokenized_corpus)
-        print(f"✅ BM25 index built with {len(chunks)} chunks")
+        Args:
+            query: 查询文本
+            top_k: 返回 Top-K
+            score_threshold: 向量相似度阈值
+            document_ids: 限定文档范围
+
+        Returns:
+            检索结果列表
+        """
+        hits = milvus_store.search(
+            query=query,
+            top_k=top_k,
+            score_threshold=score_threshold,
+            document_ids=document_ids
+        )
+        if not hits:
+            return []
+
+        db = SessionLocal()
+        try:
+            rows = {
+                row.vector_id: row
+                for row in db.query(
+                    DocumentChunk.id, DocumentChunk.vector_id, DocumentChunk.chunk_index
+                ).filter(DocumentChunk.vector_id.in_([hit["vector_id"] for hit in hits])).all()
+            }
+        finally:
+            db.close()
+
+        results = []
+        for hit in hits:
+            row = rows.get(hit["vector_id"])
+            if row is None:
+                continue
+            hit["chunk_id"] = str(row.id)
+            hit["metadata"]["chunk_index"] = row.chunk_index
+            results.append(hit)
+        return results
 
     def search_bm25(
         self,
@@ -62,40 +430,46 @@ class HybridRetriever:
         Returns:
             检索结果列表
         """
-        if not self.bm25_index or not self.corpus_chunks:
-            return []
+        # 其它 worker 发布了新一代时先同步（节流轮询，通常只是一次时间比较）
+        self.sync_bm25_index()
 
-        # 分词查询
-        tokenized_query = list(jieba.cut_for_search(query))
+        hits = self.bm25_index.search(
+            query,
+            top_k=top_k,
+            document_ids=[str(doc_id) for doc_id in document_ids] if document_ids else None
+        )
+        if not hits:
+            return []
 
-        # BM25 打分
-        scores = self.bm25_index.get_scores(tokenized_query)
+        # 索引不持有正文，只为 Top-K 按 chunk_id 读取内容
+        db = SessionLocal()
+        try:
+            contents = dict(db.query(DocumentChunk.id, DocumentChunk.content).filter(
+                DocumentChunk.id.in_([UUID(hit["chunk_id"]) for hit in hits])
+            ).all())
+        finally:
+            db.close()
 
-        # 排序并过滤
         results = []
-        for idx, score in enumerate(scores):
-            chunk = self.corpus_chunks[idx]
-
-            # 过滤文档范围
-            if document_ids and chunk.document_id not in [str(doc_id) for doc_id in document_ids]:
+        for hit in hits:
+            content = contents.get(UUID(hit["chunk_id"]))
+            if content is None:
                 continue
 
             results.append({
-                "chunk_id": str(chunk.id),
-                "content": chunk.content,
+                "chunk_id": hit["chunk_id"],
+                "content": content,
                 "metadata": {
-                    "document_id": str(chunk.document_id),
-                    "source": chunk.metadata.get('source', 'unknown'),
-                    "page": chunk.page_number,
-                    "chunk_index": chunk.chunk_index,
-                    "bm25_score": float(score)
+                    "document_id": hit["document_id"],
+                    "source": hit["source"],
+                    "page": hit["page"],
+                    "chunk_index": hit["chunk_index"],
+                    "bm25_score": hit["score"]
                 },
-                "score": float(score)
+                "score": hit["score"]
             })
 
-        # 按 BM25 分数排序
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:top_k]
+        return results
 
     def hybrid_search(
         self,
@@ -118,8 +492,19 @@ class HybridRetriever:
         Returns:
             合并后的检索结果
         """
+        # 先同步共享索引，使其它 worker 的文档变更同时失效本进程的缓存
+        self.sync_bm25_index()
+
+        key = self.cache.make_key(query, document_ids, top_k, alpha, score_threshold)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        generation = self.cache.generation
+        query = key[0]
+
         # 1. 向量检索（语义相似）
-        vector_results = milvus_store.search(
+        vector_results = self.search_vectors(
             query=query,
             top_k=top_k * 2,  # 多检索一些
             score_threshold=score_threshold,
@@ -140,7 +525,66 @@ class HybridRetriever:
             alpha=alpha
         )
 
-        return merged_results[:top_k]
+        results = merged_results[:top_k]
+        self.cache.put(key, results, generation)
+        return results
+
+    async def ahybrid_search(
+        self,
+        query: str,
+        top_k: int = 5,
+        score_threshold: float = 0.7,
+        document_ids: Optional[List[UUID]] = None,
+        alpha: float = 0.5
+    ) -> List[Dict[str, Any]]:
+        """
+        异步混合检索：向量检索与 BM25 在线程池中并发执行，不阻塞事件循环
+
+        耗时约为 max(向量检索, BM25)，而非两者之和；参数与 hybrid_search 相同
+        """
+        loop = asyncio.get_running_loop()
+
+        # 先同步共享索引，使其它 worker 的文档变更同时失效本进程的缓存
+        # （可能 mmap 加载新快照并回放操作日志，在线程池中执行）
+        await loop.run_in_executor(None, self.sync_bm25_index)
+
+        key = self.cache.make_key(query, document_ids, top_k, alpha, score_threshold)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        generation = self.cache.generation
+        query = key[0]
+
+        vector_results, bm25_results = await asyncio.gather(
+            loop.run_in_executor(
+                None,
+                lambda: self.search_vectors(
+                    query=query,
+                    top_k=top_k * 2,
+                    score_threshold=score_threshold,
+                    document_ids=document_ids
+                )
+            ),
+            loop.run_in_executor(
+                None,
+                lambda: self.search_bm25(
+                    query=query,
+                    top_k=top_k * 2,
+                    document_ids=document_ids
+                )
+            )
+        )
+
+        merged_results = self._merge_results(
+            vector_results,
+            bm25_results,
+            alpha=alpha
+        )
+
+        results = merged_results[:top_k]
+        self.cache.put(key, results, generation)
+        return results
 
     def _merge_results(
         self,
@@ -172,7 +616,8 @@ class HybridRetriever:
 
             normalized = {}
             for r in results:
-                chunk_id = r.get('chunk_id') or r['metadata'].get('chunk_index')
+                # 向量与 BM25 结果都带切片表的 chunk_id，同一切片的两路分数在此合并
+                chunk_id = r['chunk_id']
                 normalized_score = (r['score'] - min_score) / score_range
                 normalized[str(chunk_id)] = {
                     'score': normalized_score,
@@ -0,0 +1,360 @@
+"""
+流水线入库
+解析 → 切片 → 向量化 → 写入（Milvus + PostgreSQL）四个阶段各占一个线程，阶段之间以有界队列连接：
+大文档的首批切片在解析尚未结束时即可检索，总耗时趋近于最慢的阶段而非各阶段之和，
+内存中只保留队列容量内的页面与批次。一条流水线可依次处理多个文件，小文件的切片合并进同一批 embedding
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+import hashlib
+import queue
+import threading
+
+from langchain_core.documents import Document
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.document import DocumentChunk
+from app.services.chunk_writer import chunk_row, write_chunks
+from app.services.parsers import parser_factory
+from app.services.milvus_store import milvus_store
+from app.services.bm25_index import pack_term_hashes
+from app.services.retrieval_cache import normalize_query
+
+
+# 阶段结束标记
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    """其它阶段失败，当前阶段提前退出"""
+
+
+class DocumentProgress:
+    """流水线中单个文档的写入统计"""
+
+    def __init__(self, document_id: UUID, file_path: Path):
+        self.document_id = document_id
+        self.file_path = file_path
+        self.chunks = 0
+        self.characters = 0
+        self.cache_hits = 0
+        self.text_hash: Optional[str] = None  # 归一化文本的 sha256（解析阶段计算）
+        self.vector_ids: List[str] = []
+        self.error: Optional[BaseException] = None
+        self.completed = False
+
+
+class IngestionPipeline:
+    """
+    流水线入库（一个或多个文档）
+
+    - parsing：parser_factory.iter_parse 逐页产出（PDF），多个文件依次解析
+    - chunking：逐页切片，按 MILVUS_INSERT_BATCH_SIZE 组批（批次可跨文档）
+    - embedding：milvus_store.embed_batch（经切片向量缓存）
+    - storing：milvus_store.insert_batch + 写入 DocumentChunk（独立数据库会话，逐批提交）；
+      文档的最后一批写入后回调 on_document_done
+
+    单个文件解析失败只回滚该文档（记录在 documents[id].error），其余文档继续；
+    向量化 / 写入阶段失败时全部阶段停止，未完成文档已写入的数据被删除，异常由 run 抛出。
+    """
+
+    STAGES = ("parsing", "chunking", "embedding", "storing")
+
+    def __init__(
+        self,
+        sources: Sequence[Tuple[Path, UUID]],
+        split_documents: Callable[[List[Document]], List[Document]],
+        batch_size: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        on_document_done: Optional[Callable[[Session, DocumentProgress], None]] = None
+    ):
+        """
+        Args:
+            sources: (文件路径, 文档 ID) 列表
+            split_documents: 切片函数（text_splitter.split_documents）
+            batch_size: 每批切片数，默认 MILVUS_INSERT_BATCH_SIZE
+            queue_size: 阶段间队列容量，默认 INGEST_QUEUE_SIZE
+            on_document_done: 文档全部切片写入后在写入线程中调用（传入写入阶段的数据库会话）
+        """
+        self.sources = list(sources)
+        self.split_documents = split_documents
+        self.batch_size = max(1, batch_size or settings.MILVUS_INSERT_BATCH_SIZE)
+        self.on_document_done = on_document_done
+
+        queue_size = max(1, queue_size or settings.INGEST_QUEUE_SIZE)
+        self._pages: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._batches: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._embedded: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+
+        self._abort = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._running = set()
+
+        self.documents: Dict[UUID, DocumentProgress] = {
+            document_id: DocumentProgress(document_id, file_path)
+            for file_path, document_id in self.sources
+        }
+
+        # 进度（各阶段线程只写自己的计数）
+        self.documents_parsed = 0
+        self.total_pages: Optional[int] = None
+        self.pages_parsed = 0
+        self.chunks_split = 0
+        self.chunks_embedded = 0
+        self.chunks_stored = 0
+
+    @property
+    def stage(self) -> str:
+        """仍在运行的最上游阶段"""
+        for name in self.STAGES:
+            if name in self._running:
+                return name
+        return "completed"
+
+    @property
+    def progress(self) -> int:
+        """
+        估算进度（0-99）：已解析比例 × 已切片中已写入的比例
+
+        已解析比例按文件计，当前文件内按页计（非 PDF 文档没有总页数，解析完成前按 0 计）
+        """
+        if not self.sources:
+            return 0
+
+        current = min(self.pages_parsed / self.total_pages, 1.0) if self.total_pages else 0.0
+        parsed = min((self.documents_parsed + current) / len(self.sources), 1.0)
+        stored = self.chunks_stored / self.chunks_split if self.chunks_split else 0.0
+        return min(int(99 * parsed * stored), 99)
+
+    def run(self) -> "IngestionPipeline":
+        """启动各阶段线程并等待完成（阻塞，调用方应在线程池中执行）"""
+        stages = (self._parse, self._split, self._embed, self._store)
+        self._running = set(self.STAGES)
+        threads = [
+            threading.Thread(
+                target=self._run_stage,
+                args=(name, fn),
+                name=f"ingest-{name}",
+                daemon=True
+            )
+            for name, fn in zip(self.STAGES, stages)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            for progress in self.documents.values():
+                if not progress.completed:
+                    progress.error = progress.error or self._error
+                    self._rollback(progress)
+            raise self._error
+
+        return self
+
+    def abort(self, error: BaseException):
+        """从外部中止流水线（各阶段尽快退出，run 回滚未完成的文档后抛出 error）"""
+        if self._error is None:
+            self._error = error
+        self._abort.set()
+
+    def _run_stage(self, name: str, fn: Callable[[], None]):
+        try:
+            fn()
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            if self._error is None:
+                self._error = e
+                print(f"❌ Ingestion stage '{name}' failed: {str(e)}")
+            self._abort.set()
+        finally:
+            self._running.discard(name)
+
+    def _put(self, target: "queue.Queue[Any]", item: Any):
+        """放入下游队列（队列满时阻塞，形成背压），其它阶段失败时退出"""
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted()
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, source: "queue.Queue[Any]") -> Any:
+        """从上游队列取出，其它阶段失败时退出"""
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted()
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _parse(self):
+        """队列元素：(document_id, 页面) 或 (document_id, None) 表示该文档结束"""
+        for file_path, document_id in self.sources:
+            print(f"Parsing document: {file_path}")
+            self.total_pages = None
+            self.pages_parsed = 0
+            text_hash = hashlib.sha256()
+            try:
+                for page in parser_factory.iter_parse(file_path):
+                    # 归一化（NFKC + 合并空白）后计算，重新导出 / 换格式的同一文档得到相同的文本哈希
+                    text_hash.update(normalize_query(page.page_content).encode("utf-8"))
+                    text_hash.update(b"\n")
+                    self.total_pages = page.metadata.get("total_pages", self.total_pages)
+                    self._put(self._pages, (document_id, page))
+                    self.pages_parsed = page.metadata.get("page", self.pages_parsed + 1)
+                self.documents[document_id].text_hash = text_hash.hexdigest()
+            except PipelineAborted:
+                raise
+            except Exception as e:
+                # 单个文件解析失败不影响同一流水线中的其它文件
+                print(f"❌ Failed to parse {file_path}: {str(e)}")
+                self.documents[document_id].error = e
+
+            self._put(self._pages, (document_id, None))
+            self.documents_parsed += 1
+
+        self._put(self._pages, _DONE)
+
+    def _split(self):
+        """队列元素：(切片列表, 最后一个切片已在本批或之前批次中的文档 ID 列表)"""
+        batch: List[Document] = []
+        ended: List[UUID] = []
+        chunk_counts: Dict[UUID, int] = {}
+
+        while True:
+            item = self._get(self._pages)
+            if item is _DONE:
+                break
+
+            document_id, page = item
+            if page is None:
+                ended.append(document_id)
+                continue
+
+            # 切片器本就逐个 Document 切分，逐页切片结果与整体切片一致（start_char / end_char 相对本页）
+            for chunk in self.split_documents([page]):
+                chunk_index = chunk_counts.get(document_id, 0)
+                chunk_counts[document_id] = chunk_index + 1
+                chunk.metadata['document_id'] = str(document_id)
+                chunk.metadata['chunk_index'] = chunk_index
+                self.chunks_split += 1
+
+                batch.append(chunk)
+                if len(batch) >= self.batch_size:
+                    self._put(self._batches, (batch, ended))
+                    batch, ended = [], []
+
+        if batch or ended:
+            self._put(self._batches, (batch, ended))
+        self._put(self._batches, _DONE)
+
+    def _embed(self):
+        while True:
+            item = self._get(self._batches)
+            if item is _DONE:
+                break
+
+            batch, ended = item
+            embeddings, hit_mask = milvus_store.embed_batch(self._milvus_docs(batch)) if batch else ([], [])
+            self.chunks_embedded += len(batch)
+            self._put(self._embedded, (batch, embeddings, hit_mask, ended))
+
+        self._put(self._embedded, _DONE)
+
+    def _store(self):
+        db = SessionLocal()
+        try:
+            while True:
+                item = self._get(self._embedded)
+                if item is _DONE:
+                    break
+
+                batch, embeddings, hit_mask, ended = item
+                if batch:
+                    vector_ids = milvus_store.insert_batch(self._milvus_docs(batch), embeddings)
+                    # 写入切片前先登记向量 ID，切片写入失败时由 _rollback 一并删除
+                    documents = [self.documents[UUID(chunk.metadata['document_id'])] for chunk in batch]
+                    for progress, vector_id in zip(documents, vector_ids):
+                        progress.vector_ids.append(vector_id)
+
+                    try:
+                        self._save_chunks(db, batch, vector_ids)
+                    except Exception:
+                        db.rollback()
+                        raise
+
+                    for progress, chunk, hit in zip(documents, batch, hit_mask):
+                        progress.chunks += 1
+                        progress.characters += len(chunk.page_content)
+                        progress.cache_hits += int(hit)
+                    self.chunks_stored += len(batch)
+
+                for document_id in ended:
+                    self._finish_document(db, self.documents[document_id])
+        finally:
+            db.close()
+
+    def _finish_document(self, db: Session, progress: DocumentProgress):
+        """文档的全部切片已写入：解析失败的回滚，成功的安排 flush 并回调"""
+        if progress.error is not None:
+            self._rollback(progress)
+            return
+
+        if progress.vector_ids:
+            milvus_store.finish_document(progress.document_id, progress.chunks, progress.cache_hits)
+        progress.completed = True
+        if self.on_document_done is not None:
+            self.on_document_done(db, progress)
+
+    @staticmethod
+    def _milvus_docs(batch: List[Document]) -> List[dict]:
+        """转换为 Milvus 需要的格式"""
+        return [{'content': chunk.page_content, 'metadata': chunk.metadata} for chunk in batch]
+
+    @staticmethod
+    def _save_chunks(db: Session, chunks: List[Document], vector_ids: List[str], commit: bool = True):
+        """保存一批切片到数据库（COPY 批量写入，一次往返）"""
+        write_chunks(db, [
+            chunk_row(
+                document_id=UUID(chunk.metadata['document_id']),
+                chunk_index=chunk.metadata['chunk_index'],
+                content=chunk.page_content,
+                page_number=chunk.metadata.get('page'),
+                start_char=chunk.metadata.get('start_char'),
+                end_char=chunk.metadata.get('end_char'),
+                metadata=chunk.metadata,
+                vector_id=vector_id,
+                term_hashes=pack_term_hashes(chunk.page_content)
+            )
+            for chunk, vector_id in zip(chunks, vector_ids)
+        ])
+        if commit:
+            db.commit()
+
+    @staticmethod
+    def _rollback(progress: DocumentProgress):
+        """删除文档已写入的向量与切片"""
+        if progress.vector_ids:
+            milvus_store.delete_ids(progress.vector_ids)
+            progress.vector_ids = []
+
+        db = SessionLocal()
+        try:
+            db.query(DocumentChunk).filter(
+                DocumentChunk.document_id == progress.document_id
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️  Failed to remove partial chunks: {str(e)}")
+        finally:
+            db.close()
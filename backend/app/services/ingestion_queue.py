@@ -0,0 +1,438 @@
+"""
+入库任务队列
+任务持久化在 PostgreSQL（ingestion_jobs 表），worker 池通过 SELECT ... FOR UPDATE SKIP LOCKED 认领，
+每个任务使用独立的数据库会话；失败按指数退避重试，交互式上传优先于批量回填
+"""
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+import asyncio
+import os
+import socket
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.document import Document as DBDocument, DocumentChunk
+from app.models.ingestion_job import IngestionJob
+from app.services.document_processor import document_processor
+from app.services.milvus_store import milvus_store
+from app.services.progress_bus import progress_bus
+
+
+# 任务优先级（越大越先执行）
+PRIORITIES = {"interactive": 10, "bulk": 0}
+
+
+def enqueue_job(
+    db: Session,
+    document_id: UUID,
+    file_path: Path,
+    priority: str = "interactive",
+    batch_id: Optional[UUID] = None,
+    **options: Any
+) -> IngestionJob:
+    """
+    创建入库任务（不提交，与 Document 记录在同一事务中提交）
+
+    Args:
+        db: 数据库会话
+        document_id: 文档 ID
+        file_path: 已保存的文件路径
+        priority: interactive（单文件上传）| bulk（批量回填）
+        batch_id: 批量入库批次 ID
+        options: 附加到任务 payload 的参数（revise=True 表示修订已有文档）
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unsupported priority: {priority}")
+
+    job = IngestionJob(
+        document_id=document_id,
+        batch_id=batch_id,
+        payload={"file_path": str(file_path), **options},
+        priority=PRIORITIES[priority],
+        max_attempts=settings.INGEST_MAX_ATTEMPTS
+    )
+    db.add(job)
+    return job
+
+
+class IngestionWorkerPool:
+    """
+    入库 worker 池
+
+    - INGEST_CONCURRENCY 个槽位并发处理任务，每个任务独立会话
+    - 批量任务最多占用 INGEST_BULK_CONCURRENCY 个槽位，其余槽位留给交互式上传
+    - 同一批次的批量任务一次最多认领 INGEST_BATCH_CLAIM_SIZE 个，共用一条流水线与一次 BM25 发布
+    - 运行中的任务定期心跳；心跳超时（worker 崩溃）的任务可被其它 worker 重新认领，
+      重新执行前先清理上次残留的向量与切片
+    - 可运行在 API 进程内（INGEST_WORKERS_IN_API），也可由 python -m app.worker 独立运行
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, bulk_concurrency: Optional[int] = None):
+        self.concurrency = max(1, concurrency or settings.INGEST_CONCURRENCY)
+        self.bulk_concurrency = (
+            bulk_concurrency if bulk_concurrency is not None else settings.INGEST_BULK_CONCURRENCY
+        )
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._workers: List[asyncio.Task] = []
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        self._running_bulk = 0
+        # 槽位 -> 正在执行的任务 ID
+        self._current: Dict[int, List[UUID]] = {}
+
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    @property
+    def started(self) -> bool:
+        return bool(self._workers)
+
+    def start(self):
+        """在当前事件循环中启动 worker（需在运行中的事件循环内调用）"""
+        if self.started:
+            return
+
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._workers = [loop.create_task(self._worker(slot)) for slot in range(self.concurrency)]
+        self._heartbeat_task = loop.create_task(self._heartbeat())
+        print(f"👷 Ingestion workers started: {self.concurrency} slots "
+              f"(bulk <= {self.bulk_concurrency}) as {self.worker_id}")
+
+    async def stop(self):
+        """停止认领新任务，等待进行中的任务完成（超时后取消，任务将在心跳超时后被重新认领）"""
+        if not self.started:
+            return
+
+        self._stopping = True
+        self.notify()
+
+        _, pending = await asyncio.wait(self._workers, timeout=settings.INGEST_SHUTDOWN_TIMEOUT)
+        for task in list(pending) + [self._heartbeat_task]:
+            task.cancel()
+        await asyncio.gather(*self._workers, self._heartbeat_task, return_exceptions=True)
+
+        self._workers = []
+        self._heartbeat_task = None
+        print("👋 Ingestion workers stopped")
+
+    def notify(self):
+        """有新任务入队，唤醒空闲 worker（同一进程内调用，可在线程池中调用；跨进程依赖轮询）"""
+        if self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "running": self.started,
+            "slots": self.concurrency,
+            "bulk_slots": self.bulk_concurrency,
+            "active_jobs": sum(len(job_ids) for job_ids in self._current.values()),
+            "active_bulk_jobs": self._running_bulk,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+    async def _worker(self, slot: int):
+        loop = asyncio.get_running_loop()
+
+        while not self._stopping:
+            # 先预留批量槽位再认领，避免多个槽位同时认领批量任务超出上限
+            reserve_bulk = self._running_bulk < self.bulk_concurrency
+            if reserve_bulk:
+                self._running_bulk += 1
+
+            try:
+                jobs = await loop.run_in_executor(None, self._claim, reserve_bulk)
+            except Exception as e:
+                print(f"⚠️  Failed to claim ingestion job: {str(e)}")
+                jobs = []
+
+            is_bulk = bool(jobs) and jobs[0]["priority"] < PRIORITIES["interactive"]
+            if reserve_bulk and not is_bulk:
+                self._running_bulk -= 1
+
+            if not jobs:
+                await self._wait(settings.INGEST_POLL_INTERVAL)
+                continue
+
+            self._current[slot] = [job["id"] for job in jobs]
+            try:
+                if len(jobs) == 1:
+                    await self._run_job(jobs[0])
+                else:
+                    await self._run_batch(jobs)
+            finally:
+                self._current.pop(slot, None)
+                if is_bulk:
+                    self._running_bulk -= 1
+
+    async def _wait(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def _claim(self, allow_bulk: bool) -> List[Dict[str, Any]]:
+        """
+        认领可执行的任务（排队中且已到重试时间，或心跳超时的运行中任务）
+
+        认领到批量任务时，同一批次中其它排队的任务一起认领（最多 INGEST_BATCH_CLAIM_SIZE 个）
+        """
+        db = SessionLocal()
+        try:
+            stale_before = func.now() - timedelta(seconds=settings.INGEST_JOB_STALE_AFTER)
+            query = db.query(IngestionJob).filter(or_(
+                and_(IngestionJob.status == 'queued', IngestionJob.run_after <= func.now()),
+                and_(IngestionJob.status == 'running', IngestionJob.locked_at < stale_before),
+            ))
+            if not allow_bulk:
+                query = query.filter(IngestionJob.priority >= PRIORITIES["interactive"])
+
+            job = query.order_by(
+                IngestionJob.priority.desc(),
+                IngestionJob.created_at
+            ).with_for_update(skip_locked=True).first()
+
+            if job is None:
+                db.rollback()
+                return []
+
+            # 心跳超时且已无重试次数：直接判定失败
+            if job.status == 'running' and job.attempts >= job.max_attempts:
+                self._mark_failed(db, job, f"Worker {job.locked_by} stopped responding")
+                db.commit()
+                return []
+
+            jobs = [job]
+            if job.batch_id is not None and job.priority < PRIORITIES["interactive"]:
+                jobs += db.query(IngestionJob).filter(
+                    IngestionJob.batch_id == job.batch_id,
+                    IngestionJob.id != job.id,
+                    IngestionJob.status == 'queued',
+                    IngestionJob.run_after <= func.now()
+                ).order_by(IngestionJob.created_at).with_for_update(skip_locked=True).limit(
+                    max(0, settings.INGEST_BATCH_CLAIM_SIZE - 1)
+                ).all()
+
+            claimed = []
+            for row in jobs:
+                row.status = 'running'
+                row.attempts += 1
+                row.locked_by = self.worker_id
+                row.locked_at = func.now()
+                claimed.append({
+                    "id": row.id,
+                    "document_id": row.document_id,
+                    "payload": dict(row.payload or {}),
+                    "priority": row.priority,
+                    "attempts": row.attempts,
+                })
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    async def _run_job(self, job: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        document_id = job["document_id"]
+        print(f"👷 Processing ingestion job {job['id']} (document {document_id}, attempt {job['attempts']})")
+
+        error = None
+        db = SessionLocal()
+        try:
+            # 重试或重新认领时，上次执行可能已写入部分数据；
+            # 修订任务不清理（失败时自行回滚新增部分，现有切片与向量须保留用于比对）
+            payload = job["payload"]
+            if job["attempts"] > 1 and not payload.get("revise"):
+                await loop.run_in_executor(None, self._reset_document, document_id)
+
+            if payload.get("revise"):
+                await document_processor.revise_document(
+                    Path(payload["file_path"]), document_id, db,
+                    content_hash=payload.get("content_hash"),
+                    previous_status=payload.get("previous_status") or 'completed'
+                )
+            else:
+                await document_processor.process_document(
+                    Path(payload["file_path"]), document_id, db
+                )
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        finally:
+            db.close()
+
+        try:
+            await loop.run_in_executor(None, self._finish, job["id"], error)
+        except Exception as e:
+            # 任务状态未能写回，心跳超时后会被重新认领
+            print(f"⚠️  Failed to update ingestion job {job['id']}: {str(e)}")
+
+    async def _run_batch(self, jobs: List[Dict[str, Any]]):
+        """同一批次的多个任务共用一条流水线处理，各任务分别记录结果"""
+        loop = asyncio.get_running_loop()
+        print(f"👷 Processing {len(jobs)} ingestion jobs of batch together")
+
+        db = SessionLocal()
+        try:
+            for job in jobs:
+                if job["attempts"] > 1:
+                    await loop.run_in_executor(None, self._reset_document, job["document_id"])
+
+            errors = await document_processor.process_documents(
+                [(Path(job["payload"]["file_path"]), job["document_id"]) for job in jobs], db
+            )
+        except Exception as e:
+            errors = {job["document_id"]: str(e) or type(e).__name__ for job in jobs}
+        finally:
+            db.close()
+
+        for job in jobs:
+            try:
+                await loop.run_in_executor(
+                    None, self._finish, job["id"], errors.get(job["document_id"], "Ingestion aborted")
+                )
+            except Exception as e:
+                print(f"⚠️  Failed to update ingestion job {job['id']}: {str(e)}")
+
+    def _finish(self, job_id: UUID, error: Optional[str]):
+        """记录任务结果：成功、退避重试或最终失败"""
+        db = SessionLocal()
+        try:
+            job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            if job is None:
+                # 文档已删除（任务级联删除）
+                return
+
+            job.locked_by = None
+            job.locked_at = None
+
+            if error is None:
+                job.status = 'completed'
+                job.last_error = None
+                job.finished_at = func.now()
+                self.completed += 1
+            elif job.attempts < job.max_attempts:
+                delay = settings.INGEST_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+                job.status = 'queued'
+                job.last_error = error
+                job.run_after = func.now() + timedelta(seconds=delay)
+
+                document = db.query(DBDocument).filter(DBDocument.id == job.document_id).first()
+                if document and (job.payload or {}).get("revise"):
+                    self._restore_revised(
+                        db, document, job,
+                        f"Revision attempt {job.attempts}/{job.max_attempts} failed, retrying in {delay:.0f}s: {error}"
+                    )
+                elif document:
+                    document.status = 'pending'
+                    document.current_stage = 'queued'
+                    document.error_message = (
+                        f"Attempt {job.attempts}/{job.max_attempts} failed, retrying in {delay:.0f}s: {error}"
+                    )
+                    progress_bus.publish(
+                        document.id, status='pending', current_stage='queued',
+                        processing_progress=0, error_message=document.error_message
+                    )
+                self.retried += 1
+                print(f"🔁 Ingestion job {job_id} will retry in {delay:.0f}s: {error}")
+            else:
+                self._mark_failed(db, job, error)
+
+            db.commit()
+        finally:
+            db.close()
+
+    def _mark_failed(self, db: Session, job: IngestionJob, error: str):
+        job.status = 'failed'
+        job.last_error = error
+        job.locked_by = None
+        job.locked_at = None
+        job.finished_at = func.now()
+
+        document = db.query(DBDocument).filter(DBDocument.id == job.document_id).first()
+        if document and (job.payload or {}).get("revise"):
+            self._restore_revised(db, document, job, f"Revision failed: {error}", final=True)
+        elif document:
+            document.status = 'failed'
+            document.current_stage = 'failed'
+            document.error_message = error
+            document_processor.sync_aliases(db, document.id, {
+                "status": 'failed', "current_stage": 'failed', "error_message": error
+            })
+            progress_bus.publish(
+                document.id, status='failed', current_stage='failed', error_message=error, final=True
+            )
+        self.failed += 1
+        print(f"❌ Ingestion job {job.id} failed after {job.attempts} attempts: {error}")
+
+    @staticmethod
+    def _restore_revised(db: Session, document: DBDocument, job: IngestionJob, error: str, final: bool = False):
+        """修订失败不影响现有版本：文档恢复为修订前的状态（仍可检索），错误只记录在 error_message"""
+        status = job.payload.get("previous_status") or 'completed'
+        values = {
+            "status": status,
+            "current_stage": status,
+            "processing_progress": 100 if status == 'completed' else 0,
+            "error_message": error,
+        }
+        for key, value in values.items():
+            setattr(document, key, value)
+        document_processor.sync_aliases(db, document.id, values)
+        progress_bus.publish(document.id, **values, **({"final": True} if final else {}))
+
+    @staticmethod
+    def _reset_document(document_id: UUID):
+        """清理文档已写入的向量与切片（BM25 在处理完成时整体替换，无需清理）"""
+        milvus_store.delete_by_document_id(document_id)
+
+        db = SessionLocal()
+        try:
+            db.query(DocumentChunk).filter(
+                DocumentChunk.document_id == document_id
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _heartbeat(self):
+        """定期刷新运行中任务的 locked_at"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(settings.INGEST_JOB_HEARTBEAT)
+            job_ids = [job_id for ids in self._current.values() for job_id in ids]
+            if not job_ids:
+                continue
+            try:
+                await loop.run_in_executor(None, self._touch, job_ids)
+            except Exception as e:
+                print(f"⚠️  Ingestion heartbeat failed: {str(e)}")
+
+    def _touch(self, job_ids: List[UUID]):
+        db = SessionLocal()
+        try:
+            db.query(IngestionJob).filter(
+                IngestionJob.id.in_(job_ids),
+                IngestionJob.locked_by == self.worker_id
+            ).update({"locked_at": func.now()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+# 全局实例
+ingestion_workers = IngestionWorkerPool()
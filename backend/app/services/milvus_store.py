@@ -1,7 +1,7 @@
 """
 Milvus 向量数据库服务
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 from langchain_openai import OpenAIEmbeddings
 from pymilvus import (
     connections,
@@ -13,9 +13,14 @@ from pymilvus import (
 )
 from sentence_transformers import SentenceTransformer
 from uuid import UUID
+import threading
+import time
 import numpy as np
 
 from app.config import settings
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.embedding_cache import DocumentEmbeddingCache, QueryEmbeddingCache, cache_namespace
+from app.services.retrieval_cache import normalize_query
 
 
 class MilvusVectorStore:
@@ -25,6 +30,11 @@ class MilvusVectorStore:
     _embedding_model = None
     _embedding_provider = None
     _collection = None
+    _query_batcher = None
+    _query_cache = None
+    _document_cache = None
+    _flush_timer = None
+    _flush_lock = threading.Lock()
     _embedding_dim = 1024  # BGE-large 的维度
 
     def __new__(cls):
@@ -38,6 +48,26 @@ class MilvusVectorStore:
         if self._embedding_model is None:
             self._embedding_provider = (settings.EMBEDDING_PROVIDER or "local").lower()
             self._embedding_model = self._init_embedding_model()
+            # 并发查询在短窗口内合并为一次 encode
+            self._query_batcher = EmbeddingBatcher(
+                self._embed_queries,
+                max_batch_size=settings.EMBEDDING_QUERY_BATCH_SIZE,
+                max_wait_ms=settings.EMBEDDING_QUERY_BATCH_WAIT_MS,
+                name="query-embedding-batcher"
+            )
+            # 查询向量缓存（进程内 LRU + 可选磁盘共享层）与入库切片向量缓存，按 provider + 模型区分
+            namespace = cache_namespace(self._embedding_provider, settings.EMBEDDING_MODEL)
+            self._query_cache = QueryEmbeddingCache(
+                namespace,
+                capacity=settings.EMBEDDING_QUERY_CACHE_SIZE,
+                directory=settings.EMBEDDING_CACHE_DIR or None,
+                max_rows=settings.EMBEDDING_CACHE_MAX_ROWS
+            )
+            self._document_cache = DocumentEmbeddingCache(
+                namespace,
+                directory=settings.EMBEDDING_CACHE_DIR or None,
+                max_rows=settings.DOC_EMBEDDING_CACHE_MAX_ROWS
+            )
             self._embedding_dim = self._get_embedding_dimension()
             print(f"✅ Embedding dimension: {self._embedding_dim}")
 
@@ -136,11 +166,21 @@ class MilvusVectorStore:
 
             print(f"✅ Collection created and indexed")
 
-    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """根据配置生成文档向量"""
+    def _embed_documents(self, texts: List[str]) -> Tuple[List[List[float]], np.ndarray]:
+        """
+        生成文档向量（已向量化过的切片文本从缓存读取，只计算未命中部分）
+
+        Returns:
+            (向量列表, 逐条是否命中缓存的 bool 数组)
+        """
         if not texts:
-            return []
+            return [], np.zeros(0, dtype=bool)
+
+        vectors, hit_mask = self._document_cache.embed(texts, self._encode_documents)
+        return vectors.tolist(), hit_mask
 
+    def _encode_documents(self, texts: List[str]) -> List[List[float]]:
+        """根据配置调用模型生成文档向量"""
         if self._embedding_provider == "local":
             return self._embedding_model.encode(
                 texts,
@@ -152,15 +192,32 @@ class MilvusVectorStore:
         return self._normalize_embeddings(embeddings)
 
     def _embed_query(self, query: str) -> List[float]:
-        """生成查询向量"""
+        """
+        生成查询向量
+
+        先查缓存；未命中时对归一化文本编码（经微批调度器与其它并发查询合并），
+        保证同一缓存键总是对应同一文本的向量
+        """
+        cached = self._query_cache.get(query)
+        if cached is not None:
+            return cached.tolist()
+
+        vector = self._query_batcher.embed(normalize_query(query))
+        self._query_cache.put(query, vector)
+        return vector
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """批量生成查询向量（微批调度器的编码函数）"""
         if self._embedding_provider == "local":
             return self._embedding_model.encode(
-                [query],
+                queries,
+                batch_size=len(queries),
                 normalize_embeddings=True
-            )[0].tolist()
+            ).tolist()
 
-        embedding = self._embedding_model.embed_query(query)
-        return self._normalize_embeddings([embedding])[0]
+        # OpenAI 兼容接口的 embed_query 等价于单条 embed_documents，合并为一次请求
+        embeddings = self._embedding_model.embed_documents(queries)
+        return self._normalize_embeddings(embeddings)
 
     @staticmethod
     def _normalize_embeddings(vectors: List[List[float]]) -> List[List[float]]:
@@ -183,12 +240,16 @@ class MilvusVectorStore:
 
     def add_documents(
         self,
-        documents: List[Dict[str, Any]],
+        documents: Iterable[Dict[str, Any]],
         document_id: UUID
     ) -> List[str]:
         """
         添加文档到 Milvus
 
+        按 MILVUS_INSERT_BATCH_SIZE 分批 embed + insert，同一时刻只持有一批向量；
+        documents 可以是生成器。写入后不立即 flush（新数据在增长段中即可检索），
+        由定时器合并刷盘。中途失败时删除本次已插入的向量。
+
         Args:
             documents: 文档列表，每个包含 content 和 metadata
             document_id: 文档 ID
@@ -196,10 +257,68 @@ class MilvusVectorStore:
         Returns:
             插入的向量 ID 列表
         """
-        if not documents:
-            return []
+        batch_size = max(1, settings.MILVUS_INSERT_BATCH_SIZE)
+        ids: List[str] = []
+        hits = 0
+        batch: List[Dict[str, Any]] = []
+
+        try:
+            for doc in documents:
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    hits += self._add_batch(batch, document_id, ids)
+                    batch = []
+
+            if batch:
+                hits += self._add_batch(batch, document_id, ids)
+        except Exception:
+            if ids:
+                self.delete_ids(ids)
+            raise
+
+        if ids:
+            self.finish_document(document_id, len(ids), hits)
+        return ids
+
+    def _add_batch(self, documents: List[Dict[str, Any]], document_id: UUID, ids: List[str]) -> int:
+        """embed 并插入一批切片，向量 ID 追加到 ids，返回缓存命中数"""
+        embeddings, hit_mask = self.embed_batch(documents)
+        ids.extend(self.insert_batch(documents, embeddings, document_id, offset=len(ids)))
+        return int(hit_mask.sum())
+
+    def embed_batch(self, documents: List[Dict[str, Any]]) -> Tuple[List[List[float]], np.ndarray]:
+        """
+        生成一批切片的向量（批内可混合多个文档的切片）
+
+        Returns:
+            (向量列表, 逐条是否命中缓存的 bool 数组)
+        """
+        contents = [doc.get('content', '')[:65535] for doc in documents]  # Milvus VARCHAR 限制
+        return self._embed_documents(contents)
 
-        # 准备数据
+    def insert_batch(
+        self,
+        documents: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        document_id: Optional[UUID] = None,
+        offset: int = 0,
+        id_suffix: str = ""
+    ) -> List[str]:
+        """
+        插入一批已生成向量的切片（不 flush）
+
+        切片 metadata 中带有 document_id / chunk_index 时以其为准，因此一批中可以混合多个文档
+
+        Args:
+            documents: 切片列表，每个包含 content 和 metadata
+            embeddings: embed_batch 生成的向量
+            document_id: 默认文档 ID
+            offset: 本批第一个切片在文档中的序号（metadata 无 chunk_index 时用于生成向量 ID）
+            id_suffix: 向量 ID 后缀（文档修订时避免与保留切片的向量 ID 冲突）
+
+        Returns:
+            插入的向量 ID 列表
+        """
         ids = []
         doc_ids = []
         chunk_indices = []
@@ -207,29 +326,26 @@ class MilvusVectorStore:
         page_numbers = []
         sources = []
         file_types = []
-        embeddings = []
 
-        for idx, doc in enumerate(documents):
+        for idx, doc in enumerate(documents, start=offset):
             content = doc.get('content', '')
             metadata = doc.get('metadata', {})
+            row_document_id = str(metadata.get('document_id') or document_id)
+            chunk_index = metadata.get('chunk_index', idx)
 
             # 生成唯一 ID
-            vector_id = f"{document_id}_{idx}"
+            vector_id = f"{row_document_id}_{chunk_index}{id_suffix}"
 
             ids.append(vector_id)
-            doc_ids.append(str(document_id))
-            chunk_indices.append(metadata.get('chunk_index', idx))
+            doc_ids.append(row_document_id)
+            chunk_indices.append(chunk_index)
             contents.append(content[:65535])  # Milvus VARCHAR 限制
             page_numbers.append(metadata.get('page', 0))
             sources.append(metadata.get('source', 'unknown')[:500])
             file_types.append(metadata.get('file_type', 'unknown')[:20])
 
-        # 批量生成 Embeddings
-        print(f"🔢 Generating embeddings for {len(contents)} chunks...")
-        embeddings = self._embed_documents(contents)
-
-        # 插入数据
-        data = [
+        print(f"💾 Inserting {len(ids)} chunks into Milvus...")
+        self._collection.insert([
             ids,
             doc_ids,
             chunk_indices,
@@ -238,14 +354,66 @@ class MilvusVectorStore:
             sources,
             file_types,
             embeddings
-        ]
+        ])
+        return ids
 
-        print(f"💾 Inserting {len(ids)} vectors into Milvus...")
-        self._collection.insert(data)
-        self._collection.flush()
+    def finish_document(self, document_id: UUID, count: int, hits: int):
+        """单个文档的全部批次写入完成：安排合并 flush 并记录缓存命中率"""
+        self._schedule_flush()
+        self._document_cache.record_document(str(document_id), count, hits)
+        print(f"✅ Inserted {count} vectors ({hits}/{count} embeddings reused from cache)")
 
-        print(f"✅ Inserted {len(ids)} vectors")
-        return ids
+    def delete_ids(self, ids: List[str], attempts: int = 3) -> bool:
+        """
+        删除指定向量（写入中途失败时回滚，或文档修订时删除消失的切片）
+
+        失败时退避重试；仍失败时记录残留的向量 ID 并返回 False（不抛出，调用方的回滚 / 提交流程继续）。
+        残留向量没有对应的切片行，不会出现在检索结果中
+
+        Returns:
+            是否删除成功
+        """
+        if not ids:
+            return True
+
+        id_strs = ", ".join(f'"{vector_id}"' for vector_id in ids)
+        for attempt in range(1, attempts + 1):
+            try:
+                self._collection.delete(f"id in [{id_strs}]")
+                return True
+            except Exception as e:
+                print(f"⚠️  Failed to delete {len(ids)} vectors (attempt {attempt}/{attempts}): {str(e)}")
+                if attempt < attempts:
+                    time.sleep(attempt)
+
+        print(f"❌ Orphaned vectors left in Milvus: {', '.join(ids)}")
+        return False
+
+    def _schedule_flush(self):
+        """合并刷盘：首次写入后 MILVUS_FLUSH_INTERVAL 秒内的所有写入共用一次 flush"""
+        interval = settings.MILVUS_FLUSH_INTERVAL
+        if interval <= 0:
+            return
+
+        with self._flush_lock:
+            if self._flush_timer is not None:
+                return
+            timer = threading.Timer(interval, self.flush)
+            timer.daemon = True
+            self._flush_timer = timer
+            timer.start()
+
+    def flush(self):
+        """立即刷盘并取消待执行的定时 flush（定时器与关闭时调用）"""
+        with self._flush_lock:
+            timer, self._flush_timer = self._flush_timer, None
+        if timer is not None:
+            timer.cancel()
+
+        try:
+            self._collection.flush()
+        except Exception as e:
+            print(f"⚠️  Milvus flush failed: {str(e)}")
 
     def search(
         self,
@@ -288,7 +456,7 @@ class MilvusVectorStore:
             param=search_params,
             limit=top_k * 2,  # 多检索一些，然后过滤
             expr=expr,
-            output_fields=["document_id", "content", "page_number", "source", "chunk_index"]
+            output_fields=["document_id", "content", "page_number", "source"]
         )
 
         # 格式化结果
@@ -302,13 +470,14 @@ class MilvusVectorStore:
                 if score < score_threshold:
                     continue
 
+                # chunk_index 在文档修订后可能已重排，由调用方按 vector_id 从切片表读取
                 formatted_results.append({
+                    "vector_id": hit.id,
                     "content": hit.entity.get("content"),
                     "metadata": {
                         "document_id": hit.entity.get("document_id"),
                         "source": hit.entity.get("source"),
                         "page": hit.entity.get("page_number"),
-                        "chunk_index": hit.entity.get("chunk_index"),
                         "score": float(score)
                     },
                     "score": float(score)
@@ -330,15 +499,31 @@ class MilvusVectorStore:
         Args:
             document_id: 文档 ID
         """
+        # 删除对检索立即可见，无需 flush
         expr = f'document_id == "{str(document_id)}"'
         self._collection.delete(expr)
-        self._collection.flush()
         print(f"🗑️  Deleted vectors for document: {document_id}")
 
+    def get_embedding_stats(self) -> Dict[str, Any]:
+        """查询向量微批调度与向量缓存指标（队列深度、批大小、命中率等）"""
+        return {
+            "query_batcher": self._query_batcher.stats(),
+            "query_cache": self._query_cache.stats(),
+            "document_cache": self._document_cache.stats(),
+        }
+
     def get_collection_count(self) -> int:
-        """获取向量库中的文档数量"""
-        self._collection.flush()
-        return self._collection.num_entities
+        """
+        获取向量库中的文档数量
+
+        count(*) 包含未刷盘的增长段且扣除已删除的向量，不触发 flush；
+        旧版本 Milvus 不支持时退回 num_entities（仅统计已刷盘数据）
+        """
+        try:
+            result = self._collection.query(expr="", output_fields=["count(*)"])
+            return int(result[0]["count(*)"])
+        except Exception:
+            return self._collection.num_entities
 
 
 # 全局实例
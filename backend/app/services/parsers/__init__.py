@@ -2,7 +2,7 @@
 文档解析器工厂
 """
 from pathlib import Path
-from typing import List
+from typing import Iterator, List
 
 from langchain_core.documents import Document
 
@@ -32,6 +32,26 @@ class ParserFactory:
         parser = self.parsers[file_ext]
         return parser.parse(file_path)
 
+    def iter_parse(self, file_path: Path) -> Iterator[Document]:
+        """
+        流式解析：支持逐页解析的解析器（PDF）每页产出一次，其余一次性产出
+        """
+        file_ext = file_path.suffix.lower()
+
+        if file_ext not in self.parsers:
+            raise ValueError(f"Unsupported file type: {file_ext}")
+
+        parser = self.parsers[file_ext]
+        if hasattr(parser, "iter_parse"):
+            return parser.iter_parse(file_path)
+        return iter(parser.parse(file_path))
+
+    def shutdown(self):
+        """释放解析器持有的进程池"""
+        for parser in self.parsers.values():
+            if hasattr(parser, "shutdown"):
+                parser.shutdown()
+
 
 # 全局实例
 parser_factory = ParserFactory()
@@ -1,32 +1,74 @@
 """
 PDF 解析器（基于 PyMuPDF）
 """
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Deque, Iterator, List, Optional, Tuple
+import multiprocessing
+import os
+import threading
 
 import fitz  # PyMuPDF
 from langchain_core.documents import Document
 
+from app.config import settings
+
+
+def _extract_pages(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """子进程任务：独立打开 PDF，提取 [start, end) 页的文本，返回 (页码, 文本)"""
+    pdf_document = fitz.open(file_path)
+    try:
+        return [(page_num, pdf_document[page_num].get_text()) for page_num in range(start, end)]
+    finally:
+        pdf_document.close()
+
 
 class PDFParser:
-    """PDF 文档解析器"""
+    """
+    PDF 文档解析器
+
+    页数不少于 PDF_PARSE_MIN_PAGES 时按 PDF_PARSE_SLICE_PAGES 页切分给进程池并行提取
+    （每个工作进程独立打开文件），结果按页序产出；进程池在首次使用时创建并在各文档间复用。
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        min_pages: Optional[int] = None,
+        slice_pages: Optional[int] = None
+    ):
+        workers = settings.PDF_PARSE_WORKERS if workers is None else workers
+        self.workers = workers or os.cpu_count() or 1
+        self.min_pages = settings.PDF_PARSE_MIN_PAGES if min_pages is None else min_pages
+        self.slice_pages = max(1, slice_pages or settings.PDF_PARSE_SLICE_PAGES)
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
 
     def parse(self, file_path: Path) -> List[Document]:
         """
         解析 PDF 文档为 LangChain Document 列表。
         """
-        documents: List[Document] = []
+        return list(self.iter_parse(file_path))
 
-        # 打开 PDF 文件
+    def iter_parse(self, file_path: Path) -> Iterator[Document]:
+        """
+        逐页解析 PDF，每解析完一页立即产出（流水线入库时下游无需等待整个文档）。
+        """
+        # 打开 PDF 文件（只读取页数，大文件的正文交给进程池提取）
         pdf_document = fitz.open(str(file_path))
 
         try:
-            for page_num in range(len(pdf_document)):
-                page = pdf_document[page_num]
-
-                # 提取文本
-                text = page.get_text()
+            total_pages = len(pdf_document)
+            if self.workers > 1 and total_pages >= max(self.min_pages, 2):
+                pdf_document.close()
+                pdf_document = None
+                pages = self._iter_pages_parallel(file_path, total_pages)
+            else:
+                pages = ((page_num, pdf_document[page_num].get_text()) for page_num in range(total_pages))
 
+            for page_num, text in pages:
                 # 跳过空白页
                 if not text.strip():
                     continue
@@ -35,19 +77,64 @@ class PDFParser:
                 metadata = {
                     "source": str(file_path.name),
                     "page": page_num + 1,
-                    "total_pages": len(pdf_document),
+                    "total_pages": total_pages,
                     "file_type": "pdf",
                 }
 
                 # 创建 Document 对象
-                documents.append(
-                    Document(
-                        page_content=text,
-                        metadata=metadata,
-                    )
+                yield Document(
+                    page_content=text,
+                    metadata=metadata,
                 )
 
         finally:
-            pdf_document.close()
+            if pdf_document is not None:
+                pdf_document.close()
+
+    def _iter_pages_parallel(self, file_path: Path, total_pages: int) -> Iterator[Tuple[int, str]]:
+        """
+        将页码区间切片提交给进程池，按页序产出 (页码, 文本)
+
+        同时在途的切片数为工作进程数的两倍：下游消费慢时不会把整个文档的文本堆积在内存中；
+        生成器提前关闭（流水线中止）时取消尚未开始的切片。
+        """
+        pool = self._get_pool()
+        slices = iter(range(0, total_pages, self.slice_pages))
+        pending: Deque[Future] = deque()
+
+        def submit_next() -> bool:
+            start = next(slices, None)
+            if start is None:
+                return False
+            end = min(start + self.slice_pages, total_pages)
+            pending.append(pool.submit(_extract_pages, str(file_path), start, end))
+            return True
+
+        try:
+            while len(pending) < self.workers * 2 and submit_next():
+                pass
+
+            while pending:
+                pages = pending.popleft().result()
+                submit_next()
+                yield from pages
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # 使用 spawn，避免 fork 继承 gRPC / 数据库连接等线程状态
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
 
-        return documents
+    def shutdown(self):
+        """关闭解析进程池"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,160 @@
+"""
+入库进度发布 / 订阅（进程内）
+处理流水线（线程池 / 事件循环）发布文档的细粒度进度快照，SSE 订阅者按最新快照推送；
+快照只保存在内存中，数据库只在阶段切换时写入
+"""
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+import asyncio
+import threading
+import time
+
+
+# 终态：completed，或不再重试的 failed（final=True）
+def is_terminal(snapshot: Dict[str, Any]) -> bool:
+    return snapshot.get("status") == "completed" or (
+        snapshot.get("status") == "failed" and snapshot.get("final", False)
+    )
+
+
+class ProgressBus:
+    """
+    进度总线
+
+    - publish 线程安全：合并进该文档的最新快照（version 递增），并唤醒订阅者
+    - 订阅者只关心最新状态，不排队：被唤醒后读取快照，中间被覆盖的进度直接跳过
+    - 最多保留 max_documents 个文档的快照（按最近更新淘汰）
+    - 本进程发布的字段同时交给 listeners（progress_relay 经 NOTIFY 转发给其它进程）
+    """
+
+    def __init__(self, max_documents: int = 10000):
+        self.max_documents = max_documents
+        self._lock = threading.Lock()
+        self._snapshots: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+
+    def add_listener(self, listener: Callable[[str, Dict[str, Any]], None]):
+        """注册发布监听（listener(document_id, fields) 在发布线程中调用，不应阻塞）"""
+        self._listeners.append(listener)
+
+    def publish(self, document_id: UUID, **fields: Any):
+        """合并发布进度字段（status / stage / progress / pages_parsed / chunks_embedded 等）"""
+        self.receive(document_id, fields)
+        for listener in self._listeners:
+            listener(str(document_id), fields)
+
+    def receive(self, document_id: UUID, fields: Dict[str, Any]):
+        """合并进度字段并唤醒订阅者（不交给 listeners，用于接收其它进程转发的进度）"""
+        key = str(document_id)
+        with self._lock:
+            snapshot = self._snapshots.pop(key, None) or {"document_id": key, "version": 0}
+            if "status" in fields:
+                # 状态变化时清除上一状态附带的字段（如重试前的 final / error_message）
+                snapshot.pop("final", None)
+                snapshot.pop("error_message", None)
+            snapshot.update(fields)
+            snapshot["version"] += 1
+            snapshot["updated_at"] = time.time()
+            self._snapshots[key] = snapshot
+            while len(self._snapshots) > self.max_documents:
+                self._snapshots.popitem(last=False)
+            subscribers = list(self._subscribers.get(key, ()))
+
+        for loop, event in subscribers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # 订阅者所在的事件循环已关闭
+                pass
+
+    def version(self, document_id: UUID) -> int:
+        """文档快照当前的版本号（无快照时为 0）"""
+        with self._lock:
+            snapshot = self._snapshots.get(str(document_id))
+            return snapshot["version"] if snapshot is not None else 0
+
+    def publish_pipeline(self, pipeline):
+        """
+        发布入库流水线中未完成文档的进度
+
+        单文档流水线附带页数与各阶段切片数；多文档流水线的阶段计数跨文档，只发布各文档已写入的切片数
+        """
+        fields = {
+            "status": "processing",
+            "current_stage": pipeline.stage,
+            "processing_progress": pipeline.progress,
+        }
+        if len(pipeline.documents) == 1:
+            fields.update(
+                pages_parsed=pipeline.pages_parsed,
+                total_pages=pipeline.total_pages,
+                chunks_split=pipeline.chunks_split,
+                chunks_embedded=pipeline.chunks_embedded,
+            )
+
+        for document_id, progress in pipeline.documents.items():
+            if not progress.completed and progress.error is None:
+                self.publish(document_id, chunks_stored=progress.chunks, **fields)
+
+    def snapshot(self, document_id: UUID) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            snapshot = self._snapshots.get(str(document_id))
+            return dict(snapshot) if snapshot is not None else None
+
+    def discard(self, document_id: UUID):
+        """文档删除后丢弃快照"""
+        with self._lock:
+            self._snapshots.pop(str(document_id), None)
+
+    async def subscribe(
+        self,
+        document_id: UUID,
+        timeout: float,
+        since_version: int = 0
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        订阅文档进度：先产出当前快照（如有且 version > since_version），之后每次更新产出最新快照，终态后结束
+
+        timeout 秒内没有更新时产出 None（调用方可借此发送心跳或回查数据库）
+        """
+        key = str(document_id)
+        event = asyncio.Event()
+        entry = (asyncio.get_running_loop(), event)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(entry)
+
+        try:
+            version = since_version
+            while True:
+                snapshot = self.snapshot(document_id)
+                if snapshot is not None and snapshot["version"] != version:
+                    version = snapshot["version"]
+                    yield snapshot
+                    if is_terminal(snapshot):
+                        return
+
+                try:
+                    await asyncio.wait_for(event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    yield None
+                event.clear()
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(key)
+                if subscribers is not None:
+                    subscribers.discard(entry)
+                    if not subscribers:
+                        del self._subscribers[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self._snapshots),
+                "subscribers": sum(len(entries) for entries in self._subscribers.values()),
+            }
+
+
+# 全局实例
+progress_bus = ProgressBus()
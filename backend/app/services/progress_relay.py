@@ -0,0 +1,181 @@
+"""
+入库进度跨进程转发（PostgreSQL LISTEN / NOTIFY）
+progress_bus 只在进程内有效；入库 worker 运行在独立进程（INGEST_WORKERS_IN_API=false）或 API 多进程部署时：
+- 发送端（运行 worker 的进程）：监听 progress_bus 的发布，合并同一文档的连续更新后 pg_notify
+- 接收端（API 进程）：LISTEN 同一频道，把收到的进度并入本进程的 progress_bus，SSE 订阅者随即收到推送
+消息带发送端标识，接收端忽略本进程发出的消息；连接断开期间丢失的进度由进度流的数据库回查兜底
+"""
+from collections import OrderedDict
+from typing import Any, Dict
+import json
+import select
+import threading
+import uuid
+
+from app.config import settings
+from app.database import engine
+from app.services.progress_bus import ProgressBus, progress_bus
+
+
+# NOTIFY 频道
+CHANNEL = "ingest_progress"
+
+# NOTIFY 负载上限为 8000 字节，错误信息截断到该长度
+MAX_ERROR_LENGTH = 2000
+
+# 连接失败后的重连间隔（秒）
+RECONNECT_DELAY = 5.0
+
+
+class ProgressRelay:
+    """进度转发（发送端与接收端各占一个独立的数据库连接与线程）"""
+
+    def __init__(self, bus: ProgressBus):
+        self.bus = bus
+        self.origin = uuid.uuid4().hex
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: Dict[str, threading.Thread] = {}
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.INGEST_PROGRESS_RELAY and engine.dialect.name == "postgresql"
+
+    def start_sender(self):
+        """将本进程发布的进度转发给其它进程"""
+        if self.enabled and "send" not in self._threads:
+            self.bus.add_listener(self._enqueue)
+            self._start("send", self._send_loop)
+
+    def start_listener(self):
+        """接收其它进程转发的进度"""
+        if self.enabled and "listen" not in self._threads:
+            self._start("listen", self._listen_loop)
+
+    def stop(self):
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        for thread in self._threads.values():
+            thread.join(timeout=RECONNECT_DELAY)
+        self._threads.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "running": sorted(self._threads),
+            "sent": self.sent,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+    def _start(self, name: str, target):
+        self._stop.clear()
+        thread = threading.Thread(target=target, name=f"progress-relay-{name}", daemon=True)
+        self._threads[name] = thread
+        thread.start()
+
+    def _enqueue(self, document_id: str, fields: Dict[str, Any]):
+        """（发布线程中）合并到待发送的更新，与 ProgressBus 的合并规则一致"""
+        with self._condition:
+            pending = self._pending.setdefault(document_id, {})
+            if "status" in fields:
+                pending.pop("final", None)
+                pending.pop("error_message", None)
+            pending.update(fields)
+            self._condition.notify()
+
+    def _send_loop(self):
+        connection = None
+        while not self._stop.is_set():
+            with self._condition:
+                while not self._pending and not self._stop.is_set():
+                    self._condition.wait()
+                pending, self._pending = self._pending, OrderedDict()
+            if not pending:
+                continue
+
+            try:
+                if connection is None:
+                    connection = self._connect()
+                cursor = connection.cursor()
+                try:
+                    for document_id, fields in pending.items():
+                        cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, self._encode(document_id, fields)))
+                finally:
+                    cursor.close()
+                self.sent += len(pending)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️  Failed to relay ingestion progress: {str(e)}")
+                connection = self._close(connection)
+                self._stop.wait(RECONNECT_DELAY)
+
+        self._close(connection)
+
+    def _listen_loop(self):
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                dbapi_connection = connection.dbapi_connection
+                cursor = connection.cursor()
+                cursor.execute(f"LISTEN {CHANNEL}")
+                cursor.close()
+
+                while not self._stop.is_set():
+                    if not select.select([dbapi_connection], [], [], 1.0)[0]:
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        self._receive(dbapi_connection.notifies.pop(0).payload)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️  Progress relay listener disconnected: {str(e)}")
+            finally:
+                self._close(connection)
+            self._stop.wait(RECONNECT_DELAY)
+
+    def _receive(self, payload: str):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if message.get("origin") == self.origin:
+            return
+        self.bus.receive(message["document_id"], message["fields"])
+        self.received += 1
+
+    def _encode(self, document_id: str, fields: Dict[str, Any]) -> str:
+        if isinstance(fields.get("error_message"), str):
+            fields = {**fields, "error_message": fields["error_message"][:MAX_ERROR_LENGTH]}
+        return json.dumps(
+            {"origin": self.origin, "document_id": document_id, "fields": fields},
+            ensure_ascii=False,
+            default=str
+        )
+
+    @staticmethod
+    def _connect():
+        """独立的自动提交连接（从连接池分离，关闭时直接断开）"""
+        connection = engine.raw_connection()
+        connection.detach()
+        connection.dbapi_connection.autocommit = True
+        return connection
+
+    @staticmethod
+    def _close(connection):
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        return None
+
+
+# 全局实例
+progress_relay = ProgressRelay(progress_bus)
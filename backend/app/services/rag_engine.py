@@ -74,8 +74,8 @@ class RAGEngine:
             流式事件: {"type": "citations|token|done|error", "data": ...}
         """
         try:
-            # Step 1: 混合检索（向量 + BM25）
-            search_results = hybrid_retriever.hybrid_search(
+            # Step 1: 混合检索（向量 + BM25 并发执行，不阻塞事件循环）
+            search_results = await hybrid_retriever.ahybrid_search(
                 query=question,
                 top_k=top_k,
                 score_threshold=score_threshold,
@@ -26,7 +26,7 @@ class RetrievalInput(BaseModel):
 
 
 @tool(args_schema=RetrievalInput)
-def search_knowledge_base(
+async def search_knowledge_base(
     query: str,
     top_k: int = 5,
     document_ids: Optional[List[str]] = None
@@ -54,8 +54,8 @@ def search_knowledge_base(
         if document_ids:
             doc_uuids = [UUID(doc_id) for doc_id in document_ids]
 
-        # 执行混合检索
-        results = hybrid_retriever.hybrid_search(
+        # 执行混合检索（向量与 BM25 并发，不阻塞事件循环）
+        results = await hybrid_retriever.ahybrid_search(
             query=query,
             top_k=top_k,
             score_threshold=settings.SIMILARITY_THRESHOLD,
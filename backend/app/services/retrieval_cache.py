@@ -0,0 +1,194 @@
+"""
+检索结果缓存
+在 HybridRetriever.hybrid_search 之前的有界 LRU/TTL 缓存，按文档范围精确失效
+"""
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+from collections import OrderedDict
+import copy
+import re
+import threading
+import time
+import unicodedata
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """查询归一化：NFKC（全角转半角等）+ 合并空白"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", query)).strip()
+
+
+class RetrievalCache:
+    """
+    检索结果缓存
+
+    - 键：(归一化查询, 排序后的 document_ids, top_k, alpha, score_threshold)
+    - 容量满时淘汰最久未使用的条目，超过 TTL 的条目在读取时丢弃
+    - 为每个文档维护引用它的缓存键；文档变化时只失效范围内包含该文档的条目，
+      不限范围（全库）的条目在任何文档变化时都失效
+    - 失效代数（generation）：检索开始后发生过失效，则该次结果不写入缓存，
+      避免并发入库期间把旧结果写回
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0):
+        """
+        Args:
+            max_entries: 最大条目数，0 表示禁用缓存
+            ttl: 条目有效期（秒），0 表示不过期
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        # key -> (expires_at, results)
+        self._entries: "OrderedDict[Hashable, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        # document_id -> 范围包含该文档的缓存键
+        self._document_keys: Dict[str, Set[Hashable]] = {}
+        # 不限文档范围的缓存键
+        self._global_keys: Set[Hashable] = set()
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(
+        query: str,
+        document_ids: Optional[Iterable[Any]],
+        top_k: int,
+        alpha: float,
+        score_threshold: float
+    ) -> Tuple:
+        """构造缓存键（document_ids 为空表示全库）"""
+        scope = tuple(sorted({str(doc_id) for doc_id in document_ids})) if document_ids else None
+        return (normalize_query(query), scope, top_k, float(alpha), float(score_threshold))
+
+    @property
+    def generation(self) -> int:
+        """当前失效代数，检索开始前读取，写入时传回 put"""
+        return self._generation
+
+    def get(self, key: Tuple) -> Optional[List[Dict[str, Any]]]:
+        """读取缓存（返回副本，调用方可自由修改）"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and entry[0] < time.monotonic():
+                self._drop(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            results = entry[1]
+
+        return copy.deepcopy(results)
+
+    def put(self, key: Tuple, results: List[Dict[str, Any]], generation: int):
+        """
+        写入缓存
+
+        Args:
+            key: make_key 生成的键
+            results: 检索结果
+            generation: 检索开始前的失效代数，与当前不一致时放弃写入
+        """
+        if not self.enabled:
+            return
+
+        results = copy.deepcopy(results)
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0.0
+
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            if key in self._entries:
+                self._drop(key)
+
+            self._entries[key] = (expires_at, results)
+            scope = key[1]
+            if scope is None:
+                self._global_keys.add(key)
+            else:
+                for document_id in scope:
+                    self._document_keys.setdefault(document_id, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate_documents(self, document_ids: Iterable[Any]) -> int:
+        """
+        文档新增 / 更新 / 删除后失效相关条目
+
+        Returns:
+            失效的条目数
+        """
+        with self._lock:
+            self._generation += 1
+
+            keys = set(self._global_keys)
+            for document_id in document_ids:
+                keys |= self._document_keys.get(str(document_id), set())
+
+            for key in keys:
+                self._drop(key)
+
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        """清空缓存（索引全量重建后调用）"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._document_keys.clear()
+            self._global_keys.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计，用于容量调优"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, key: Hashable):
+        """删除条目及其文档索引（调用方持有锁）"""
+        if self._entries.pop(key, None) is None:
+            return
+
+        scope = key[1]
+        if scope is None:
+            self._global_keys.discard(key)
+            return
+
+        for document_id in scope:
+            keys = self._document_keys.get(document_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._document_keys[document_id]
@@ -0,0 +1,186 @@
+"""
+线性文本切片器
+与 LangChain RecursiveCharacterTextSplitter（keep_separator=True、strip_whitespace=True、length_function=len）
+的切片结果一致，但全程只处理偏移量：
+- 单字符分隔符的边界在整段文本的码点数组上一次向量化求出，按区间二分查找，不再对子串反复 re.search / re.split
+- 合并阶段用下标窗口代替列表切片（原实现每弹出一个片段复制一次列表，逐字符切分时为平方复杂度）
+- 输出每个切片在原文中的 [start_char, end_char)
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import copy
+import re
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+# 分隔符优先级：段落 → 换行 → 中文句末标点 → 英文句末标点 → 空格 → 逐字符
+DEFAULT_SEPARATORS = ["\n\n", "\n", "。", "！", "？", ".", "!", "?", " ", ""]
+
+
+class LinearTextSplitter:
+    """按分隔符优先级切片（CHUNK_SIZE / CHUNK_OVERLAP 语义与 RecursiveCharacterTextSplitter 相同）"""
+
+    def __init__(
+        self,
+        chunk_size: int,
+        chunk_overlap: int,
+        separators: Optional[Sequence[str]] = None
+    ):
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                f"Got a larger chunk overlap ({chunk_overlap}) than chunk size ({chunk_size})"
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators or DEFAULT_SEPARATORS)
+        self._patterns = [re.compile(re.escape(separator)) for separator in self.separators]
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        """切分 Document，切片 metadata 复制自原文档并补充 start_char / end_char（相对原文档正文）"""
+        chunks = []
+        for document in documents:
+            text = document.page_content
+            for start, end in self.split_offsets(text):
+                metadata = copy.deepcopy(document.metadata)
+                metadata["start_char"] = start
+                metadata["end_char"] = end
+                chunks.append(Document(page_content=text[start:end], metadata=metadata))
+        return chunks
+
+    def split_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.split_offsets(text)]
+
+    def split_offsets(self, text: str) -> List[Tuple[int, int]]:
+        """返回各切片在 text 中的 [start, end) 偏移"""
+        chunks: List[Tuple[int, int]] = []
+        if text:
+            _Boundaries(text, self.separators, self._patterns).split(self, 0, len(text), 0, chunks)
+        return chunks
+
+    def _merge(self, text: str, bounds: List[int], lo: int, hi: int, chunks: List[Tuple[int, int]]):
+        """
+        将连续的小片段 [bounds[i], bounds[i+1])（lo <= i < hi）贪心合并为不超过 chunk_size 的切片，
+        相邻切片保留不超过 chunk_overlap 的重叠
+
+        与 TextSplitter._merge_splits（分隔符已保留在片段中，拼接符为空串）逐步等价
+        """
+        size, overlap = self.chunk_size, self.chunk_overlap
+        first = lo
+        total = 0
+        for index in range(lo, hi):
+            length = bounds[index + 1] - bounds[index]
+            if total + length > size and index > first:
+                self._emit(text, bounds[first], bounds[index], chunks)
+                while total > overlap or (total + length > size and total > 0):
+                    total -= bounds[first + 1] - bounds[first]
+                    first += 1
+            total += length
+        if first < hi:
+            self._emit(text, bounds[first], bounds[hi], chunks)
+
+    def _merge_chars(self, text: str, start: int, end: int, chunks: List[Tuple[int, int]]):
+        """
+        逐字符切分时的合并：片段长度均为 1，_merge 的结果是步长 chunk_size - 重叠 的定长窗口，直接按窗口计算
+        """
+        size = self.chunk_size
+        step = size - min(self.chunk_overlap, size - 1)
+        while start + size < end:
+            self._emit(text, start, start + size, chunks)
+            start += step
+        self._emit(text, start, end, chunks)
+
+    @staticmethod
+    def _emit(text: str, start: int, end: int, chunks: List[Tuple[int, int]]):
+        """去掉首尾空白后记录切片（全为空白时丢弃）"""
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            chunks.append((start, end))
+
+
+class _Boundaries:
+    """单段文本的分隔符边界（单字符分隔符首次用到时整段一次性求出）"""
+
+    def __init__(self, text: str, separators: List[str], patterns: List[re.Pattern]):
+        self.text = text
+        self.separators = separators
+        self.patterns = patterns
+        self._codepoints: Optional[np.ndarray] = None
+        self._positions: Dict[int, np.ndarray] = {}
+
+    def split(self, splitter: LinearTextSplitter, start: int, end: int, level: int, chunks: List[Tuple[int, int]]):
+        """切分区间 [start, end)：选用区间内存在的最高优先级分隔符，过长的片段用后续分隔符继续切分"""
+        separators = self.separators
+        chosen, next_level = len(separators) - 1, len(separators)
+        for index in range(level, len(separators)):
+            if not separators[index]:
+                chosen = index
+                break
+            if self._contains(index, start, end):
+                chosen, next_level = index, index + 1
+                break
+
+        size = splitter.chunk_size
+        if not separators[chosen] and size > 1:
+            # 逐字符切分：每个字符都是小片段
+            splitter._merge_chars(self.text, start, end, chunks)
+            return
+
+        bounds = self._bounds(chosen, start, end)
+        run = 0
+        for index in range(len(bounds) - 1):
+            if bounds[index + 1] - bounds[index] < size:
+                continue
+
+            # 过长的片段：先合并之前积累的小片段，再用后续分隔符切分（或原样保留）
+            if run < index:
+                splitter._merge(self.text, bounds, run, index, chunks)
+            if next_level >= len(separators):
+                chunks.append((bounds[index], bounds[index + 1]))
+            else:
+                self.split(splitter, bounds[index], bounds[index + 1], next_level, chunks)
+            run = index + 1
+
+        if run < len(bounds) - 1:
+            splitter._merge(self.text, bounds, run, len(bounds) - 1, chunks)
+
+    def _contains(self, index: int, start: int, end: int) -> bool:
+        separator = self.separators[index]
+        if len(separator) > 1:
+            return self.patterns[index].search(self.text, start, end) is not None
+        positions = self._single_positions(index)
+        found = int(np.searchsorted(positions, start))
+        return found < len(positions) and positions[found] < end
+
+    def _bounds(self, index: int, start: int, end: int) -> List[int]:
+        """
+        按分隔符切开区间，返回片段边界（片段 i 为 [bounds[i], bounds[i+1])）；
+        分隔符保留在其后片段的开头，区间以分隔符开头时不产生空片段
+        """
+        separator = self.separators[index]
+        if not separator:
+            return list(range(start, end + 1))
+
+        if len(separator) > 1:
+            # 多字符分隔符可能自身重叠（如连续换行），需在区间内重新匹配以保持与 re.split 一致
+            cuts = [match.start() for match in self.patterns[index].finditer(self.text, start, end)]
+        else:
+            positions = self._single_positions(index)
+            lo, hi = np.searchsorted(positions, (start, end))
+            cuts = positions[lo:hi].tolist()
+
+        if cuts and cuts[0] == start:
+            return [*cuts, end]
+        return [start, *cuts, end]
+
+    def _single_positions(self, index: int) -> np.ndarray:
+        positions = self._positions.get(index)
+        if positions is None:
+            if self._codepoints is None:
+                self._codepoints = np.frombuffer(self.text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+            positions = np.flatnonzero(self._codepoints == ord(self.separators[index]))
+            self._positions[index] = positions
+        return positions
@@ -0,0 +1,327 @@
+"""
+上传流式接收
+直接解析 multipart 请求体，按块写入目标文件，同一遍内：
+- 超过 MAX_FILE_SIZE 立即中止（不必先接收完整个请求体）
+- 计算 sha256
+- 按文件内容识别类型（PDF 文件头 / UTF-8 文本），与扩展名不符时拒绝
+请求体不再先落入 UploadFile 的临时文件再复制一次；写盘、哈希与编码校验在线程池中执行，不阻塞事件循环。
+服务器本地文件的批量导入使用同一写入器（copy_file），校验与哈希规则一致
+"""
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+import codecs
+import hashlib
+import uuid
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import settings
+
+
+# 每次写盘的块大小（请求体分片在内存中累积到该大小再交给线程池）
+WRITE_BLOCK_SIZE = 1024 * 1024
+
+# 识别类型时检查的文件头长度（PDF 规范允许文件头前有少量字节）
+SNIFF_SIZE = 1024
+
+# multipart 边界与分段头的余量（按 Content-Length 提前拒绝时使用）
+MULTIPART_OVERHEAD = 64 * 1024
+
+# 扩展名对应的内容类型
+CONTENT_TYPES = {".pdf": "pdf", ".txt": "text", ".md": "text"}
+
+
+class UploadRejected(Exception):
+    """上传的文件被拒绝（类型不支持、过大或内容与扩展名不符）"""
+
+    def __init__(self, status_code: int, detail: str, filename: str = ""):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.filename = filename
+
+
+class ReceivedFile:
+    """已写入磁盘的上传文件"""
+
+    def __init__(self, file_id: uuid.UUID, filename: str, extension: str, path: Path, size: int, content_hash: str):
+        self.id = file_id
+        self.filename = filename
+        self.extension = extension
+        self.path = path
+        self.size = size
+        self.content_hash = content_hash
+
+    @property
+    def file_type(self) -> str:
+        return self.extension.lstrip('.')
+
+
+class UploadWriter:
+    """单个文件的写入：大小限制、sha256 与内容类型识别"""
+
+    def __init__(self, filename: str, directory: Path, max_size: int, extensions: List[str]):
+        self.filename = filename
+        self.extension = Path(filename).suffix.lower()
+        if self.extension not in extensions:
+            raise UploadRejected(400, f"Unsupported file type. Allowed: {extensions}", filename)
+
+        self.id = uuid.uuid4()
+        self.path = directory / f"{self.id}{self.extension}"
+        self.max_size = max_size
+        self.size = 0
+        self._expected = CONTENT_TYPES.get(self.extension)
+        self._digest = hashlib.sha256()
+        self._decoder = codecs.getincrementaldecoder("utf-8")() if self._expected == "text" else None
+        self._head = b""
+        self._pending = bytearray()
+        self._file = None
+
+    async def write(self, data: bytes):
+        self._count(len(data))
+        self._pending += data
+        if len(self._pending) >= WRITE_BLOCK_SIZE:
+            await self._flush()
+
+    async def close(self) -> ReceivedFile:
+        """写入剩余数据并校验内容类型"""
+        await self._flush(final=True)
+        await run_in_threadpool(self._close_file)
+        return self._received()
+
+    def copy_from(self, source: BinaryIO) -> ReceivedFile:
+        """（阻塞）从文件对象分块复制，校验规则与流式接收相同；失败时删除已写入的部分"""
+        try:
+            while True:
+                block = source.read(WRITE_BLOCK_SIZE)
+                self._count(len(block))
+                self._write_block(block, not block)
+                if not block:
+                    break
+            self._close_file()
+        except BaseException:
+            self._discard()
+            raise
+        return self._received()
+
+    def _count(self, size: int):
+        self.size += size
+        if self.size > self.max_size:
+            raise UploadRejected(
+                413, f"File too large. Max size: {self.max_size / 1024 / 1024}MB", self.filename
+            )
+
+    def _received(self) -> ReceivedFile:
+        return ReceivedFile(self.id, self.filename, self.extension, self.path, self.size, self._digest.hexdigest())
+
+    async def discard(self):
+        """丢弃已写入的部分"""
+        await run_in_threadpool(self._discard)
+
+    async def _flush(self, final: bool = False):
+        if not self._pending and not final:
+            return
+        block = bytes(self._pending)
+        self._pending.clear()
+        await run_in_threadpool(self._write_block, block, final)
+
+    def _write_block(self, block: bytes, final: bool):
+        """（线程池中）哈希、类型识别并写盘"""
+        if len(self._head) < SNIFF_SIZE:
+            self._head += block[:SNIFF_SIZE - len(self._head)]
+            if self._expected == "pdf" and (len(self._head) >= SNIFF_SIZE or final) and b"%PDF-" not in self._head:
+                self._mismatch()
+
+        if self._decoder is not None:
+            try:
+                self._decoder.decode(block, final)
+            except UnicodeDecodeError:
+                self._mismatch()
+
+        self._digest.update(block)
+        if self._file is None:
+            self._file = self.path.open("wb")
+        self._file.write(block)
+
+    def _mismatch(self):
+        expected = "a PDF document" if self._expected == "pdf" else "UTF-8 text"
+        raise UploadRejected(400, f"File content does not match extension: expected {expected}", self.filename)
+
+    def _close_file(self):
+        if self._file is None:
+            self._file = self.path.open("wb")
+        self._file.close()
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+async def receive_uploads(
+    request: Request,
+    directory: Path,
+    field: str,
+    max_files: Optional[int] = None,
+    abort_on_reject: bool = True,
+    max_size: Optional[int] = None,
+    extensions: Optional[List[str]] = None
+) -> Tuple[List[ReceivedFile], List[UploadRejected]]:
+    """
+    从 multipart 请求体中接收字段 field 的文件，边接收边写入 directory
+
+    Args:
+        request: 请求（请求体尚未读取）
+        directory: 保存目录（文件名为 {uuid}{扩展名}）
+        field: 表单字段名
+        max_files: 最多接收的文件数（单文件上传时为 1，超出时拒绝）
+        abort_on_reject: 文件被拒绝时中止整个请求（删除已写入的文件并抛出 UploadRejected）；
+            否则跳过该文件剩余的数据，记入返回的拒绝列表
+        max_size: 单个文件大小上限（默认 MAX_FILE_SIZE）
+        extensions: 允许的扩展名（默认 ALLOWED_EXTENSIONS）
+
+    Returns:
+        (已保存的文件, 被拒绝的文件)
+    """
+    max_size = max_size or settings.MAX_FILE_SIZE
+    extensions = extensions or settings.ALLOWED_EXTENSIONS
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadRejected(400, "Expected multipart/form-data")
+
+    # 声明的请求体已超过上限时直接拒绝，不读取
+    content_length = request.headers.get("content-length")
+    if abort_on_reject and max_files and content_length and content_length.isdigit():
+        if int(content_length) > max_size * max_files + MULTIPART_OVERHEAD:
+            raise UploadRejected(413, f"File too large. Max size: {max_size / 1024 / 1024}MB")
+
+    directory.mkdir(parents=True, exist_ok=True)
+
+    # 解析器的回调是同步的：先记录事件，每写入一个请求体分片后再异步处理
+    events: List[Tuple[str, bytes]] = []
+    header: Dict[str, bytes] = {"field": b"", "value": b""}
+    headers: Dict[bytes, bytes] = {}
+
+    def on_header_field(data, start, end):
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        headers[header["field"].lower()] = header["value"]
+        header["field"] = header["value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        if options.get(b"name", b"").decode("utf-8", "replace") == field and b"filename" in options:
+            events.append(("begin", options[b"filename"]))
+        headers.clear()
+
+    def on_part_data(data, start, end):
+        events.append(("data", bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(("end", b""))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    received: List[ReceivedFile] = []
+    rejected: List[UploadRejected] = []
+    writer: Optional[UploadWriter] = None
+    skipping = False
+
+    async def reject(error: UploadRejected):
+        nonlocal writer, skipping
+        if writer is not None:
+            await writer.discard()
+            writer = None
+        if abort_on_reject:
+            raise error
+        rejected.append(error)
+        skipping = True
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, data in events:
+                if kind == "begin":
+                    skipping = False
+                    filename = data.decode("utf-8", "replace")
+                    try:
+                        if max_files is not None and len(received) >= max_files:
+                            raise UploadRejected(400, f"Too many files. Max: {max_files}", filename)
+                        writer = UploadWriter(filename, directory, max_size, extensions)
+                    except UploadRejected as e:
+                        await reject(e)
+                elif kind == "data":
+                    if writer is not None and not skipping:
+                        try:
+                            await writer.write(data)
+                        except UploadRejected as e:
+                            await reject(e)
+                elif kind == "end":
+                    if writer is not None:
+                        try:
+                            received.append(await writer.close())
+                        except UploadRejected as e:
+                            await reject(e)
+                        writer = None
+                    skipping = False
+            events.clear()
+        parser.finalize()
+    except BaseException:
+        # 中止（含客户端断开）：清理已写入的文件
+        if writer is not None:
+            await writer.discard()
+        for item in received:
+            await run_in_threadpool(_unlink, item.path)
+        raise
+
+    if writer is not None:
+        # 请求体在分段中途结束
+        await writer.discard()
+        raise UploadRejected(400, "Incomplete multipart body", writer.filename)
+
+    return received, rejected
+
+
+def copy_file(
+    source: Path,
+    directory: Path,
+    filename: Optional[str] = None,
+    max_size: Optional[int] = None
+) -> ReceivedFile:
+    """
+    （阻塞，调用方应在线程池中执行）复制服务器本地文件到 directory，
+    与上传相同地校验类型、大小与内容并计算 sha256；被拒绝时抛出 UploadRejected
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    writer = UploadWriter(
+        filename or source.name, directory, max_size or settings.MAX_FILE_SIZE, settings.ALLOWED_EXTENSIONS
+    )
+    with source.open("rb") as file:
+        return writer.copy_from(file)
+
+
+def _unlink(path: Path):
+    try:
+        path.unlink()
+    except OSError:
+        pass
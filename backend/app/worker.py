@@ -0,0 +1,61 @@
+"""
+独立的入库 worker 进程
+与 API 进程分离，文档解析与向量化不与对话请求争抢 CPU
+
+用法（在 backend 目录下，API 进程设置 INGEST_WORKERS_IN_API=false）：
+    python -m app.worker
+"""
+import asyncio
+import signal
+
+import app.models  # noqa: F401  注册全部模型
+from app.database import engine, Base, get_db, upgrade_schema
+
+
+async def main():
+    print("🚀 Starting MimirQ ingestion worker...")
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+
+    from app.services.hybrid_retriever import hybrid_retriever
+    from app.services.milvus_store import milvus_store
+    from app.services.ingestion_queue import ingestion_workers
+    from app.services.parsers import parser_factory
+    from app.services.progress_relay import progress_relay
+
+    # BM25 增量写入前需与共享索引同步
+    try:
+        db = next(get_db())
+        try:
+            hybrid_retriever.load_bm25_index(db)
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"⚠️  Failed to load BM25 index: {str(e)}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    # 处理进度经 NOTIFY 转发给 API 进程的进度流
+    progress_relay.start_sender()
+    ingestion_workers.start()
+    try:
+        await stop.wait()
+    finally:
+        print("👋 Shutting down ingestion worker...")
+        await ingestion_workers.stop()
+        progress_relay.stop()
+        parser_factory.shutdown()
+        milvus_store.flush()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,93 @@
+"""
+文本切片基准测试
+对比 LangChain RecursiveCharacterTextSplitter 与 LinearTextSplitter 在长文本上的耗时，并校验切片结果一致
+
+用法（在 backend 目录下）：
+    python benchmarks/text_splitter.py --chars 2000000 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.text_splitter import DEFAULT_SEPARATORS, LinearTextSplitter  # noqa: E402
+
+
+def synthetic_text(chars: int, style: str, seed: int) -> str:
+    """
+    生成合成文本
+
+    - prose：中英文混排的段落（常规 .txt / .md）
+    - lines：无空行的长文本，每行一句（日志、表格导出等，只能按换行与标点切分）
+    - dense：几乎没有分隔符的长串（压缩 JSON、Base64 等，切分退化到逐字符）
+    """
+    rng = np.random.default_rng(seed)
+    words = ["数据", "模型", "检索", "文档", "向量", "索引", "system", "query", "chunk", "token"]
+
+    if style == "dense":
+        alphabet = np.array(list("abcdefghijklmnopqrstuvwxyz0123456789"))
+        body = alphabet[rng.integers(0, len(alphabet), size=chars)]
+        # 每 5000 个字符出现一个空格
+        body[::5000] = " "
+        return "".join(body.tolist())
+
+    parts = []
+    total = 0
+    while total < chars:
+        sentence_words = rng.choice(words, size=int(rng.integers(5, 30)))
+        sentence = " ".join(sentence_words) + rng.choice(["。", ".", "！", "？", "!"])
+        if style == "prose":
+            sentence += "\n\n" if rng.random() < 0.1 else (" " if rng.random() < 0.5 else "")
+        else:
+            sentence += "\n"
+        parts.append(sentence)
+        total += len(sentence)
+    return "".join(parts)[:chars]
+
+
+def measure(split, text: str, repeat: int):
+    latencies = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = split(text)
+        latencies.append(time.perf_counter() - started)
+    return np.array(latencies) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text splitter benchmark")
+    parser.add_argument("--chars", type=int, default=2_000_000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    recursive = RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        separators=DEFAULT_SEPARATORS,
+        length_function=len,
+    )
+    linear = LinearTextSplitter(args.chunk_size, args.chunk_overlap, DEFAULT_SEPARATORS)
+
+    print(f"{'text':<8}{'chunks':>8}{'recursive ms':>15}{'linear ms':>12}{'speedup':>10}  match")
+    for style in ("prose", "lines", "dense"):
+        text = synthetic_text(args.chars, style, args.seed)
+
+        recursive_ms, expected = measure(recursive.split_text, text, args.repeat)
+        linear_ms, offsets = measure(linear.split_offsets, text, args.repeat)
+        matched = [text[start:end] for start, end in offsets] == expected
+
+        print(f"{style:<8}{len(expected):>8}{recursive_ms.mean():>15.1f}{linear_ms.mean():>12.1f}"
+              f"{recursive_ms.mean() / linear_ms.mean():>9.2f}x  {'✅' if matched else '❌'}")
+
+
+if __name__ == "__main__":
+    main()
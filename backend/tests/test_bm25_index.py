@@ -0,0 +1,241 @@
+"""
+BM25Index / BM25Store 测试
+检索结果与暴力计算的 BM25 分数对照（语料与 benchmarks/bm25_pruning.py 相同：Zipf 分布的合成词）
+"""
+from collections import Counter
+import math
+import uuid
+
+import numpy as np
+import pytest
+
+from app.services.bm25_index import BM25Index, hash_tokens
+from app.services.bm25_store import BM25Store
+
+
+VOCAB = [f"w{i}" for i in range(300)]
+VOCAB_HASHES = hash_tokens(VOCAB)
+
+
+def make_documents(count=12, chunks=15, seed=7, prefix="doc"):
+    """生成 (document_id, records)，records 附带 terms（词表下标）供暴力计算"""
+    rng = np.random.default_rng(seed)
+    background = 1.0 / np.arange(1, len(VOCAB) + 1)
+    background /= background.sum()
+
+    documents = []
+    for document_index in range(count):
+        topic = rng.choice(len(VOCAB), size=20, replace=False)
+        records = []
+        for chunk_index in range(chunks):
+            length = int(rng.integers(20, 60))
+            terms = np.where(
+                rng.random(length) < 0.3,
+                rng.choice(topic, size=length),
+                rng.choice(len(VOCAB), size=length, p=background)
+            )
+            records.append({
+                "chunk_id": str(uuid.uuid4()),
+                "chunk_index": chunk_index,
+                "page": chunk_index // 5,
+                "source": f"{prefix}-{document_index}.pdf",
+                "term_hashes": VOCAB_HASHES[terms].astype("<u8").tobytes(),
+                "terms": terms.tolist(),
+            })
+        documents.append((f"{prefix}-{document_index}", records))
+    return documents
+
+
+def brute_force(documents, query, k1=1.5, b=0.75, document_ids=None):
+    """chunk_id -> BM25 分数（Lucene IDF，df 按行统计）"""
+    rows = [record for _, records in documents for record in records]
+    query_terms = Counter(VOCAB.index(word) for word in query.split())
+    df = Counter(term for row in rows for term in set(row["terms"]))
+    avgdl = sum(len(row["terms"]) for row in rows) / len(rows)
+    scope = set(document_ids) if document_ids else None
+
+    scores = {}
+    for document_id, records in documents:
+        if scope is not None and document_id not in scope:
+            continue
+        for row in records:
+            tfs = Counter(row["terms"])
+            score = 0.0
+            for term, query_tf in query_terms.items():
+                tf = tfs.get(term, 0)
+                if not tf:
+                    continue
+                idf = math.log(1.0 + (len(rows) - df[term] + 0.5) / (df[term] + 0.5))
+                norm = k1 * (1 - b + b * len(row["terms"]) / avgdl)
+                score += idf * query_tf * tf * (k1 + 1) / (tf + norm)
+            if score > 0:
+                scores[row["chunk_id"]] = score
+    return scores
+
+
+def assert_matches(index, documents, query, top_k=10, document_ids=None):
+    expected = brute_force(documents, query, document_ids=document_ids)
+    results = index.search(query, top_k=top_k, document_ids=document_ids)
+
+    assert len(results) == min(top_k, len(expected))
+    top = sorted(expected.values(), reverse=True)[:top_k]
+    assert [r["score"] for r in results] == pytest.approx(top, rel=1e-4)
+    for result in results:
+        assert result["score"] == pytest.approx(expected[result["chunk_id"]], rel=1e-4)
+
+
+QUERIES = ["w0 w5 w17", "w3 w120 w250 w8", "w42", "w1 w1 w299 w60 w7 w11"]
+
+
+@pytest.mark.parametrize("prune_min_postings", [0, 1])
+def test_build_matches_brute_force(prune_min_postings):
+    documents = make_documents()
+    index = BM25Index(prune_min_postings=prune_min_postings)
+    index.build(documents)
+
+    assert len(index) == 12 * 15
+    assert index.document_count == 12
+    for query in QUERIES:
+        assert_matches(index, documents, query)
+
+
+def test_delta_segment_then_seal():
+    documents = make_documents()
+    index = BM25Index(auto_seal=False, prune_min_postings=0)
+    index.build(documents[:6])
+    for document_id, records in documents[6:]:
+        index.add_document(document_id, records)
+
+    assert len(index) == 12 * 15
+    assert index.needs_seal() is False
+    # 增量段中的文档立即可检索
+    new_chunks = {r["chunk_id"] for _, records in documents[6:] for r in records}
+    assert any(r["chunk_id"] in new_chunks for r in index.search("w0 w5 w17", top_k=50))
+
+    index.seal()
+    for query in QUERIES:
+        assert_matches(index, documents, query)
+
+
+def test_add_document_replaces_existing_rows():
+    documents = make_documents()
+    index = BM25Index(prune_min_postings=0)
+    index.build(documents)
+
+    replacement = make_documents(count=1, seed=99)[0][1]
+    index.add_document("doc-3", replacement)
+    index.seal()
+
+    documents[3] = ("doc-3", replacement)
+    assert len(index) == 12 * 15
+    for query in QUERIES:
+        assert_matches(index, documents, query)
+
+
+def test_remove_document_tombstones_rows():
+    documents = make_documents()
+    index = BM25Index(auto_seal=False, prune_min_postings=0)
+    index.build(documents)
+
+    removed = {r["chunk_id"] for r in documents[2][1]}
+    assert index.remove_document("doc-2") == 15
+    assert index.remove_document("doc-2") == 0
+    assert len(index) == 11 * 15
+    for query in QUERIES:
+        assert not removed & {r["chunk_id"] for r in index.search(query, top_k=200)}
+
+    index.seal()
+    del documents[2]
+    for query in QUERIES:
+        assert_matches(index, documents, query)
+
+
+def test_add_document_with_no_records_removes_rows():
+    documents = make_documents()
+    index = BM25Index(prune_min_postings=0)
+    index.build(documents)
+
+    index.add_document("doc-0", [])
+
+    assert len(index) == 11 * 15
+    removed = {r["chunk_id"] for r in documents[0][1]}
+    assert not removed & {r["chunk_id"] for r in index.search("w0 w5 w17", top_k=200)}
+
+
+@pytest.mark.parametrize("prune_min_postings", [0, 1])
+def test_scoped_search(prune_min_postings):
+    documents = make_documents()
+    index = BM25Index(prune_min_postings=prune_min_postings)
+    index.build(documents)
+
+    scope = ["doc-1", "doc-7"]
+    for query in QUERIES:
+        results = index.search(query, top_k=10, document_ids=scope)
+        assert {r["document_id"] for r in results} <= set(scope)
+        assert_matches(index, documents, query, document_ids=scope)
+
+    assert index.search("w0", document_ids=["missing"]) == []
+
+
+def test_snapshot_round_trip(tmp_path):
+    documents = make_documents()
+    index = BM25Index(auto_seal=False, prune_min_postings=0)
+    index.build(documents[:8])
+    for document_id, records in documents[8:]:
+        index.add_document(document_id, records)
+    index.save(tmp_path, watermark={"chunk_count": 180}, generation=3)
+
+    loaded = BM25Index(auto_seal=False, prune_min_postings=0)
+    assert loaded.load(tmp_path, watermark={"chunk_count": 180})
+    assert loaded.manifest["generation"] == 3
+    assert len(loaded) == len(index)
+    for query in QUERIES:
+        assert loaded.search(query) == index.search(query)
+        assert_matches(loaded, documents, query)
+
+    # 过期水位视为不可用
+    assert not BM25Index().load(tmp_path, watermark={"chunk_count": 1})
+
+    # mmap 封存段之上继续增删
+    loaded.remove_document("doc-0")
+    extra = make_documents(count=1, seed=5, prefix="extra")
+    loaded.add_document("extra-0", extra[0][1])
+    loaded.seal()
+    for query in QUERIES:
+        assert_matches(loaded, documents[1:] + extra, query)
+
+
+def test_store_replays_ops(tmp_path):
+    documents = make_documents()
+    store = BM25Store(tmp_path)
+
+    writer = BM25Index(auto_seal=False, prune_min_postings=0)
+    writer.build(documents[:10])
+    with store.lock():
+        snapshot_generation = store.publish_snapshot(writer, {"chunk_count": 150})
+
+        ops = [{"type": "add", "document_id": document_id, "records": records}
+               for document_id, records in documents[10:]]
+        ops.append({"type": "remove", "document_id": "doc-4"})
+        for op in ops:
+            BM25Store.apply_op(writer, op)
+        head = store.publish_ops(ops, {"chunk_count": 165})
+
+    assert head == snapshot_generation + 3
+    assert store.read_head()["generation"] == head
+
+    reader = BM25Index(auto_seal=False, prune_min_postings=0)
+    assert reader.load(tmp_path)
+    assert reader.manifest["generation"] == snapshot_generation
+    for op in store.read_ops(snapshot_generation, head):
+        BM25Store.apply_op(reader, op)
+
+    assert len(reader) == len(writer) == 11 * 15
+    for query in QUERIES:
+        assert reader.search(query, top_k=20) == writer.search(query, top_k=20)
+
+    # 新快照发布后，已并入快照的操作日志被清理
+    with store.lock():
+        store.publish_snapshot(writer, {"chunk_count": 165})
+    with pytest.raises(FileNotFoundError):
+        store.read_ops(snapshot_generation, head)
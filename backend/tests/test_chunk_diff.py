@@ -0,0 +1,104 @@
+"""
+chunk_diff 测试
+"""
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+from app.services.chunk_diff import diff_chunks
+
+
+def make_existing(*items):
+    return [
+        SimpleNamespace(id=index, content=content, page_number=page, chunk_index=index)
+        for index, (content, page) in enumerate(items)
+    ]
+
+
+def make_chunks(*items):
+    return [
+        Document(page_content=content, metadata={"page": page, "chunk_index": index})
+        for index, (content, page) in enumerate(items)
+    ]
+
+
+def test_empty_revision_removes_everything():
+    existing = make_existing(("a", 1), ("b", 1))
+
+    kept, added, removed = diff_chunks(existing, [])
+
+    assert kept == []
+    assert added == []
+    assert [chunk.id for chunk in removed] == [0, 1]
+
+
+def test_unchanged_revision_keeps_everything():
+    existing = make_existing(("a", 1), ("b", 1), ("c", 2))
+
+    kept, added, removed = diff_chunks(existing, make_chunks(("a", 1), ("b", 1), ("c", 2)))
+
+    assert [(old.id, new.metadata["chunk_index"]) for old, new in kept] == [(0, 0), (1, 1), (2, 2)]
+    assert added == []
+    assert removed == []
+
+
+def test_inserted_chunk_renumbers_kept_chunks():
+    existing = make_existing(("a", 1), ("b", 1), ("c", 2))
+
+    kept, added, removed = diff_chunks(existing, make_chunks(("new", 1), ("a", 1), ("b", 1), ("c", 2)))
+
+    # 保留的切片按新位置重新编号
+    assert [(old.id, old.chunk_index, new.metadata["chunk_index"]) for old, new in kept] == [
+        (0, 0, 1), (1, 1, 2), (2, 2, 3)
+    ]
+    assert [chunk.page_content for chunk in added] == ["new"]
+    assert removed == []
+
+
+def test_added_and_removed_split():
+    existing = make_existing(("a", 1), ("b", 1), ("c", 2), ("d", 3))
+
+    kept, added, removed = diff_chunks(existing, make_chunks(("a", 1), ("b2", 1), ("d", 3), ("e", 3)))
+
+    assert [old.content for old, _ in kept] == ["a", "d"]
+    assert [chunk.page_content for chunk in added] == ["b2", "e"]
+    assert sorted(chunk.content for chunk in removed) == ["b", "c"]
+
+
+def test_page_change_counts_as_a_new_chunk():
+    existing = make_existing(("a", 1))
+
+    kept, added, removed = diff_chunks(existing, make_chunks(("a", 2)))
+
+    assert kept == []
+    assert [chunk.metadata["page"] for chunk in added] == [2]
+    assert [chunk.content for chunk in removed] == ["a"]
+
+
+def test_duplicate_chunks_pair_in_order():
+    existing = make_existing(("same", 1), ("other", 1), ("same", 1), ("same", 1))
+
+    kept, added, removed = diff_chunks(existing, make_chunks(("same", 1), ("same", 1)))
+
+    # 同一 (哈希, 页码) 的切片按出现顺序配对，多余的旧切片删除
+    assert [(old.id, new.metadata["chunk_index"]) for old, new in kept] == [(0, 0), (2, 1)]
+    assert added == []
+    assert sorted(chunk.id for chunk in removed) == [1, 3]
+
+
+def test_more_duplicates_than_before_adds_the_extra():
+    existing = make_existing(("same", 1))
+
+    kept, added, removed = diff_chunks(existing, make_chunks(("same", 1), ("same", 1), ("same", 1)))
+
+    assert [old.id for old, _ in kept] == [0]
+    assert [chunk.metadata["chunk_index"] for chunk in added] == [1, 2]
+    assert removed == []
+
+
+def test_first_revision_of_empty_document_adds_everything():
+    kept, added, removed = diff_chunks([], make_chunks(("a", None), ("b", None)))
+
+    assert kept == []
+    assert [chunk.page_content for chunk in added] == ["a", "b"]
+    assert removed == []
@@ -0,0 +1,81 @@
+"""
+dedup 测试
+"""
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import uuid
+
+import pytest
+
+from app.services.dedup import ALIAS_FIELDS, alias_values, duplicate_action, owns_content
+
+
+def make_document(**values):
+    defaults = dict(
+        id=uuid.uuid4(),
+        alias_of=None,
+        file_path="/uploads/original.pdf",
+        status="completed",
+        processing_progress=100,
+        current_stage="completed",
+        chunk_count=12,
+        total_characters=3400,
+        content_hash="a" * 64,
+        text_hash="b" * 64,
+        processed_at=datetime(2026, 1, 1, tzinfo=timezone.utc),
+    )
+    defaults.update(values)
+    return SimpleNamespace(**defaults)
+
+
+@pytest.mark.parametrize("on_duplicate,expected", [
+    ("return", "return"),
+    ("alias", "alias"),
+    ("reingest", "ingest"),
+])
+def test_duplicate_action_with_existing_document(on_duplicate, expected):
+    assert duplicate_action(on_duplicate, make_document()) == expected
+
+
+@pytest.mark.parametrize("on_duplicate", ["return", "alias", "reingest"])
+def test_duplicate_action_without_existing_document(on_duplicate):
+    assert duplicate_action(on_duplicate, None) == "ingest"
+
+
+def test_duplicate_action_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        duplicate_action("merge", make_document())
+
+
+def test_alias_values_follow_the_original():
+    original = make_document()
+
+    values = alias_values(original)
+
+    assert values["alias_of"] == original.id
+    for field in ALIAS_FIELDS:
+        assert values[field] == getattr(original, field)
+    # 归一化文本哈希随原文档，上传哈希、文件名等由别名自己的上传决定
+    assert values["text_hash"] == original.text_hash
+    assert "content_hash" not in values
+    assert "id" not in values
+
+
+def test_alias_of_processing_original_starts_in_the_same_state():
+    original = make_document(status="processing", processing_progress=40, current_stage="embedding",
+                             chunk_count=0, text_hash=None, processed_at=None)
+
+    values = alias_values(original)
+
+    assert (values["status"], values["processing_progress"], values["current_stage"]) == (
+        "processing", 40, "embedding"
+    )
+    assert values["text_hash"] is None
+
+
+def test_only_originals_own_content():
+    original = make_document()
+    alias = make_document(alias_of=original.id)
+
+    assert owns_content(original)
+    assert not owns_content(alias)
@@ -0,0 +1,64 @@
+"""
+embedding_cache 测试
+"""
+import numpy as np
+
+from app.services.embedding_cache import VectorFile
+
+
+def make_keys(start, count):
+    return [i.to_bytes(16, "big") for i in range(start, start + count)]
+
+
+def make_vectors(start, count, dim=4):
+    return np.arange(start, start + count, dtype=np.float32)[:, None].repeat(dim, axis=1)
+
+
+def test_unbounded_keeps_everything(tmp_path):
+    store = VectorFile(tmp_path)
+    store.put_many(make_keys(0, 50), make_vectors(0, 50))
+
+    assert len(store) == 50
+    assert store.rotations == 0
+    assert store.get_many(make_keys(49, 1))[0][0] == 49
+
+
+def test_rotation_evicts_oldest_generation(tmp_path):
+    store = VectorFile(tmp_path, max_rows=20)
+    for start in range(0, 50, 5):
+        store.put_many(make_keys(start, 5), make_vectors(start, 5))
+
+    # 每代最多 10 行，只保留最近两代
+    assert store.rotations == 4
+    assert len(store) <= 20
+    assert store.get_many(make_keys(0, 1)) == [None]
+    latest = store.get_many(make_keys(45, 5))
+    assert [vector[0] for vector in latest] == [45, 46, 47, 48, 49]
+    assert len(list(tmp_path.glob("vectors*.f32"))) == 2
+
+
+def test_previous_generation_hit_survives_rotation(tmp_path):
+    store = VectorFile(tmp_path, max_rows=20)
+    store.put_many(make_keys(0, 10), make_vectors(0, 10))
+    store.put_many(make_keys(10, 10), make_vectors(10, 10))
+
+    # 命中上一代的键被复制到当前代
+    assert store.get_many(make_keys(3, 1))[0][0] == 3
+    store.put_many(make_keys(20, 10), make_vectors(20, 10))
+
+    assert store.get_many(make_keys(3, 1))[0][0] == 3
+    assert store.get_many(make_keys(4, 1)) == [None]
+
+
+def test_other_process_sees_rotation(tmp_path):
+    writer = VectorFile(tmp_path, max_rows=20)
+    reader = VectorFile(tmp_path, max_rows=20)
+    writer.put_many(make_keys(0, 10), make_vectors(0, 10))
+    assert reader.get_many(make_keys(0, 1))[0][0] == 0
+
+    writer.put_many(make_keys(10, 10), make_vectors(10, 10))
+    writer.put_many(make_keys(20, 10), make_vectors(20, 10))
+
+    assert reader.get_many(make_keys(1, 1)) == [None]
+    assert reader.get_many(make_keys(25, 1))[0][0] == 25
+    assert len(reader) == 20
@@ -0,0 +1,90 @@
+"""
+progress_bus 测试
+"""
+from types import SimpleNamespace
+import asyncio
+import threading
+import uuid
+
+from app.services.progress_bus import ProgressBus, is_terminal
+
+
+def make_pipeline(*document_ids, **counters):
+    documents = {
+        document_id: SimpleNamespace(completed=False, error=None, chunks=3)
+        for document_id in document_ids
+    }
+    values = dict(
+        stage="embedding", progress=42, pages_parsed=5, total_pages=10,
+        chunks_split=8, chunks_embedded=6, chunks_stored=3,
+    )
+    values.update(counters)
+    return SimpleNamespace(documents=documents, **values)
+
+
+def test_publish_pipeline_single_document():
+    bus = ProgressBus()
+    document_id = uuid.uuid4()
+
+    bus.publish_pipeline(make_pipeline(document_id))
+
+    snapshot = bus.snapshot(document_id)
+    assert snapshot["status"] == "processing"
+    assert snapshot["current_stage"] == "embedding"
+    assert snapshot["processing_progress"] == 42
+    assert snapshot["pages_parsed"] == 5
+    assert snapshot["total_pages"] == 10
+    assert snapshot["chunks_split"] == 8
+    assert snapshot["chunks_embedded"] == 6
+    assert snapshot["chunks_stored"] == 3
+
+
+def test_publish_pipeline_batch_skips_finished_documents():
+    bus = ProgressBus()
+    running, finished = uuid.uuid4(), uuid.uuid4()
+    pipeline = make_pipeline(running, finished)
+    pipeline.documents[finished].completed = True
+
+    bus.publish_pipeline(pipeline)
+
+    snapshot = bus.snapshot(running)
+    assert snapshot["chunks_stored"] == 3
+    assert "pages_parsed" not in snapshot
+    assert bus.snapshot(finished) is None
+
+
+def test_status_change_clears_final_and_error():
+    bus = ProgressBus()
+    document_id = uuid.uuid4()
+
+    bus.publish(document_id, status="failed", error_message="boom", final=True)
+    assert is_terminal(bus.snapshot(document_id))
+
+    bus.publish(document_id, status="processing")
+    snapshot = bus.snapshot(document_id)
+    assert not is_terminal(snapshot)
+    assert "error_message" not in snapshot
+
+
+def test_subscribe_receives_updates_from_threads():
+    bus = ProgressBus()
+    document_id = uuid.uuid4()
+    bus.publish(document_id, status="completed")
+    since_version = bus.version(document_id)
+
+    def worker():
+        for chunks in range(3):
+            bus.publish(document_id, status="processing", chunks_embedded=chunks)
+        bus.publish(document_id, status="completed")
+
+    async def collect():
+        threading.Timer(0.05, worker).start()
+        snapshots = []
+        async for snapshot in bus.subscribe(document_id, 1.0, since_version):
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        return snapshots
+
+    snapshots = asyncio.run(collect())
+    assert snapshots[-1]["status"] == "completed"
+    assert bus.stats()["subscribers"] == 0
@@ -0,0 +1,116 @@
+"""
+LinearTextSplitter 测试
+与 LangChain RecursiveCharacterTextSplitter 在相同输入与参数下的切片结果逐一对照
+"""
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.services.text_splitter import DEFAULT_SEPARATORS, LinearTextSplitter
+
+
+def synthetic_text(chars, style, seed=0):
+    """与 benchmarks/text_splitter.py 相同的三类合成文本（prose / lines / dense）"""
+    rng = np.random.default_rng(seed)
+    words = ["数据", "模型", "检索", "文档", "向量", "索引", "system", "query", "chunk", "token"]
+
+    if style == "dense":
+        alphabet = np.array(list("abcdefghijklmnopqrstuvwxyz0123456789"))
+        body = alphabet[rng.integers(0, len(alphabet), size=chars)]
+        body[::500] = " "
+        return "".join(body.tolist())
+
+    parts = []
+    total = 0
+    while total < chars:
+        sentence = " ".join(rng.choice(words, size=int(rng.integers(5, 30))))
+        sentence += rng.choice(["。", ".", "！", "？", "!"])
+        if style == "prose":
+            sentence += "\n\n" if rng.random() < 0.1 else (" " if rng.random() < 0.5 else "")
+        else:
+            sentence += "\n"
+        parts.append(sentence)
+        total += len(sentence)
+    return "".join(parts)[:chars]
+
+
+EDGE_TEXTS = [
+    "",
+    "   \n\n  \t ",
+    "short",
+    "\n\nleading and trailing separators\n\n",
+    "a\n\n\n\nb\n\n\n\n\n\nc" * 20,
+    "no separators at all " + "x" * 700,
+    "句子一。句子二！句子三？" * 40,
+    "mixed. 中文。 English! 问号？ end?" * 30,
+    "line\n" * 200,
+    "  spaces   between    words  " * 50,
+    "a" * 1000,
+    "emoji 😀 and combining é characters. " * 40,
+]
+
+PARAMETERS = [
+    (100, 0),
+    (100, 20),
+    (50, 49),
+    (200, 100),
+    (1, 0),
+    (7, 3),
+]
+
+
+def recursive_split(text, chunk_size, chunk_overlap, separators):
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=separators,
+        length_function=len,
+    ).split_text(text)
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", PARAMETERS)
+@pytest.mark.parametrize("text", EDGE_TEXTS)
+def test_matches_recursive_splitter_on_edge_cases(text, chunk_size, chunk_overlap):
+    linear = LinearTextSplitter(chunk_size, chunk_overlap, DEFAULT_SEPARATORS)
+
+    assert linear.split_text(text) == recursive_split(text, chunk_size, chunk_overlap, DEFAULT_SEPARATORS)
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(1000, 200), (300, 0), (64, 16)])
+@pytest.mark.parametrize("style", ["prose", "lines", "dense"])
+def test_matches_recursive_splitter_on_synthetic_text(style, chunk_size, chunk_overlap):
+    text = synthetic_text(20000, style)
+    linear = LinearTextSplitter(chunk_size, chunk_overlap, DEFAULT_SEPARATORS)
+
+    assert linear.split_text(text) == recursive_split(text, chunk_size, chunk_overlap, DEFAULT_SEPARATORS)
+
+
+@pytest.mark.parametrize("separators", [
+    ["\n\n", "\n", " ", ""],
+    ["\n", "."],
+    ["..", "?", ""],
+    ["|", "", "\n"],
+])
+def test_matches_recursive_splitter_with_custom_separators(separators):
+    text = "first|second.. third?fourth\nfifth..sixth|" * 30 + "z" * 150
+    for chunk_size, chunk_overlap in [(40, 10), (100, 0), (15, 14)]:
+        linear = LinearTextSplitter(chunk_size, chunk_overlap, separators)
+        assert linear.split_text(text) == recursive_split(text, chunk_size, chunk_overlap, separators)
+
+
+def test_offsets_point_into_the_source_text():
+    text = synthetic_text(5000, "prose", seed=3)
+    splitter = LinearTextSplitter(200, 50)
+
+    chunks = splitter.split_documents([Document(page_content=text, metadata={"page": 2})])
+
+    assert [chunk.page_content for chunk in chunks] == splitter.split_text(text)
+    for chunk in chunks:
+        assert chunk.metadata["page"] == 2
+        assert text[chunk.metadata["start_char"]:chunk.metadata["end_char"]] == chunk.page_content
+
+
+def test_rejects_overlap_larger_than_chunk_size():
+    with pytest.raises(ValueError):
+        LinearTextSplitter(10, 11)
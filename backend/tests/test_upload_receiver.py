@@ -0,0 +1,216 @@
+"""
+upload_receiver 测试
+"""
+import asyncio
+import hashlib
+
+import pytest
+from starlette.requests import ClientDisconnect, Request
+
+from app.services.upload_receiver import UploadRejected, copy_file, receive_uploads
+
+
+BOUNDARY = "test-boundary"
+EXTENSIONS = [".pdf", ".txt", ".md"]
+PDF = b"%PDF-1.7\n" + b"0" * 3000 + b"\n%%EOF"
+
+
+def multipart_body(*files, field="file", complete=True):
+    parts = []
+    for filename, content in files:
+        parts.append(
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n".encode("utf-8")
+            + content + b"\r\n"
+        )
+    body = b"".join(parts)
+    if complete:
+        body += f"--{BOUNDARY}--\r\n".encode("utf-8")
+    return body
+
+
+def make_request(body, chunk_size=256, disconnect_after=None, content_length=None):
+    """按 chunk_size 分片推送请求体；disconnect_after 个分片后模拟客户端断开"""
+    messages = [
+        {"type": "http.request", "body": body[i:i + chunk_size], "more_body": i + chunk_size < len(body)}
+        for i in range(0, len(body), chunk_size)
+    ] or [{"type": "http.request", "body": b"", "more_body": False}]
+    if disconnect_after is not None:
+        messages = messages[:disconnect_after] + [{"type": "http.disconnect"}]
+
+    async def receive():
+        return messages.pop(0)
+
+    headers = [
+        (b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode("utf-8")),
+        (b"content-length", str(len(body) if content_length is None else content_length).encode("utf-8")),
+    ]
+    return Request({"type": "http", "method": "POST", "headers": headers}, receive)
+
+
+def receive(request, directory, **options):
+    options.setdefault("max_size", 10_000)
+    options.setdefault("extensions", EXTENSIONS)
+    return asyncio.run(receive_uploads(request, directory, "file", **options))
+
+
+def test_receives_file_with_sha256(tmp_path):
+    content = "多字节文本，跨分片边界也能正确校验。\n".encode("utf-8") * 20
+    # 分片大小 7 会切断多字节字符
+    received, rejected = receive(make_request(multipart_body(("notes.txt", content)), chunk_size=7), tmp_path)
+
+    assert rejected == []
+    [upload] = received
+    assert upload.filename == "notes.txt"
+    assert upload.file_type == "txt"
+    assert upload.size == len(content)
+    assert upload.content_hash == hashlib.sha256(content).hexdigest()
+    assert upload.path.parent == tmp_path
+    assert upload.path.read_bytes() == content
+
+
+def test_receives_pdf(tmp_path):
+    received, _ = receive(make_request(multipart_body(("paper.pdf", PDF))), tmp_path)
+
+    assert received[0].content_hash == hashlib.sha256(PDF).hexdigest()
+    assert received[0].path.read_bytes() == PDF
+
+
+def test_size_limit_aborts_and_removes_partial_file(tmp_path):
+    body = multipart_body(("big.txt", b"a" * 5000))
+
+    with pytest.raises(UploadRejected) as error:
+        # Content-Length 未声明实际大小时，在接收过程中中止
+        receive(make_request(body, content_length=100), tmp_path, max_size=1000, max_files=1)
+
+    assert error.value.status_code == 413
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_declared_content_length_over_limit_is_rejected_before_reading(tmp_path):
+    # 超过 max_size 加 multipart 余量
+    body = multipart_body(("big.txt", b"a" * 70_000))
+
+    async def never():
+        raise AssertionError("body should not be read")
+
+    request = make_request(body)
+    request._receive = never
+    with pytest.raises(UploadRejected) as error:
+        asyncio.run(receive_uploads(
+            request, tmp_path, "file", max_files=1, max_size=1000, extensions=EXTENSIONS
+        ))
+
+    assert error.value.status_code == 413
+
+
+@pytest.mark.parametrize("filename,content", [
+    ("fake.pdf", b"not a pdf at all" * 100),
+    ("short.pdf", b"tiny"),
+    ("binary.txt", b"\xff\xfe\x00binary" * 10),
+    ("truncated.md", "结尾被截断".encode("utf-8")[:-1]),
+])
+def test_content_sniffing_rejects_mismatch(tmp_path, filename, content):
+    with pytest.raises(UploadRejected) as error:
+        receive(make_request(multipart_body((filename, content))), tmp_path)
+
+    assert error.value.status_code == 400
+    assert "does not match extension" in error.value.detail
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_pdf_header_may_follow_leading_bytes(tmp_path):
+    content = b"\x00" * 100 + PDF
+
+    received, _ = receive(make_request(multipart_body(("offset.pdf", content))), tmp_path)
+
+    assert received[0].size == len(content)
+
+
+def test_unsupported_extension(tmp_path):
+    with pytest.raises(UploadRejected) as error:
+        receive(make_request(multipart_body(("script.exe", b"MZ"))), tmp_path)
+
+    assert error.value.status_code == 400
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_batch_skips_rejected_files(tmp_path):
+    body = multipart_body(
+        ("ok.txt", b"hello"),
+        ("fake.pdf", b"nope" * 500),
+        ("big.md", b"a" * 20_000),
+        ("also-ok.md", b"# title"),
+    )
+
+    received, rejected = receive(make_request(body), tmp_path, abort_on_reject=False)
+
+    assert [upload.filename for upload in received] == ["ok.txt", "also-ok.md"]
+    assert [(e.filename, e.status_code) for e in rejected] == [("fake.pdf", 400), ("big.md", 413)]
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(upload.path.name for upload in received)
+
+
+def test_too_many_files(tmp_path):
+    body = multipart_body(("a.txt", b"a"), ("b.txt", b"b"))
+
+    with pytest.raises(UploadRejected) as error:
+        receive(make_request(body), tmp_path, max_files=1)
+
+    assert error.value.status_code == 400
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_client_disconnect_removes_received_files(tmp_path):
+    body = multipart_body(("first.txt", b"x" * 600), ("second.txt", b"y" * 600))
+
+    with pytest.raises(ClientDisconnect):
+        receive(make_request(body, chunk_size=100, disconnect_after=10), tmp_path)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_incomplete_body_is_rejected(tmp_path):
+    body = multipart_body(("cut.txt", b"x" * 600), complete=False)[:-50]
+
+    with pytest.raises(UploadRejected) as error:
+        receive(make_request(body), tmp_path)
+
+    assert error.value.detail == "Incomplete multipart body"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_rejects_non_multipart_request(tmp_path):
+    async def empty():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    request = Request({"type": "http", "method": "POST", "headers": [(b"content-type", b"application/json")]}, empty)
+    with pytest.raises(UploadRejected):
+        asyncio.run(receive_uploads(request, tmp_path, "file"))
+
+
+def test_copy_file(tmp_path):
+    source = tmp_path / "source" / "policy.pdf"
+    source.parent.mkdir()
+    source.write_bytes(PDF)
+
+    copied = copy_file(source, tmp_path / "uploads")
+
+    assert copied.filename == "policy.pdf"
+    assert copied.content_hash == hashlib.sha256(PDF).hexdigest()
+    assert copied.path.read_bytes() == PDF
+
+
+@pytest.mark.parametrize("filename,content,max_size,status_code", [
+    ("fake.pdf", b"plain text" * 200, None, 400),
+    ("big.txt", b"a" * 5000, 1000, 413),
+])
+def test_copy_file_rejects_and_cleans_up(tmp_path, filename, content, max_size, status_code):
+    source = tmp_path / filename
+    source.write_bytes(content)
+
+    with pytest.raises(UploadRejected) as error:
+        copy_file(source, tmp_path / "uploads", max_size=max_size)
+
+    assert error.value.status_code == status_code
+    assert list((tmp_path / "uploads").iterdir()) == []
@@ -42,8 +42,8 @@ export function useDocuments() {
         const newDoc = await documentApi.upload(file)
         setDocuments((prev) => [newDoc, ...prev])
 
-        // 轮询检查处理状态
-        pollDocumentStatus(newDoc.id)
+        // 订阅处理进度
+        watchDocumentProgress(newDoc.id)
 
         return newDoc
       } catch (err: any) {
@@ -72,13 +72,30 @@ export function useDocuments() {
   }, [])
 
   /**
-   * 轮询文档处理状态
+   * 订阅文档处理进度（SSE 推送，处理完成或最终失败后服务端关闭连接）
    */
-  const pollDocumentStatus = useCallback(
+  const watchDocumentProgress = useCallback(
     (documentId: string) => {
-      const interval = setInterval(async () => {
+      // 重新加载完整的文档信息
+      const reload = async () => {
         try {
-          const status = await documentApi.getStatus(documentId)
+          const fullDoc = await documentApi.get(documentId)
+          setDocuments((prev) =>
+            prev.map((doc) => (doc.id === documentId ? fullDoc : doc))
+          )
+        } catch (err) {
+          console.error('Reload document error:', err)
+        }
+      }
+
+      const close = documentApi.watchProgress(
+        documentId,
+        (event) => {
+          if (event.status === 'deleted') {
+            close()
+            setDocuments((prev) => prev.filter((doc) => doc.id !== documentId))
+            return
+          }
 
           // 更新文档状态
           setDocuments((prev) =>
@@ -86,33 +103,22 @@ export function useDocuments() {
               doc.id === documentId
                 ? {
                     ...doc,
-                    status: status.status,
-                    processing_progress: status.processing_progress,
-                    current_stage: status.current_stage,
-                    error_message: status.error_message,
+                    status: event.status as Document['status'],
+                    processing_progress: event.processing_progress ?? doc.processing_progress,
+                    current_stage: event.current_stage,
+                    error_message: event.error_message,
                   }
                 : doc
             )
           )
 
-          // 如果处理完成或失败，停止轮询
-          if (status.status === 'completed' || status.status === 'failed') {
-            clearInterval(interval)
-
-            // 重新加载完整的文档信息
-            const fullDoc = await documentApi.get(documentId)
-            setDocuments((prev) =>
-              prev.map((doc) => (doc.id === documentId ? fullDoc : doc))
-            )
+          if (event.status === 'completed' || (event.status === 'failed' && event.final)) {
+            close()
+            reload()
           }
-        } catch (err) {
-          console.error('Poll status error:', err)
-          clearInterval(interval)
-        }
-      }, 2000) // 每 2 秒轮询一次
-
-      // 30 秒后停止轮询
-      setTimeout(() => clearInterval(interval), 30000)
+        },
+        reload
+      )
     },
     []
   )
@@ -8,6 +8,7 @@ import type {
   Message,
   ChatRequest,
   DocumentPreview,
+  DocumentProgressEvent,
   ManualChunk,
 } from '@/types'
 
@@ -78,6 +79,24 @@ export const documentApi = {
     return data
   },
 
+  /**
+   * 订阅文档处理进度（SSE），返回取消订阅函数
+   */
+  watchProgress(
+    documentId: string,
+    onEvent: (event: DocumentProgressEvent) => void,
+    onError?: () => void
+  ): () => void {
+    const source = new EventSource(`${API_BASE_URL}/api/v1/documents/${documentId}/events`)
+    source.onmessage = (message) => onEvent(JSON.parse(message.data))
+    source.onerror = () => {
+      // 服务端在处理结束后关闭连接，不再自动重连
+      source.close()
+      onError?.()
+    }
+    return () => source.close()
+  },
+
   /**
    * 删除文档
    */
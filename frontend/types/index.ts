@@ -27,6 +27,21 @@ export interface DocumentStatus {
   error_message?: string
 }
 
+export interface DocumentProgressEvent {
+  document_id: string
+  status: Document['status'] | 'deleted'
+  processing_progress?: number
+  current_stage?: string
+  error_message?: string
+  chunk_count?: number
+  pages_parsed?: number
+  total_pages?: number | null
+  chunks_split?: number
+  chunks_embedded?: number
+  chunks_stored?: number
+  final?: boolean
+}
+
 export interface DocumentChunk {
   id: string
   content: string